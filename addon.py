@@ -0,0 +1,451 @@
+import time
+import threading
+import importlib
+import traceback
+from typing import Dict, List, Optional
+
+import bpy
+import bpy.types
+from bpy_extras.io_utils import ExportHelper
+from bpy.props import StringProperty, BoolProperty, EnumProperty, FloatProperty, IntProperty
+from bpy.types import Operator
+
+from . import byteutils as byt
+from . import smalltype as smt
+from . import anim_compress as acp
+from . import timing as tmg
+from . import attribution as atr
+from . import memory_profile as mpf
+from . import progress as prg
+from . import data_struct as dst
+from . import encode_pipeline as epl
+from . import data_exporter as dex
+from . import texture_process as tpr
+from . import texture_export as tex
+from . import export_options as eop
+from . import export_func as exp
+
+
+_PRESET_CHOICES = (eop.NO_PRESET, "iterate", "ship")
+
+
+# Settings of export_options are read from and written to the operator properties named after them
+def _get_property_name(key: str) -> str:
+    return ("option_enum_" if key in eop.ENUM_CHOICES else "option_") + key
+
+
+def _get_setting(operator, key: str):
+    value = getattr(operator, _get_property_name(key))
+    if key in eop.ENUM_CHOICES:
+        return eop.ENUM_CHOICES[key][int(value.split("_")[-1]) - 1]
+    return value
+
+
+def _set_setting(operator, key: str, value):
+    if key in eop.ENUM_CHOICES:
+        value = "OPT_{}".format(eop.ENUM_CHOICES[key].index(value) + 1)
+    setattr(operator, _get_property_name(key), value)
+
+
+def _get_preset_name(operator) -> str:
+    return _PRESET_CHOICES[int(operator.option_enum_preset.split("_")[-1]) - 1]
+
+
+def _apply_preset(operator, context):
+    for key, value in eop.PRESETS.get(_get_preset_name(operator), {}).items():
+        _set_setting(operator, key, value)
+
+
+# Timer interval of background exports, and how long each timer event reads Blender data for
+_MODAL_TIMER_SECONDS = 0.02
+_MODAL_SLICE_SECONDS = 0.05
+
+# How long a cancelled background export may take to stop before its worker thread is left to finish by itself
+_CANCEL_JOIN_SECONDS = 5.0
+
+# Exports report into module level timings and progress, so only one runs at a time
+_is_exporting = False
+
+
+class EmportDalJson(Operator, ExportHelper):
+    """Export intermediate json data"""
+
+    bl_idname = "export_dalbaragi_scene.json"
+    bl_label = "Export JSON"
+    filename_ext = ".json"
+
+    filter_glob: StringProperty(default="*.json", options={'HIDDEN'}, maxlen=255)
+
+    option_enum_preset: EnumProperty(
+        name="Preset",
+        description="Select named export settings, which are applied to the options below",
+        items=(
+            ('OPT_1', "None", "Keep the options as they are"),
+            ('OPT_2', "Iterate", "Fastest export while working on a scene"),
+            ('OPT_3', "Ship", "Smallest output for release builds"),
+        ),
+        default='OPT_1',
+        update=_apply_preset,
+    )
+
+    option_copy_images: BoolProperty(
+        name="Copy textures",
+        description="Copy textures along with the exported file.",
+        default=False,
+    )
+
+    option_incremental_images: BoolProperty(
+        name="Skip unchanged textures",
+        description="Skip textures already up to date in the texture folder, judged by size, mtime and content hash.",
+        default=False,
+    )
+
+    option_hard_link_images: BoolProperty(
+        name="Hard link textures",
+        description="Hard link textures instead of copying them if they are on the same file system.",
+        default=False,
+    )
+
+    option_deduplicate_images: BoolProperty(
+        name="Deduplicate textures",
+        description="Copy textures with identical contents only once and make materials refer to the single copy.",
+        default=False,
+    )
+
+    option_texture_max_size: IntProperty(
+        name="Max texture size",
+        description="Textures larger than this are downscaled by halves until they fit. 0 means no limit.",
+        default=0,
+        min=0,
+    )
+
+    option_enum_texture_format: EnumProperty(
+        name="Texture format",
+        description="Select the format of copied textures",
+        items=(
+            ('OPT_1', "Original", "Keep original files. Downscaled textures are written as PNG"),
+            ('OPT_2', "PNG", "Convert every texture into PNG"),
+            ('OPT_3', "Raw mip chain", "Convert every texture into a DTEX container of RGBA8 mip levels"),
+        ),
+        default='OPT_1',
+    )
+
+    option_compress_binary: BoolProperty(
+        name="Compress binary",
+        description="Compress binary data block using zlib.",
+        default=True,
+    )
+
+    option_embed_binary: BoolProperty(
+        name="Embed binary data",
+        description="Store binary data as Base64 within JSON file.",
+        default=False,
+    )
+
+    option_enum_exclude_hidden: EnumProperty(
+        name="Exclude hidden",
+        description="Select whether to export hidden objects or not",
+        items=(
+            ('OPT_1', "None", "All objects will be exported, including hidden ones"),
+            ('OPT_2', "Meshes", "Hidden meshes will be excluded"),
+            ('OPT_3', "All", "All types of hidden objects will be excluded"),
+        ),
+        default='OPT_2',
+    )
+
+    option_reduce_keyframes: BoolProperty(
+        name="Reduce keyframes",
+        description="Remove animation keys that can be interpolated from their neighbors within the tolerances.",
+        default=False,
+    )
+
+    option_reduce_pos_tolerance: FloatProperty(
+        name="Position tolerance",
+        description="Maximum distance a reduced position track may deviate from the original keys.",
+        default=0.0001,
+        min=0.0,
+        precision=6,
+    )
+
+    option_reduce_rot_tolerance: FloatProperty(
+        name="Rotation tolerance",
+        description="Maximum angle a reduced rotation track may deviate from the original keys.",
+        default=0.0001,
+        min=0.0,
+        subtype='ANGLE',
+        precision=4,
+    )
+
+    option_reduce_scale_tolerance: FloatProperty(
+        name="Scale tolerance",
+        description="Maximum difference a reduced scale track may deviate from the original keys.",
+        default=0.0001,
+        min=0.0,
+        precision=6,
+    )
+
+    option_enum_rotation_layout: EnumProperty(
+        name="Rotation layout",
+        description="Select how rotation keys of animations are stored",
+        items=(
+            ('OPT_1', "Triplets", "Each quaternion component is stored as a separate key"),
+            ('OPT_2', "Smallest three 48", "Normalized quaternions are packed into 48 bits per key"),
+            ('OPT_3', "Smallest three 32", "Normalized quaternions are packed into 32 bits per key"),
+        ),
+        default='OPT_1',
+    )
+
+    option_anim_block_seconds: FloatProperty(
+        name="Animation block duration",
+        description="Split animation tracks into seekable blocks of this many seconds. 0 disables blocks.",
+        default=0.0,
+        min=0.0,
+        subtype='TIME',
+        unit='TIME',
+    )
+
+    option_only_relevant_actions: BoolProperty(
+        name="Only relevant actions",
+        description="Export only actions bound to or matching bones of skeletons in each scene.",
+        default=False,
+    )
+
+    option_enum_encode_executor: EnumProperty(
+        name="Encode in",
+        description="Select where meshes and animations are encoded into binary data",
+        items=(
+            ('OPT_1', "Main thread", "Encode one by one on the main thread"),
+            ('OPT_2', "Threads", "Encode in a thread pool. Encoding holds the GIL, so this rarely helps"),
+            ('OPT_3', "Processes", "Encode in a process pool"),
+            ('OPT_4', "Pipeline", "Encode in processes while parsing, and build and compress the binary meanwhile"),
+        ),
+        default='OPT_1',
+    )
+
+    option_encode_workers: IntProperty(
+        name="Encode workers",
+        description="Number of workers encoding in parallel. 0 means as many as CPU cores.",
+        default=0,
+        min=0,
+    )
+
+    option_do_profile: BoolProperty(
+        name="Generate profile result",
+        description="Run with profiler enabled and export the result as a text file.",
+        default=False,
+    )
+
+    option_attribution_report: BoolProperty(
+        name="Generate attribution report",
+        description="Write time and size spent on each mesh, skeleton, action and texture as CSV and JSON files.",
+        default=False,
+    )
+
+    option_memory_profile: BoolProperty(
+        name="Generate memory profile",
+        description="Trace peak memory and top allocation sites of each export stage, which is several times slower.",
+        default=False,
+    )
+
+    option_background: BoolProperty(
+        name="Export in background",
+        description="Read the scene in short steps between UI events, then build and write the files on another "
+                    "thread while Blender stays usable. Esc cancels.",
+        default=False,
+    )
+
+    def execute(self, context):
+        global _is_exporting
+        if _is_exporting:
+            self.report({'ERROR'}, "Another Dalbaragi export is in progress")
+            return {'CANCELLED'}
+
+        settings = {key: _get_setting(self, key) for key in eop.DEFAULT_SETTINGS.keys()}
+        if self.option_background:
+            return self.__start_background_export(context, settings)
+
+        st = time.time()
+
+        # The cursor shows the percentage done, since the UI is not redrawn while exporting
+        window_manager = context.window_manager
+        progress = prg.Progress(lambda state: window_manager.progress_update(state.fraction))
+        window_manager.progress_begin(0.0, 1.0)
+        _is_exporting = True
+        try:
+            texture_errors = exp.export_with_settings(self.filepath, _get_preset_name(self), settings, progress)
+        except prg.ExportCancelled:
+            self.report({'WARNING'}, "Exporting Dalbaragi scene was cancelled")
+            return {'CANCELLED'}
+        finally:
+            _is_exporting = False
+            window_manager.progress_end()
+
+        return self.__finish(texture_errors, time.time() - st)
+
+    # Blender data is read in time slices on timer events, during which other events are blocked so that the scene does
+    # not change while it is read. Then the rest runs on a worker thread, while events pass through.
+    def modal(self, context, event):
+        if 'ESC' == event.type and 'PRESS' == event.value:
+            self.__progress.cancel()
+            return {'RUNNING_MODAL'}
+        if 'TIMER' != event.type:
+            return {'RUNNING_MODAL'} if self.__worker is None else {'PASS_THROUGH'}
+
+        if self.__worker is None:
+            self.__read_time_slice()
+
+        state = self.__progress.make_state()
+        context.window_manager.progress_update(state.fraction)
+        context.workspace.status_text_set(f"Exporting Dalbaragi scene: {state} (Esc to cancel)")
+
+        if not self.__done.is_set():
+            return {'PASS_THROUGH'} if self.__worker is not None else {'RUNNING_MODAL'}
+
+        return self.__end_background_export(context)
+
+    # Called by Blender when it aborts the modal operator, such as when a file is loaded or the window is closed
+    def cancel(self, context):
+        self.__progress.cancel()
+
+        # Steps reading Blender data run on the main thread, so closing them stops the export right away. A worker
+        # thread stops at its next check, and it is a daemon, so it is left behind if it takes too long.
+        if self.__worker is None:
+            self.__steps.close()
+        else:
+            self.__worker.join(_CANCEL_JOIN_SECONDS)
+            if self.__worker.is_alive():
+                print("[DAL] Export worker did not stop in time, leaving it to finish in the background")
+
+        self.__clean_up_background_export(context)
+
+    def __start_background_export(self, context, settings: Dict):
+        global _is_exporting
+        _is_exporting = True
+
+        self.__progress = prg.Progress()
+        self.__steps = exp.iter_export_with_settings(self.filepath, _get_preset_name(self), settings, self.__progress)
+        self.__worker: Optional[threading.Thread] = None
+        self.__done = threading.Event()
+        self.__texture_errors: List[str] = []
+        self.__error: Optional[BaseException] = None
+        self.__start_time = time.time()
+
+        window_manager = context.window_manager
+        window_manager.progress_begin(0.0, 1.0)
+        self.__timer = window_manager.event_timer_add(_MODAL_TIMER_SECONDS, window=context.window)
+        window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def __read_time_slice(self):
+        st = time.perf_counter()
+        try:
+            while time.perf_counter() - st < _MODAL_SLICE_SECONDS:
+                if exp.BPY_FREE is next(self.__steps):
+                    self.__worker = threading.Thread(target=self.__run_worker, name="dal export", daemon=True)
+                    self.__worker.start()
+                    return
+        except StopIteration as e:
+            self.__texture_errors = e.value
+            self.__done.set()
+        except BaseException as e:
+            self.__error = e
+            self.__done.set()
+
+    def __run_worker(self):
+        try:
+            self.__texture_errors = prg.run_steps(self.__steps)
+        except BaseException as e:
+            self.__error = e
+        finally:
+            self.__done.set()
+
+    def __end_background_export(self, context):
+        self.__clean_up_background_export(context)
+
+        if isinstance(self.__error, prg.ExportCancelled):
+            self.report({'WARNING'}, "Exporting Dalbaragi scene was cancelled")
+            return {'CANCELLED'}
+        elif self.__error is not None:
+            traceback.print_exception(type(self.__error), self.__error, self.__error.__traceback__)
+            self.report({'ERROR'}, f"Failed to export Dalbaragi scene: {self.__error}")
+            return {'CANCELLED'}
+
+        return self.__finish(self.__texture_errors, time.time() - self.__start_time)
+
+    def __clean_up_background_export(self, context):
+        global _is_exporting
+        _is_exporting = False
+
+        window_manager = context.window_manager
+        window_manager.event_timer_remove(self.__timer)
+        window_manager.progress_end()
+        if context.workspace is not None:
+            context.workspace.status_text_set(None)
+
+    def __finish(self, texture_errors: List[str], elapsed: float):
+        print(f"[DAL] Finished exporting Dalbaragi scene ({elapsed:.3f})")
+
+        if texture_errors:
+            message = f"Finished exporting Dalbaragi scene, but {len(texture_errors)} textures failed to be copied"
+            self.report({'WARNING'}, message)
+        else:
+            self.report({'INFO'}, "Finished exporting Dalbaragi scene")
+        return {'FINISHED'}
+
+
+class DalExportSubMenu(bpy.types.Menu):
+    bl_idname = "dal_export_menu"
+    bl_label = "Dalbaragi Tools"
+
+    def draw(self, context):
+        self.layout.operator(EmportDalJson.bl_idname, text="Scene (.json)")
+
+
+def menu_func_export(self, context):
+    self.layout.menu(DalExportSubMenu.bl_idname)
+
+
+modules = (
+    byt,
+    smt,
+    acp,
+    tmg,
+    mpf,
+    prg,
+    atr,
+    dst,
+    epl,
+    dex,
+    tpr,
+    tex,
+    eop,
+    exp,
+)
+
+
+classes = (
+    EmportDalJson,
+    DalExportSubMenu,
+)
+
+
+def register():
+    for mod in modules:
+        importlib.reload(mod)
+
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+
+
+def unregister():
+    for cls in classes:
+        bpy.utils.unregister_class(cls)
+
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+
+
+if __name__ == "__main__":
+    register()
+    bpy.ops.export_model.dmd('INVOKE_DEFAULT')
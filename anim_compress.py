@@ -0,0 +1,207 @@
+import math
+from typing import List, Tuple, Callable, Sequence
+
+
+# A time point and the values of every channel of a track at that time point
+Sample = Tuple[float, Tuple[float, ...]]
+
+
+def lerp_values(a: Sequence[float], b: Sequence[float], t: float) -> Tuple[float, ...]:
+    return tuple(x + (y - x) * t for x, y in zip(a, b))
+
+
+# Each channel of a rotation is interpolated independently and renormalized afterwards.
+def nlerp_quat(a: Sequence[float], b: Sequence[float], t: float) -> Tuple[float, ...]:
+    output = lerp_values(a, b, t)
+    length = math.sqrt(sum(x * x for x in output))
+    if 0.0 == length:
+        return tuple(a)
+    return tuple(x / length for x in output)
+
+
+def distance_euclidean(a: Sequence[float], b: Sequence[float]) -> float:
+    return math.sqrt(sum((x - y) * (x - y) for x, y in zip(a, b)))
+
+
+def distance_max_abs(a: Sequence[float], b: Sequence[float]) -> float:
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+# In radians
+def angle_between_quats(a: Sequence[float], b: Sequence[float]) -> float:
+    len_a = math.sqrt(sum(x * x for x in a))
+    len_b = math.sqrt(sum(x * x for x in b))
+    if 0.0 == len_a or 0.0 == len_b:
+        return 0.0
+
+    dot = abs(sum(x * y for x, y in zip(a, b))) / (len_a * len_b)
+    return 2.0 * math.acos(min(1.0, dot))
+
+
+class ReductionStats:
+    def __init__(self):
+        self.keys_before = 0
+        self.keys_after = 0
+        self.max_pos_error = 0.0
+        self.max_rot_error = 0.0
+        self.max_scale_error = 0.0
+
+    def merge(self, other: "ReductionStats"):
+        self.keys_before += other.keys_before
+        self.keys_after += other.keys_after
+        self.max_pos_error = max(self.max_pos_error, other.max_pos_error)
+        self.max_rot_error = max(self.max_rot_error, other.max_rot_error)
+        self.max_scale_error = max(self.max_scale_error, other.max_scale_error)
+
+
+def __segment_error(
+    samples: List[Sample],
+    begin: int,
+    end: int,
+    interpolate: Callable,
+    measure: Callable,
+) -> float:
+    t0, v0 = samples[begin]
+    t1, v1 = samples[end]
+    duration = t1 - t0
+
+    max_error = 0.0
+    for i in range(begin + 1, end):
+        t, v = samples[i]
+        factor = (t - t0) / duration if duration > 0.0 else 0.0
+        max_error = max(max_error, measure(interpolate(v0, v1, factor), v))
+    return max_error
+
+
+# Returns the farthest end found for a segment starting at `anchor` whose removed samples are all within the tolerance,
+# and their maximum error. Ends are tried at doubling distances, then the last gap is bisected, so that finding a
+# segment of n samples costs O(n log n) rather than O(n^2). The error is not monotonic in the end, so a longer
+# segment than the one found might exist, but every segment taken is checked.
+def __find_segment_end(
+    samples: List[Sample],
+    anchor: int,
+    interpolate: Callable,
+    measure: Callable,
+    tolerance: float,
+) -> Tuple[int, float]:
+    last = len(samples) - 1
+    good, good_error = anchor + 1, 0.0
+    bad = last + 1
+
+    distance = 2
+    while good < last:
+        end = min(anchor + distance, last)
+        error = __segment_error(samples, anchor, end, interpolate, measure)
+        if error > tolerance:
+            bad = end
+            break
+        good, good_error = end, error
+        distance *= 2
+
+    while bad - good > 1:
+        end = (good + bad) // 2
+        error = __segment_error(samples, anchor, end, interpolate, measure)
+        if error <= tolerance:
+            good, good_error = end, error
+        else:
+            bad = end
+
+    return good, good_error
+
+
+# Removes samples whose value can be interpolated from the remaining ones within the tolerance.
+# Returns the reduced samples and the maximum error among the removed ones.
+def reduce_samples(
+    samples: List[Sample],
+    interpolate: Callable,
+    measure: Callable,
+    tolerance: float,
+) -> Tuple[List[Sample], float]:
+    if len(samples) <= 1:
+        return list(samples), 0.0
+
+    # Constant track collapses to a single key
+    first_value = samples[0][1]
+    constant_error = max(measure(first_value, v) for t, v in samples)
+    if constant_error <= tolerance:
+        return [samples[0]], constant_error
+
+    output = [samples[0]]
+    max_error = 0.0
+    anchor = 0
+
+    while anchor < len(samples) - 1:
+        anchor, error = __find_segment_end(samples, anchor, interpolate, measure, tolerance)
+        max_error = max(max_error, error)
+        output.append(samples[anchor])
+
+    return output, max_error
+
+
+# Bit widths of the three smallest components. With 2 bits for the index of the largest component and
+# 1 bit for its sign, they fill up 48 and 32 bits respectively.
+SMALLEST_THREE_48_BITS = (15, 15, 15)
+SMALLEST_THREE_32_BITS = (10, 10, 9)
+
+__SMALLEST_THREE_RANGE = 1.0 / math.sqrt(2.0)
+
+
+def normalize_quat(q: Sequence[float]) -> Tuple[float, ...]:
+    length = math.sqrt(sum(x * x for x in q))
+    if 0.0 == length:
+        return 1.0, 0.0, 0.0, 0.0
+    return tuple(x / length for x in q)
+
+
+# Negates quaternions whose dot product with the previous one is negative, so that
+# per-channel interpolation between consecutive keys never takes the long way around.
+def make_quats_continuous(quats: List[Sequence[float]]) -> List[Tuple[float, ...]]:
+    output = []
+    for q in quats:
+        q = normalize_quat(q)
+        if output and sum(x * y for x, y in zip(output[-1], q)) < 0.0:
+            q = tuple(-x for x in q)
+        output.append(q)
+    return output
+
+
+def get_smallest_three_byte_size(bits: Tuple[int, int, int]) -> int:
+    return (3 + sum(bits)) // 8
+
+
+# Bit layout from the most significant one: [index of largest:2][sign of largest:1][a][b][c]
+def pack_smallest_three(q: Sequence[float], bits: Tuple[int, int, int]) -> int:
+    largest_index = max(range(4), key=lambda i: abs(q[i]))
+    output = largest_index
+    output = (output << 1) | (1 if q[largest_index] < 0.0 else 0)
+
+    # The sign bit restores the largest component, so the rest are stored as if it was positive
+    sign = -1.0 if q[largest_index] < 0.0 else 1.0
+    smallest_three = [sign * q[i] for i in range(4) if i != largest_index]
+
+    for value, bit_count in zip(smallest_three, bits):
+        max_int = (1 << bit_count) - 1
+        normalized = (value + __SMALLEST_THREE_RANGE) / (2.0 * __SMALLEST_THREE_RANGE)
+        quantized = min(max_int, max(0, int(round(normalized * max_int))))
+        output = (output << bit_count) | quantized
+
+    return output
+
+
+def unpack_smallest_three(packed: int, bits: Tuple[int, int, int]) -> Tuple[float, ...]:
+    smallest_three = []
+    for bit_count in reversed(bits):
+        max_int = (1 << bit_count) - 1
+        quantized = packed & max_int
+        packed >>= bit_count
+        smallest_three.append(quantized / max_int * 2.0 * __SMALLEST_THREE_RANGE - __SMALLEST_THREE_RANGE)
+    smallest_three.reverse()
+
+    negative = packed & 1
+    largest_index = (packed >> 1) & 3
+
+    largest = math.sqrt(max(0.0, 1.0 - sum(x * x for x in smallest_three)))
+    output = smallest_three[:largest_index] + [largest] + smallest_three[largest_index:]
+    if negative:
+        output = [-x for x in output]
+    return normalize_quat(output)
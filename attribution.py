@@ -0,0 +1,200 @@
+import sys
+import csv
+import json
+import zlib
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from . import timing as tmg
+except ImportError:
+    import timing as tmg
+
+
+# Which meshes, skeletons, actions and textures an export spends its time and bytes on, written as
+# "_attribution.json" and "_attribution.csv" next to the exported file. Rows are sorted by cost, which is the sum of
+# parse and encode seconds. Times come from the spans of `timing`, and binary sizes from the blocks marked in
+# `BinaryArrayBuilder`.
+#
+# Compressed bytes of an object are how much the compressed binary grows while its block is fed to the compressor,
+# measured by a separate pass that flushes after each block, so they add up to slightly more than the real binary.
+# Encode seconds of meshes and actions encoded by worker pools only cover appending them to the binary.
+#
+# Comparing with a previous report:
+#
+#   python attribution.py old_attribution.json new_attribution.json
+
+
+REPORT_SUFFIX = "_attribution"
+
+COLUMNS = (
+    "kind",
+    "name",
+    "cost seconds",
+    "parse seconds",
+    "encode seconds",
+    "vertices",
+    "joints",
+    "keys",
+    "raw bytes",
+    "compressed bytes",
+)
+
+__NUMBER_COLUMNS = COLUMNS[2:]
+
+# Span name -> kind of the row and the column its seconds go to
+__SPAN_COLUMNS = {
+    "mesh extract": ("mesh", "parse seconds"),
+    "mesh encode": ("mesh", "encode seconds"),
+    "skeleton parse": ("skeleton", "parse seconds"),
+    "animation": ("action", "parse seconds"),
+    "animation encode": ("action", "encode seconds"),
+    "texture write": ("texture", "encode seconds"),
+}
+
+# Counter name -> column
+__COUNTER_COLUMNS = {
+    "vertices": "vertices",
+    "joints": "joints",
+    "animation keys": "keys",
+    "texture bytes": "raw bytes",
+}
+
+
+def _new_row(kind: str, name: str) -> Dict:
+    row = {"kind": kind, "name": name}
+    for column in __NUMBER_COLUMNS:
+        row[column] = 0
+    return row
+
+
+# Returns the compressed size each (position, size) block adds, when the whole data is compressed in order
+def measure_compressed_sizes(data: bytes, blocks: Iterable[Tuple[int, int]], level: int = zlib.Z_BEST_COMPRESSION):
+    compressor = zlib.compressobj(level)
+    output = []
+    for position, size in blocks:
+        compressed_size = len(compressor.compress(data[position:position + size]))
+        compressed_size += len(compressor.flush(zlib.Z_SYNC_FLUSH))
+        output.append(compressed_size)
+    return output
+
+
+def make_report(
+    timings: tmg.Timings,
+    blocks: Iterable[Tuple[str, str, int, int]],
+    bin_data: bytes,
+    measure_compression: bool,
+) -> List[Dict]:
+    rows: Dict[Tuple[str, str], Dict] = {}
+
+    def get_row(kind: str, name: str):
+        key = (kind, name)
+        if key not in rows:
+            rows[key] = _new_row(kind, name)
+        return rows[key]
+
+    for span_name, (kind, column) in __SPAN_COLUMNS.items():
+        for label, summary in timings.summarize_by_label(span_name).items():
+            row = get_row(kind, label)
+            row[column] += summary["seconds"]
+            for counter_name, value in summary["counters"].items():
+                if counter_name in __COUNTER_COLUMNS:
+                    row[__COUNTER_COLUMNS[counter_name]] += value
+
+    blocks = sorted(blocks, key=lambda x: x[2])
+    if measure_compression:
+        compressed_sizes = measure_compressed_sizes(bin_data, ((x[2], x[3]) for x in blocks))
+    else:
+        compressed_sizes = [0] * len(blocks)
+
+    for (kind, name, position, size), compressed_size in zip(blocks, compressed_sizes):
+        row = get_row(kind, name)
+        row["raw bytes"] += size
+        row["compressed bytes"] += compressed_size
+
+    for row in rows.values():
+        row["cost seconds"] = row["parse seconds"] + row["encode seconds"]
+
+    return sorted(rows.values(), key=lambda x: (-x["cost seconds"], -x["raw bytes"], x["kind"], x["name"]))
+
+
+def save_report(rows: List[Dict], base_path: str):
+    with open(base_path + REPORT_SUFFIX + ".json", "w", encoding="utf8") as file:
+        json.dump({"columns": list(COLUMNS), "rows": rows}, file, indent=4)
+
+    with open(base_path + REPORT_SUFFIX + ".csv", "w", encoding="utf8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def load_report(path: str) -> Optional[List[Dict]]:
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return json.load(file)["rows"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+# Rows of objects in either report with the differences of every number column, sorted by the largest change of cost
+# and then of raw bytes. Objects only in one report have the status "added" or "removed".
+def diff_reports(old_rows: List[Dict], new_rows: List[Dict]) -> List[Dict]:
+    old_map = {(x["kind"], x["name"]): x for x in old_rows}
+    new_map = {(x["kind"], x["name"]): x for x in new_rows}
+
+    output = []
+    for key in set(old_map.keys()).union(new_map.keys()):
+        old_row = old_map.get(key)
+        new_row = new_map.get(key)
+        if old_row is None:
+            status = "added"
+        elif new_row is None:
+            status = "removed"
+        else:
+            status = "changed"
+
+        row = {"kind": key[0], "name": key[1], "status": status}
+        for column in __NUMBER_COLUMNS:
+            row[column] = (new_row or {}).get(column, 0) - (old_row or {}).get(column, 0)
+        output.append(row)
+
+    output.sort(key=lambda x: (-abs(x["cost seconds"]), -abs(x["raw bytes"]), x["kind"], x["name"]))
+    return output
+
+
+def format_diff(rows: List[Dict], limit: int = 0) -> str:
+    lines = [f"{'Status':<8} {'Cost (s)':>10} {'Raw bytes':>12} {'Compressed':>12}  Kind      Name"]
+    for x in rows[:limit] if limit > 0 else rows:
+        lines.append(
+            f"{x['status']:<8} {x['cost seconds']:>+10.3f} {x['raw bytes']:>+12} {x['compressed bytes']:>+12}  "
+            f"{x['kind']:<8}  {x['name']}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def __parse_args():
+    parser = argparse.ArgumentParser(description="Compare two attribution reports of exports.")
+
+    parser.add_argument("old_report", type=str, help="Path of the previous _attribution.json")
+    parser.add_argument("new_report", type=str, help="Path of the current _attribution.json")
+    parser.add_argument("--limit", type=int, default=0, help="Number of rows to print. 0 prints all.")
+
+    return parser.parse_args()
+
+
+def __cmd_diff() -> int:
+    args = __parse_args()
+
+    old_rows = load_report(args.old_report)
+    new_rows = load_report(args.new_report)
+    for path, rows in ((args.old_report, old_rows), (args.new_report, new_rows)):
+        if rows is None:
+            print(f"Failed to read attribution report: {path}")
+            return 1
+
+    print(format_diff(diff_reports(old_rows, new_rows), args.limit), end="")
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(__cmd_diff())
@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+import concurrent.futures
+from typing import List, Optional
+
+try:
+    from . import export_manifest as mnf
+    from . import export_options as eop
+except ImportError:
+    import export_manifest as mnf
+    import export_options as eop
+
+
+# Runs without Blender. Each .blend file is exported by its own background Blender process running export_func, and
+# up to `--jobs` of them run at once. Arguments not known here are passed on to export_func.
+# Files whose source, exporter and options did not change since the last export are skipped before starting Blender,
+# unless `--force` is given. The manifest is kept by this driver only, so the Blender processes don't race on it.
+#
+#   python batch_export.py --blender path/to/blender --jobs 4 --output-folder out a.blend b.blend -- --texture
+
+
+SUMMARY_FILE_NAME = "_batch_summary.txt"
+
+
+class BatchResult:
+    def __init__(self, blend_path: str, return_code: int, elapsed: float, log_path: str, reason: Optional[str] = None):
+        self.blend_path = str(blend_path)
+        self.return_code = int(return_code)
+        self.elapsed = float(elapsed)
+        self.log_path = str(log_path)
+        # Why the file was exported. None means it was skipped for being up to date.
+        self.reason = reason
+
+    @property
+    def succeeded(self):
+        return 0 == self.return_code
+
+    @property
+    def skipped(self):
+        return self.reason is None
+
+    @property
+    def status(self):
+        if self.skipped:
+            return "SKIP"
+        elif self.succeeded:
+            return "OK"
+        else:
+            return f"FAIL({self.return_code})"
+
+
+# export_func is run as a module of this package, so it works even if the add-on is not installed in Blender.
+# Other modules of the package can be run the same way, and Blender starts with an empty file if `blend_path` is empty.
+def make_blender_command(
+    blender_path: str,
+    blend_path: str,
+    export_args: List[str],
+    module_name: str = "export_func",
+) -> List[str]:
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    python_expr = (
+        "import sys, runpy; "
+        f"sys.path.insert(0, {os.path.dirname(package_dir)!r}); "
+        f"runpy.run_module('{os.path.basename(package_dir)}.{module_name}', run_name='__main__')"
+    )
+
+    return [
+        blender_path,
+        "--background",
+        "--factory-startup",
+        *([blend_path] if blend_path else []),
+        "--python-exit-code", "1",
+        "--python-expr", python_expr,
+        "--",
+        *export_args,
+    ]
+
+
+def export_one(
+    blender_path: str,
+    blend_path: str,
+    output_folder: str,
+    export_args: List[str],
+    reason: str = "no manifest",
+) -> BatchResult:
+    log_path = os.path.join(output_folder, __get_pure_file_name(blend_path) + ".log")
+    command = make_blender_command(
+        blender_path, blend_path, ["--output-folder", output_folder, "--no-manifest", *export_args]
+    )
+
+    st = time.time()
+    with open(log_path, "w", encoding="utf8") as log_file:
+        try:
+            return_code = subprocess.run(command, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        except OSError as e:
+            log_file.write(f"Failed to run Blender: {e}\n")
+            return_code = -1
+
+    return BatchResult(blend_path, return_code, time.time() - st, log_path, reason)
+
+
+def __get_pure_file_name(blend_path: str) -> str:
+    return os.path.split(os.path.splitext(blend_path)[0])[-1]
+
+
+def make_summary_table(results: List[BatchResult], wall_time: float) -> str:
+    lines = [f"{'Status':<8} {'Time (s)':>10}  {'Reason':<24}  File"]
+    for x in sorted(results, key=lambda x: x.elapsed, reverse=True):
+        reason = "up to date" if x.skipped else x.reason
+        lines.append(f"{x.status:<8} {x.elapsed:>10.3f}  {reason:<24}  {x.blend_path}")
+
+    failed_count = sum(1 for x in results if not x.succeeded)
+    skipped_count = sum(1 for x in results if x.skipped)
+    total_time = sum(x.elapsed for x in results)
+    lines.append("")
+    lines.append(
+        f"{len(results)} files, {skipped_count} up to date, {failed_count} failed, "
+        f"wall time {wall_time:.3f} s, sum of process times {total_time:.3f} s"
+    )
+    return "\n".join(lines) + "\n"
+
+
+def run_batch(
+    blender_path: str,
+    blend_paths: List[str],
+    output_folder: str,
+    jobs: int,
+    export_args: List[str],
+    use_manifest: bool = True,
+    force: bool = False,
+):
+    os.makedirs(output_folder, exist_ok=True)
+
+    st = time.time()
+    manifest = mnf.ExportManifest(output_folder) if use_manifest else None
+    preset, settings = eop.parse_settings_args(export_args)
+    options = {"preset": preset, "settings": settings}
+
+    results = []
+    to_export = []
+    source_hashes = {}
+    for blend_path in blend_paths:
+        if manifest is None:
+            to_export.append((blend_path, "no manifest"))
+            continue
+
+        json_path = os.path.join(output_folder, __get_pure_file_name(blend_path) + ".json")
+        try:
+            reason, source_hashes[blend_path] = manifest.check(blend_path, [json_path], options)
+        except OSError as e:
+            reason = f"unreadable source: {e}"
+
+        if force:
+            reason = "forced"
+        if reason is None:
+            results.append(BatchResult(blend_path, 0, 0.0, "", None))
+            print(f"[DAL] SKIP: {blend_path} (up to date)", flush=True)
+        else:
+            to_export.append((blend_path, reason))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(export_one, blender_path, x, output_folder, export_args, reason)
+            for x, reason in to_export
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[DAL] {result.status}: {result.blend_path} ({result.reason}, {result.elapsed:.3f})", flush=True)
+
+            if manifest is not None and result.succeeded and result.blend_path in source_hashes:
+                manifest.update(result.blend_path, source_hashes[result.blend_path], options)
+
+    if manifest is not None:
+        manifest.save()
+
+    # Sorted by input order so that the summary does not depend on which process finished first
+    order = {x: i for i, x in enumerate(blend_paths)}
+    results.sort(key=lambda x: order[x.blend_path])
+    return results, time.time() - st
+
+
+def __parse_args():
+    parser = argparse.ArgumentParser(description="Export many .blend files with parallel Blender processes.")
+
+    parser.add_argument("blend_paths", nargs="+", help="Paths of .blend files to export")
+    parser.add_argument("--blender", dest="blender_path", type=str, default="blender", help="Path of Blender executable")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Number of Blender processes")
+    parser.add_argument("--output-folder", dest="output_folder", type=str, default=".", help="")
+    parser.add_argument("--force", action="store_true", help="Export every file even if it is up to date")
+    parser.add_argument(
+        "--no-manifest",
+        dest="no_manifest",
+        action="store_true",
+        help="Neither check nor update the export manifest in the output folder"
+    )
+
+    if sys.argv.count("--"):
+        separator = sys.argv.index("--")
+        args = parser.parse_args(sys.argv[1:separator])
+        export_args = sys.argv[separator + 1:]
+    else:
+        args = parser.parse_args(sys.argv[1:])
+        export_args = []
+
+    return args, export_args
+
+
+def __cmd_batch() -> int:
+    args, export_args = __parse_args()
+    results, wall_time = run_batch(
+        args.blender_path,
+        args.blend_paths,
+        args.output_folder,
+        args.jobs,
+        export_args,
+        not args.no_manifest,
+        args.force,
+    )
+
+    summary = make_summary_table(results, wall_time)
+    print(summary, end="")
+    with open(os.path.join(args.output_folder, SUMMARY_FILE_NAME), "w", encoding="utf8") as file:
+        file.write(summary)
+
+    return 0 if all(x.succeeded for x in results) else 1
+
+
+if "__main__" == __name__:
+    sys.exit(__cmd_batch())
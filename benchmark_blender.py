@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+if bpy is not None:
+    from . import data_exporter as dex
+    from . import export_func as exp
+else:
+    try:
+        from . import batch_export as bat
+        from . import benchmark_struct as bst
+    except ImportError:
+        import batch_export as bat
+        import benchmark_struct as bst
+
+
+# End to end benchmark of exports in background Blender. Without Blender, this runs as the driver, which starts one
+# Blender process per scenario and size. Each of them runs this module again, builds the scene procedurally in an empty
+# file, and runs `export_json` once. Times of its parse, build and write stages are read from its timings report.
+#
+#   python benchmark_blender.py --blender path/to/blender --output result.json
+#   python benchmark_blender.py --blender path/to/blender --baseline result.json --max-regression 0.2
+#
+# Times of each stage over the sizes of a scenario make its scaling curve. Scaling exponents are the slopes of the
+# curves on a log-log scale, so 1 means linear. With a baseline, the exit code is 1 if any stage of any size got
+# slower than the baseline by more than the ratio.
+
+
+# Scenario -> sizes, whose meaning depends on the scenario
+SCENARIOS: Dict[str, Tuple[int, ...]] = {
+    # Triangles of a subdivided grid
+    "mesh": (10_000, 100_000, 1_000_000),
+    # Bones of a rigged character with a skinned mesh
+    "rig": (16, 64, 256),
+    # Frames of an action on every bone of a 32 bone rig
+    "action": (250, 1000, 4000),
+    # Objects instancing a single mesh
+    "instances": (100, 1000, 10000),
+}
+
+STAGES = ("parse", "build", "write")
+
+# Spans of the timings report of `export_json` -> stage they are summed into. Compressing is part of writing.
+_STAGE_SPANS = {
+    "parse": "parse",
+    "build": "build",
+    "compress": "write",
+    "base64": "write",
+    "write binary": "write",
+    "write json": "write",
+}
+
+
+# Blender side
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _make_grid_mesh(name: str, triangles: int):
+    quads_per_side = max(1, math.ceil(math.sqrt(triangles / 2)))
+    verts_per_side = quads_per_side + 1
+
+    vertices = [
+        (x / quads_per_side - 0.5, y / quads_per_side - 0.5, 0.0)
+        for y in range(verts_per_side)
+        for x in range(verts_per_side)
+    ]
+    faces = []
+    for y in range(quads_per_side):
+        for x in range(quads_per_side):
+            i = y * verts_per_side + x
+            faces.append((i, i + 1, i + verts_per_side + 1, i + verts_per_side))
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(vertices, [], faces)
+
+    # Tangents need a UV map
+    uv_layer = mesh.uv_layers.new()
+    uv_coords = []
+    for loop in mesh.loops:
+        co = vertices[loop.vertex_index]
+        uv_coords.append(co[0] + 0.5)
+        uv_coords.append(co[1] + 0.5)
+    uv_layer.data.foreach_set("uv", uv_coords)
+
+    mesh.update()
+    return mesh
+
+
+def _new_object(name: str, data):
+    obj = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+
+# Bones are chained along the Y axis of the grid, and each vertex is weighted to the bone of its band
+def _make_rig(bone_count: int, triangles: int):
+    armature = _new_object("rig", bpy.data.armatures.new("rig"))
+    bpy.context.view_layer.objects.active = armature
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    parent = None
+    for i in range(bone_count):
+        bone = armature.data.edit_bones.new(f"bone{i}")
+        bone.head = (0.0, i / bone_count - 0.5, 0.0)
+        bone.tail = (0.0, (i + 1) / bone_count - 0.5, 0.0)
+        bone.parent = parent
+        parent = bone
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    mesh_obj = _new_object("skin", _make_grid_mesh("skin", triangles))
+    mesh_obj.parent = armature
+    modifier = mesh_obj.modifiers.new("Armature", 'ARMATURE')
+    modifier.object = armature
+
+    groups = [mesh_obj.vertex_groups.new(name=f"bone{i}") for i in range(bone_count)]
+    for v in mesh_obj.data.vertices:
+        band = min(bone_count - 1, int((v.co.y + 0.5) * bone_count))
+        groups[band].add([v.index], 1.0, 'REPLACE')
+
+    return armature
+
+
+def _add_action(armature, frame_count: int):
+    action = bpy.data.actions.new("bench")
+    armature.animation_data_create()
+    armature.animation_data.action = action
+
+    for bone in armature.pose.bones:
+        for data_path, channel_count in (("location", 3), ("rotation_quaternion", 4), ("scale", 3)):
+            for channel in range(channel_count):
+                fcurve = action.fcurves.new(f'pose.bones["{bone.name}"].{data_path}', index=channel)
+                fcurve.keyframe_points.add(frame_count)
+
+                coords = []
+                for frame in range(frame_count):
+                    coords.append(float(frame))
+                    coords.append(math.sin(frame * 0.05 + channel))
+                fcurve.keyframe_points.foreach_set("co", coords)
+                fcurve.update()
+
+
+def _build_scenario(scenario: str, size: int):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+    if "mesh" == scenario:
+        _new_object("grid", _make_grid_mesh("grid", size))
+    elif "rig" == scenario:
+        _make_rig(size, 20_000)
+    elif "action" == scenario:
+        _add_action(_make_rig(32, 2_000), size)
+    elif "instances" == scenario:
+        mesh = _make_grid_mesh("instanced", 200)
+        for i in range(size):
+            obj = _new_object(f"instance{i}", mesh)
+            obj.location = (i % 100, i // 100, 0.0)
+    else:
+        raise ValueError(f"Unknown benchmark scenario: '{scenario}'")
+
+
+def _run_in_blender(scenario: str, size: int, output_folder: str) -> Dict:
+    st = time.perf_counter()
+    _build_scenario(scenario, size)
+    build_scene_seconds = time.perf_counter() - st
+
+    json_path = os.path.join(output_folder, f"{scenario}_{size}.json")
+    st = time.perf_counter()
+    exp.export_json(json_path, dex.ParseConfigs(), False, True, False, False)
+    export_seconds = time.perf_counter() - st
+
+    with open(os.path.splitext(json_path)[0] + "_timings.json", "r", encoding="utf8") as file:
+        timings = json.load(file)
+
+    seconds = {x: 0.0 for x in STAGES}
+    for span_name, stage in _STAGE_SPANS.items():
+        seconds[stage] += timings["stages"].get(span_name, {}).get("seconds", 0.0)
+
+    return {
+        "blender": bpy.app.version_string,
+        "scene build seconds": build_scene_seconds,
+        "export seconds": export_seconds,
+        "seconds": seconds,
+        "binary bytes": timings["counters"].get("binary bytes", 0),
+    }
+
+
+def __cmd_blender_side() -> int:
+    args = sys.argv[sys.argv.index("--") + 1:] if sys.argv.count("--") else []
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", type=str, required=True)
+    parser.add_argument("--size", type=int, required=True)
+    parser.add_argument("--result", type=str, required=True)
+    args = parser.parse_args(args)
+
+    result = _run_in_blender(args.scenario, args.size, os.path.dirname(os.path.abspath(args.result)))
+    with open(args.result, "w", encoding="utf8") as file:
+        json.dump(result, file, indent=4)
+    return 0
+
+
+# Driver side
+# ----------------------------------------------------------------------------------------------------------------------
+
+def run_case(blender_path: str, scenario: str, size: int, output_folder: str) -> Optional[Dict]:
+    result_path = os.path.join(output_folder, f"{scenario}_{size}_result.json")
+    log_path = os.path.join(output_folder, f"{scenario}_{size}.log")
+    command = bat.make_blender_command(
+        blender_path,
+        "",
+        ["--scenario", scenario, "--size", str(size), "--result", result_path],
+        "benchmark_blender",
+    )
+
+    with open(log_path, "w", encoding="utf8") as log_file:
+        try:
+            return_code = subprocess.run(command, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        except OSError as e:
+            log_file.write(f"Failed to run Blender: {e}\n")
+            return_code = -1
+
+    if 0 != return_code:
+        print(f"[DAL] Benchmark failed: {scenario} {size}, see {log_path}", flush=True)
+        return None
+
+    with open(result_path, "r", encoding="utf8") as file:
+        return json.load(file)
+
+
+# Slopes between consecutive sizes on a log-log scale
+def compute_scaling_exponents(curve: List[Tuple[int, float]]) -> List[float]:
+    output = []
+    for (size0, seconds0), (size1, seconds1) in zip(curve, curve[1:]):
+        if seconds0 > 0.0 and seconds1 > 0.0 and size1 != size0:
+            output.append(math.log(seconds1 / seconds0) / math.log(size1 / size0))
+    return output
+
+
+def run_benchmarks(blender_path: str, scenarios: List[str], size_limit: int, output_folder: str) -> Dict:
+    os.makedirs(output_folder, exist_ok=True)
+
+    cases = {}
+    curves = {}
+    exponents = {}
+    blender_version = ""
+
+    for scenario in scenarios:
+        sizes = SCENARIOS[scenario][:size_limit] if size_limit > 0 else SCENARIOS[scenario]
+        curves[scenario] = {stage: [] for stage in STAGES}
+
+        for size in sizes:
+            result = run_case(blender_path, scenario, size, output_folder)
+            if result is None:
+                continue
+
+            blender_version = result["blender"]
+            for stage in STAGES:
+                seconds = result["seconds"][stage]
+                cases[f"{scenario}/{size}/{stage}"] = {"seconds": seconds}
+                curves[scenario][stage].append((size, seconds))
+            print(
+                f"[DAL] {scenario} {size}: " + ", ".join(f"{x} {result['seconds'][x]:.3f}" for x in STAGES),
+                flush=True,
+            )
+
+        exponents[scenario] = {stage: compute_scaling_exponents(curve) for stage, curve in curves[scenario].items()}
+
+    return {
+        "blender": blender_version,
+        "cases": cases,
+        "curves": curves,
+        "scaling exponents": exponents,
+    }
+
+
+def format_curves(output: Dict) -> str:
+    lines = [f"{'Scenario':<10} {'Size':>10} " + " ".join(f"{x + ' (s)':>12}" for x in STAGES)]
+    for scenario, curves in output["curves"].items():
+        sizes = [size for size, seconds in curves[STAGES[0]]]
+        for i, size in enumerate(sizes):
+            lines.append(f"{scenario:<10} {size:>10} " + " ".join(f"{curves[x][i][1]:>12.3f}" for x in STAGES))
+
+        exponents = output["scaling exponents"][scenario]
+        lines.append(
+            f"{'':<10} {'exponent':>10} " +
+            " ".join(f"{' '.join(f'{e:.2f}' for e in exponents[x]):>12}" for x in STAGES)
+        )
+    return "\n".join(lines) + "\n"
+
+
+def __parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark exports of procedurally built scenes in Blender.")
+
+    parser.add_argument("--blender", dest="blender_path", type=str, default="blender", help="Path of Blender executable")
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=list(SCENARIOS.keys()),
+        default=list(SCENARIOS.keys()),
+        help=""
+    )
+    parser.add_argument("--size-limit", dest="size_limit", type=int, default=0, help="Run only the first N sizes")
+    parser.add_argument("--output-folder", dest="output_folder", type=str, default="benchmark_output", help="")
+    parser.add_argument("--output", type=str, default="", help="Path of a JSON file to write the results into")
+    parser.add_argument("--baseline", type=str, default="", help="Path of a JSON file of previous results")
+    parser.add_argument(
+        "--max-regression",
+        dest="max_regression",
+        type=float,
+        default=0.2,
+        help="Slowdown against the baseline, as a ratio of its time, that fails the run"
+    )
+
+    return parser.parse_args()
+
+
+def __cmd_benchmark() -> int:
+    args = __parse_args()
+
+    output = run_benchmarks(args.blender_path, args.scenarios, args.size_limit, args.output_folder)
+    print(format_curves(output), end="")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(output, file, indent=4)
+
+    expected_count = sum(
+        len(SCENARIOS[x][:args.size_limit] if args.size_limit > 0 else SCENARIOS[x]) for x in args.scenarios
+    )
+    failed = len(output["cases"]) != expected_count * len(STAGES)
+
+    if args.baseline:
+        baseline = bst.load_baseline(args.baseline)
+        if baseline is None:
+            print(f"Failed to read baseline: {args.baseline}")
+            return 1
+
+        regressions = bst.find_regressions(output["cases"], baseline, args.max_regression)
+        for x in regressions:
+            print(f"Regression: {x}")
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if "__main__" == __name__:
+    if bpy is not None:
+        sys.exit(__cmd_blender_side())
+    else:
+        sys.exit(__cmd_benchmark())
@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+import importlib
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+try:
+    from . import smalltype as smt
+    from . import data_struct as dst
+except ImportError:
+    # Run as a script. data_struct imports its siblings relatively, so it is imported as a module of the package.
+    __package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(__package_dir))
+    smt = importlib.import_module(os.path.basename(__package_dir) + ".smalltype")
+    dst = importlib.import_module(os.path.basename(__package_dir) + ".data_struct")
+
+
+# Benchmarks encoding of synthetic scenes built through the `Scene` API, so it runs under plain CPython without Blender.
+# Each case is timed as the best of `--repeat` runs, then run once more under tracemalloc for its peak memory.
+#
+#   python benchmark_struct.py --vertices 100000 --keys 500 --output result.json
+#   python benchmark_struct.py --baseline result.json --max-regression 0.2
+#
+# With a baseline, the exit code is 1 if any case got slower than the baseline by more than the ratio.
+
+
+class SceneSize:
+    def __init__(
+        self,
+        meshes: int = 4,
+        vertices: int = 20000,
+        joints: int = 32,
+        skeletons: int = 1,
+        actions: int = 4,
+        keys: int = 200,
+        actors: int = 200,
+        lights: int = 50,
+    ):
+        self.meshes = int(meshes)
+        self.vertices = int(vertices)
+        self.joints = int(joints)
+        self.skeletons = int(skeletons)
+        self.actions = int(actions)
+        self.keys = int(keys)
+        self.actors = int(actors)
+        self.lights = int(lights)
+
+    def make_json(self) -> Dict:
+        return dict(vars(self))
+
+
+class CaseResult:
+    def __init__(self, name: str, seconds: float, peak_bytes: int, work: Dict[str, float]):
+        self.name = str(name)
+        self.seconds = float(seconds)
+        self.peak_bytes = int(peak_bytes)
+        # Unit -> amount processed by a run, such as vertices or bytes
+        self.work = dict(work)
+
+    def get_throughput(self, unit: str) -> float:
+        return self.work[unit] / self.seconds if self.seconds > 0.0 else math.inf
+
+    def make_json(self) -> Dict:
+        return {
+            "seconds": self.seconds,
+            "peak bytes": self.peak_bytes,
+            "throughput": {unit: self.get_throughput(unit) for unit in self.work.keys()},
+        }
+
+
+# Vertices are spread over the meshes, and each mesh is split into two materials like most real meshes
+def make_synthetic_scene(size: SceneSize, seed: int = 0) -> dst.Scene:
+    rng = random.Random(seed)
+    scene = dst.Scene()
+    scene.name = "synthetic"
+
+    skeleton_names = []
+    for i in range(size.skeletons):
+        skeleton = scene.new_skeleton(f"skeleton{i}")
+        skeleton_names.append(skeleton.name)
+        for j in range(size.joints):
+            joint = skeleton.new_joint(f"joint{j}")
+            if j > 0:
+                joint.parent_name = f"joint{rng.randrange(j)}"
+
+    for i in range(size.meshes):
+        mesh = scene.new_mesh()
+        mesh.name = f"mesh{i}"
+        mesh.skeleton_name = skeleton_names[i % len(skeleton_names)] if skeleton_names else ""
+
+        for k in range(size.vertices // max(1, size.meshes)):
+            v = mesh.new_vertex("material{}".format(k % 2))
+            v.position.x = rng.uniform(-10.0, 10.0)
+            v.position.y = rng.uniform(-10.0, 10.0)
+            v.position.z = rng.uniform(-10.0, 10.0)
+            v.uv_coord.x = rng.random()
+            v.uv_coord.y = rng.random()
+            v.normal.x = 0.0
+            v.normal.y = 0.0
+            v.normal.z = 1.0
+            v.tangent.x = 1.0
+            v.tangent.y = 0.0
+            v.tangent.z = 0.0
+            if size.joints > 0 and skeleton_names:
+                for _ in range(rng.randint(1, 4)):
+                    v.add_joint(rng.randrange(size.joints), rng.random())
+
+    for i in range(size.actions):
+        anim = scene.new_animation(f"action{i}", 24.0)
+        for j in range(size.joints):
+            joint_name = f"joint{j}"
+            for t in range(size.keys):
+                for c in range(3):
+                    anim.add(joint_name, "location", float(t), c, math.sin(t * 0.1 + j + c))
+                angle = t * 0.05 + j
+                for c, value in enumerate((math.cos(angle), math.sin(angle), 0.0, 0.0)):
+                    anim.add(joint_name, "rotation_quaternion", float(t), c, value)
+                for c in range(3):
+                    anim.add(joint_name, "scale", float(t), c, 1.0)
+
+    for i in range(size.actors):
+        actor = scene.new_mesh_actor()
+        actor.name = f"actor{i}"
+        if size.meshes > 0:
+            actor.mesh_name = f"mesh{i % size.meshes}"
+        actor.pos = smt.Vec3(rng.uniform(-100, 100), 0.0, rng.uniform(-100, 100))
+
+    for i in range(size.lights):
+        light = scene.new_plight()
+        light.name = f"light{i}"
+        light.max_distance = 10.0
+
+    return scene
+
+
+def _run_case(name: str, function: Callable[[], Dict[str, float]], repeat: int) -> CaseResult:
+    best = math.inf
+    work = {}
+    for _ in range(max(1, repeat)):
+        st = time.perf_counter()
+        work = function()
+        best = min(best, time.perf_counter() - st)
+
+    tracemalloc.start()
+    try:
+        function()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return CaseResult(name, best, peak_bytes, work)
+
+
+def run_benchmarks(size: SceneSize, repeat: int = 3, seed: int = 0) -> List[CaseResult]:
+    scene = make_synthetic_scene(size, seed)
+    vertex_buffers = [x for x in scene.iter_encodables() if isinstance(x, dst.VertexBuffer)]
+    animations = [x for x in scene.iter_encodables() if isinstance(x, dst.Animation)]
+    vertex_count = sum(x.vertex_count for x in vertex_buffers)
+    key_count = sum(x.get_key_count() for x in animations)
+
+    def encode_vertex_buffers():
+        bin_arr = dst.BinaryArrayBuilder()
+        for x in vertex_buffers:
+            x.make_json({}, bin_arr)
+        return {"vertices": vertex_count, "bytes": bin_arr.size}
+
+    def encode_animations():
+        bin_arr = dst.BinaryArrayBuilder()
+        for x in animations:
+            x.make_json(bin_arr)
+        return {"keys": key_count, "bytes": bin_arr.size}
+
+    def make_scene_json():
+        bin_arr = dst.BinaryArrayBuilder()
+        scene.make_json(bin_arr)
+        return {"vertices": vertex_count, "keys": key_count, "bytes": bin_arr.size}
+
+    bin_arr = dst.BinaryArrayBuilder()
+    scene.make_json(bin_arr)
+    bin_data = bin_arr.data
+
+    def compress():
+        zlib.compress(bin_data, zlib.Z_BEST_COMPRESSION)
+        return {"bytes": len(bin_data)}
+
+    return [
+        _run_case("VertexBuffer.make_json", encode_vertex_buffers, repeat),
+        _run_case("Animation.make_json", encode_animations, repeat),
+        _run_case("Scene.make_json", make_scene_json, repeat),
+        _run_case("zlib.compress", compress, repeat),
+    ]
+
+
+def format_results(results: List[CaseResult]) -> str:
+    lines = [f"{'Case':<24} {'Time (s)':>10} {'Peak (MB)':>10}  Throughput"]
+    for x in results:
+        throughput = ", ".join(
+            f"{x.get_throughput(unit) / 1e6:.2f} M{unit}/s" for unit in x.work.keys()
+        )
+        lines.append(f"{x.name:<24} {x.seconds:>10.4f} {x.peak_bytes / 1e6:>10.2f}  {throughput}")
+    return "\n".join(lines) + "\n"
+
+
+# Returns messages of cases slower than the baseline by more than `max_regression`, as a ratio of the baseline time
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    output = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        base_seconds = baseline[name]["seconds"]
+        if base_seconds > 0.0 and result["seconds"] > base_seconds * (1.0 + max_regression):
+            output.append(
+                f"{name}: {result['seconds']:.4f} s, baseline {base_seconds:.4f} s "
+                f"({(result['seconds'] / base_seconds - 1.0) * 100.0:+.1f}%)"
+            )
+    return output
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Dict]]:
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return json.load(file)["cases"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def __parse_args():
+    defaults = SceneSize()
+    parser = argparse.ArgumentParser(description="Benchmark encoding of synthetic scenes without Blender.")
+
+    for key, value in defaults.make_json().items():
+        parser.add_argument(f"--{key}", type=int, default=value, help=f"Number of {key} in the scene")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each case, of which the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0, help="")
+    parser.add_argument("--output", type=str, default="", help="Path of a JSON file to write the results into")
+    parser.add_argument("--baseline", type=str, default="", help="Path of a JSON file of previous results")
+    parser.add_argument(
+        "--max-regression",
+        dest="max_regression",
+        type=float,
+        default=0.2,
+        help="Slowdown against the baseline, as a ratio of its time, that fails the run"
+    )
+
+    return parser.parse_args()
+
+
+def __cmd_benchmark() -> int:
+    args = __parse_args()
+    size = SceneSize(**{k: getattr(args, k) for k in SceneSize().make_json().keys()})
+
+    results = run_benchmarks(size, args.repeat, args.seed)
+    print(format_results(results), end="")
+
+    output = {
+        "python": sys.version,
+        "scene size": size.make_json(),
+        "cases": {x.name: x.make_json() for x in results},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(output, file, indent=4)
+
+    if args.baseline:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"Failed to read baseline: {args.baseline}")
+            return 1
+
+        regressions = find_regressions(output["cases"], baseline, args.max_regression)
+        for x in regressions:
+            print(f"Regression: {x}")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if "__main__" == __name__:
+    sys.exit(__cmd_benchmark())
@@ -1,25 +1,68 @@
+import os
 import enum
 import math
 import time
-from typing import Optional, Tuple, List, Dict
+import multiprocessing
+import concurrent.futures
+from typing import Optional, Tuple, List, Dict, Set
 
 import bpy
 
 from . import smalltype as smt
 from . import data_struct as dst
+from . import timing as tmg
+from . import memory_profile as mpf
+from . import progress as prg
+from . import encode_pipeline as epl
 
 
 _TO_DEGREE = 180.0 / math.pi
 
+# Cancellation is checked once per this many triangles while a mesh is extracted
+_CANCEL_CHECK_TRIANGLES = 4096
+
+# Encoded items of the pipeline waiting to be committed, per worker
+_PIPELINE_PENDING_PER_WORKER = 2
+
+
+class EncodeExecutor(enum.Enum):
+    serial = "SERIAL"
+    thread = "THREAD"
+    process = "PROCESS"
+    # Encodes in processes while parsing, and builds and compresses the binary on another thread. See encode_pipeline.
+    pipeline = "PIPELINE"
+
 
 class ParseConfigs:
     def __init__(
         self,
         exclude_hidden_meshes: bool = False,
         exclude_hidden_objects: bool = False,
+        reduce_keyframes: bool = False,
+        reduce_pos_tolerance: float = 0.0001,
+        reduce_rot_tolerance: float = 0.0001,
+        reduce_scale_tolerance: float = 0.0001,
+        rotation_layout: dst.RotationLayout = dst.RotationLayout.triplets,
+        only_relevant_actions: bool = False,
+        encode_executor: EncodeExecutor = EncodeExecutor.serial,
+        encode_workers: int = 0,
+        anim_block_seconds: float = 0.0,
     ):
         self.__exclude_hidden_meshes = bool(exclude_hidden_meshes)
         self.__exclude_hidden_objects = bool(exclude_hidden_objects)
+        self.__reduce_keyframes = bool(reduce_keyframes)
+        self.__reduce_pos_tolerance = float(reduce_pos_tolerance)
+        self.__reduce_rot_tolerance = float(reduce_rot_tolerance)
+        self.__reduce_scale_tolerance = float(reduce_scale_tolerance)
+
+        assert isinstance(rotation_layout, dst.RotationLayout)
+        self.__rotation_layout = rotation_layout
+        self.__only_relevant_actions = bool(only_relevant_actions)
+
+        assert isinstance(encode_executor, EncodeExecutor)
+        self.__encode_executor = encode_executor
+        self.__encode_workers = int(encode_workers)
+        self.__anim_block_seconds = float(anim_block_seconds)
 
     @property
     def exclude_hidden_meshes(self):
@@ -29,6 +72,45 @@ class ParseConfigs:
     def exclude_hidden_objects(self):
         return self.__exclude_hidden_objects
 
+    @property
+    def reduce_keyframes(self):
+        return self.__reduce_keyframes
+
+    @property
+    def reduce_pos_tolerance(self):
+        return self.__reduce_pos_tolerance
+
+    # In radians
+    @property
+    def reduce_rot_tolerance(self):
+        return self.__reduce_rot_tolerance
+
+    @property
+    def reduce_scale_tolerance(self):
+        return self.__reduce_scale_tolerance
+
+    @property
+    def rotation_layout(self):
+        return self.__rotation_layout
+
+    @property
+    def only_relevant_actions(self):
+        return self.__only_relevant_actions
+
+    @property
+    def encode_executor(self):
+        return self.__encode_executor
+
+    # 0 means as many as CPU cores
+    @property
+    def encode_workers(self):
+        return self.__encode_workers if self.__encode_workers > 0 else (os.cpu_count() or 1)
+
+    # Animations are written in the seekable blocked layout if it is greater than 0
+    @property
+    def anim_block_seconds(self):
+        return self.__anim_block_seconds
+
 
 class ObjType(enum.Enum):
     unknown = "UNKNOWN"
@@ -189,8 +271,12 @@ def __parse_mesh(obj, mesh: dst.Mesh, skeleton: Optional[dst.Skeleton]):
         mesh.skeleton_name = ""
 
     mesh.name = obj_mesh.name
+    tmg.count("triangles", len(obj_mesh.loop_triangles))
+
+    for tri_index, tri in enumerate(obj_mesh.loop_triangles):
+        if 0 == tri_index % _CANCEL_CHECK_TRIANGLES:
+            prg.check_cancelled()
 
-    for tri in obj_mesh.loop_triangles:
         try:
             material_name = obj.data.materials[tri.material_index].name
         except IndexError:
@@ -240,6 +326,8 @@ def __parse_mesh(obj, mesh: dst.Mesh, skeleton: Optional[dst.Skeleton]):
                 else:
                     dst_vertex.add_joint(joint_index, g.weight)
 
+    tmg.count("vertices", mesh.vertex_count)
+
 
 def __parse_actor(obj, actor: dst.IActor):
     actor.name = obj.name
@@ -273,6 +361,8 @@ def __parse_armature(obj, skeleton: dst.Skeleton):
 
         joint.offset_mat.set_blender_mat(bone.matrix_local)
 
+    tmg.count("joints", len(obj.data.bones))
+
 
 # var_name is either location, rotation_quaternion or scale
 # The `path` looks something like these:
@@ -288,7 +378,8 @@ def __split_fcu_data_path(path: str) -> Tuple[str, str]:
     return bone_name, var_name
 
 
-def __parse_animation(bpy_action, anim: dst.Animation):
+# If `joint_names` is given, F-curves of other bones are dropped before their keyframes are read.
+def __parse_animation(bpy_action, anim: dst.Animation, joint_names: Optional[Set[str]] = None):
     assert isinstance(bpy_action, bpy.types.Action)
 
     for fcu in bpy_action.fcurves:
@@ -298,6 +389,9 @@ def __parse_animation(bpy_action, anim: dst.Animation):
             print(f"Failed to parse FCU data path: {fcu.data_path}")
             continue
 
+        if (joint_names is not None) and (joint_name not in joint_names):
+            continue
+
         # channel stands for x, y, z for locations, w, x, y, z for quat, x, y, z for scale.
         channel = fcu.array_index
 
@@ -307,7 +401,102 @@ def __parse_animation(bpy_action, anim: dst.Animation):
             anim.add(joint_name, var_name, time_point, channel, value)
 
 
-def __parse_mesh_actor(obj, scene: dst.Scene):
+def __gen_action_joint_names(bpy_action):
+    for fcu in bpy_action.fcurves:
+        try:
+            joint_name, var_name = __split_fcu_data_path(fcu.data_path)
+        except IndexError:
+            continue
+        yield joint_name
+
+
+# Action name -> names of the armatures that have the action assigned
+def __make_action_binding_map(bpy_scene) -> Dict[str, Set[str]]:
+    output: Dict[str, Set[str]] = {}
+
+    for obj in bpy_scene.objects:
+        if "ARMATURE" != obj.type:
+            continue
+        if (obj.animation_data is None) or (obj.animation_data.action is None):
+            continue
+
+        output.setdefault(obj.animation_data.action.name, set()).add(obj.name)
+
+    return output
+
+
+# Returns names of joints the action may animate in the scene, or None if no skeleton in the scene is relevant.
+# An action is relevant to the skeletons it is bound to, or failing that, the ones any of its bone paths matches.
+def __find_relevant_joint_names(
+    bpy_action,
+    joint_maps: Dict[str, Dict[str, int]],
+    binding_map: Dict[str, Set[str]],
+) -> Optional[Set[str]]:
+    bound_skeletons = [x for x in binding_map.get(bpy_action.name, set()) if x in joint_maps.keys()]
+
+    if bound_skeletons:
+        skeleton_names = bound_skeletons
+    else:
+        action_joint_names = set(__gen_action_joint_names(bpy_action))
+        skeleton_names = [
+            skel_name for skel_name, joint_map in joint_maps.items()
+            if not action_joint_names.isdisjoint(joint_map.keys())
+        ]
+
+    if not skeleton_names:
+        return None
+
+    output = set()
+    for skel_name in skeleton_names:
+        output.update(joint_maps[skel_name].keys())
+    return output
+
+
+def __parse_animations(bpy_scene, scene: dst.Scene, configs: ParseConfigs):
+    scene.actions_filtered = configs.only_relevant_actions
+    if configs.only_relevant_actions:
+        joint_maps = {x.name: x.make_name_index_map() for x in scene.skeletons}
+        binding_map = __make_action_binding_map(bpy_scene)
+
+    for action in bpy.data.actions:
+        if configs.only_relevant_actions:
+            joint_names = __find_relevant_joint_names(action, joint_maps, binding_map)
+            if joint_names is None:
+                scene.ignored_actions.new(action.name, 'Not bound to nor matching any skeleton in the scene')
+                continue
+        else:
+            joint_names = None
+
+        with tmg.span("animation", action.name):
+            st = time.time()
+            anim = scene.new_animation(action.name, bpy.context.scene.render.fps)
+            anim.rotation_layout = configs.rotation_layout
+            anim.block_duration = configs.anim_block_seconds * bpy.context.scene.render.fps
+            __parse_animation(action, anim, joint_names)
+            tmg.count("animation keys", anim.get_key_count())
+            print(f"[DAL] Animation parsed: '{anim.name}' ({time.time() - st:.3f})")
+
+            if configs.reduce_keyframes:
+                __reduce_animation_keys(anim, configs)
+
+
+def __reduce_animation_keys(anim: dst.Animation, configs: ParseConfigs):
+    st = time.time()
+    with tmg.span("key reduction", anim.name):
+        stats = anim.reduce_keys(
+            configs.reduce_pos_tolerance,
+            configs.reduce_rot_tolerance,
+            configs.reduce_scale_tolerance,
+        )
+    tmg.count("animation keys removed", stats.keys_before - stats.keys_after)
+    print(
+        f"[DAL] Animation keys reduced: '{anim.name}' {stats.keys_before} -> {stats.keys_after} "
+        f"(max error: pos={stats.max_pos_error:.6f}, rot={stats.max_rot_error * _TO_DEGREE:.4f} deg, "
+        f"scale={stats.max_scale_error:.6f}) ({time.time() - st:.3f})"
+    )
+
+
+def __parse_mesh_actor(obj, scene: dst.Scene, pipeline: Optional[epl.EncodePipeline]):
     actor = scene.new_mesh_actor()
     __parse_actor(obj, actor)
     actor.mesh_name = obj.data.name
@@ -321,7 +510,8 @@ def __parse_mesh_actor(obj, scene: dst.Scene):
             skeleton = scene.find_skeleton_by_name(armature.name)
         else:
             skeleton = scene.new_skeleton(armature.name)
-            __parse_armature(armature, skeleton)
+            with tmg.span("skeleton parse", armature.name):
+                __parse_armature(armature, skeleton)
     else:
         skeleton = None
 
@@ -346,7 +536,11 @@ def __parse_mesh_actor(obj, scene: dst.Scene):
     except KeyError:
         st = time.time()
         mesh = scene.new_mesh()
-        __parse_mesh(obj, mesh, skeleton)
+        with tmg.span("mesh extract", actor.mesh_name):
+            __parse_mesh(obj, mesh, skeleton)
+        prg.add("meshes")
+        if pipeline is not None:
+            pipeline.submit_mesh(mesh)
         print(f"[DAL] Mesh parsed: '{mesh.name}' ({time.time() - st:.3f})")
 
 
@@ -395,7 +589,8 @@ def __parse_light_spot(obj, slight: dst.Spotlight):
 
 def __parse_water_plane(obj, water_plane: dst.WaterPlane):
     __parse_actor(obj, water_plane)
-    __parse_mesh(obj, water_plane.mesh, None)
+    with tmg.span("mesh extract", obj.data.name):
+        __parse_mesh(obj, water_plane.mesh, None)
 
 
 def __parse_env_map(obj, env_map: dst.EnvironmentMap):
@@ -449,61 +644,157 @@ def __classify_object_type(obj):
     return ObjType.unknown
 
 
-def __parse_scene(bpy_scene, configs: ParseConfigs) -> dst.Scene:
+def __parse_object(obj, scene: dst.Scene, configs: ParseConfigs, pipeline: Optional[epl.EncodePipeline]):
+    obj_type = __classify_object_type(obj)
+
+    if obj_type == ObjType.mesh:
+        if not obj.visible_get() and configs.exclude_hidden_meshes:
+            scene.ignored_objects.new(obj.name, 'Hidden mesh')
+        else:
+            __parse_mesh_actor(obj, scene, pipeline)
+    elif obj_type == ObjType.emtpy:
+        __parse_actor(obj, scene.new_mesh_actor())
+
+    elif obj_type == ObjType.directional_light:
+        __parse_light_directional(obj, scene.new_dlight())
+    elif obj_type == ObjType.point_light:
+        __parse_light_point(obj, scene.new_plight())
+    elif obj_type == ObjType.spotlight:
+        __parse_light_spot(obj, scene.new_slight())
+    elif obj_type == ObjType.water_plane:
+        __parse_water_plane(obj, scene.new_water_plane())
+    elif obj_type == ObjType.env_map:
+        __parse_env_map(obj, scene.new_env_map())
+
+    else:
+        scene.ignored_objects.new(obj.name, f'Not supported object type: {obj_type}, {obj.type}')
+
+
+def __iter_parse_scene(bpy_scene, configs: ParseConfigs, pipeline: Optional[epl.EncodePipeline]):
     scene = dst.Scene()
     scene.name = bpy_scene.name
 
-    for action in bpy.data.actions:
-        st = time.time()
-        anim = scene.new_animation(action.name, bpy.context.scene.render.fps)
-        __parse_animation(action, anim)
-        print(f"[DAL] Animation parsed: '{anim.name}' ({time.time() - st:.3f})")
-
     for obj in bpy_scene.objects:
+        prg.check_cancelled()
+        prg.advance()
         if not obj.visible_get() and configs.exclude_hidden_objects:
             scene.ignored_objects.new(obj.name, 'Hidden object')
             continue
-        obj_type = __classify_object_type(obj)
 
-        if obj_type == ObjType.mesh:
-            if not obj.visible_get() and configs.exclude_hidden_meshes:
-                scene.ignored_objects.new(obj.name, 'Hidden mesh')
-            else:
-                __parse_mesh_actor(obj, scene)
-        elif obj_type == ObjType.emtpy:
-            __parse_actor(obj, scene.new_mesh_actor())
-
-        elif obj_type == ObjType.directional_light:
-            __parse_light_directional(obj, scene.new_dlight())
-        elif obj_type == ObjType.point_light:
-            __parse_light_point(obj, scene.new_plight())
-        elif obj_type == ObjType.spotlight:
-            __parse_light_spot(obj, scene.new_slight())
-        elif obj_type == ObjType.water_plane:
-            __parse_water_plane(obj, scene.new_water_plane())
-        elif obj_type == ObjType.env_map:
-            __parse_env_map(obj, scene.new_env_map())
+        with tmg.span("object", obj.name):
+            __parse_object(obj, scene, configs, pipeline)
+        prg.add("objects")
+        yield
 
-        else:
-            scene.ignored_objects.new(obj.name, f'Not supported object type: {obj_type}, {obj.type}')
+    # Skeletons of the scene are known only after its objects are parsed
+    with tmg.span("animations"):
+        __parse_animations(bpy_scene, scene, configs)
 
     return scene
 
 
-def parse_scenes(configs: ParseConfigs) -> Tuple[List[dst.Scene], dst.BinaryArrayBuilder]:
+# Meshes and actions are submitted to `pipeline`, if given, as soon as they are parsed
+def parse_scenes(
+    configs: ParseConfigs,
+    pipeline: Optional[epl.EncodePipeline] = None,
+) -> Tuple[List[dst.Scene], dst.BinaryArrayBuilder]:
+    return prg.run_steps(iter_parse_scenes(configs, pipeline))
+
+
+# Generator of `parse_scenes`, which yields after each object so that Blender data can be read in time slices between
+# UI events. Returns the scenes and the binary array builder.
+def iter_parse_scenes(configs: ParseConfigs, pipeline: Optional[epl.EncodePipeline] = None):
     output = []
-    bin_arr = dst.BinaryArrayBuilder()
+    bin_arr = pipeline.bin_arr if pipeline is not None else dst.BinaryArrayBuilder()
+    prg.begin_stage("parse", sum(len(x.objects) for x in bpy.data.scenes))
 
     for bpy_scene in bpy.data.scenes:
-        scene = __parse_scene(bpy_scene, configs)
+        with tmg.span("scene parse", bpy_scene.name):
+            scene = yield from __iter_parse_scene(bpy_scene, configs, pipeline)
+        # Actions and water planes come after all meshes in the binary
+        if pipeline is not None:
+            pipeline.submit_scene(scene)
         output.append(scene)
 
     return output, bin_arr
 
 
-def build_json(scenes: List[dst.Scene], bin_arr: dst.BinaryArrayBuilder, configs: ParseConfigs) -> Tuple[Dict, bytes]:
-    output = {
-        "scenes": [xx.make_json(bin_arr) for xx in scenes],
-    }
+# Returns None unless the encode executor is the pipeline. The pipeline must be joined by `build_json` or cancelled.
+def make_encode_pipeline(configs: ParseConfigs, compress_level: Optional[int]) -> Optional[epl.EncodePipeline]:
+    if EncodeExecutor.pipeline != configs.encode_executor:
+        return None
+
+    return epl.EncodePipeline(
+        configs.encode_workers,
+        configs.encode_workers * _PIPELINE_PENDING_PER_WORKER,
+        compress_level,
+    )
+
+
+# Encoding does not touch bpy, so it can run in a worker pool. Results are handed back to each object in a fixed order
+# and appended to the binary by `make_json` as usual, so the output is identical to the serial run.
+def __encode_in_parallel(scenes: List[dst.Scene], configs: ParseConfigs):
+    items = [x for scene in scenes for x in scene.iter_encodables()]
+    if not items:
+        return
 
-    return output, bin_arr.data
+    st = time.time()
+
+    if configs.encode_executor in (EncodeExecutor.process, EncodeExecutor.pipeline):
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=configs.encode_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=configs.encode_workers)
+
+    prg.begin_stage("encode", len(items))
+    with tmg.span("parallel encode"), executor:
+        futures = [executor.submit(*x.make_encode_task()) for x in items]
+        try:
+            for item, future in zip(items, futures):
+                prg.check_cancelled()
+                item.set_encoded(future.result())
+                prg.advance()
+        except prg.ExportCancelled:
+            # Items not started yet are dropped, instead of waiting for all of them when leaving the executor
+            for future in futures:
+                future.cancel()
+            raise
+    tmg.count("encoded items", len(items))
+
+    print(f"[DAL] Encoded {len(items)} items with {configs.encode_workers} workers ({time.time() - st:.3f})")
+
+
+def build_json(
+    scenes: List[dst.Scene],
+    bin_arr: dst.BinaryArrayBuilder,
+    configs: ParseConfigs,
+    pipeline: Optional[epl.EncodePipeline] = None,
+) -> Tuple[Dict, bytes]:
+    if pipeline is not None:
+        prg.begin_stage("encode", 1)
+        with tmg.span("pipeline wait"), mpf.stage("pipeline wait"):
+            pipeline.join()
+        prg.advance()
+    elif EncodeExecutor.serial != configs.encode_executor:
+        with mpf.stage("parallel encode"):
+            __encode_in_parallel(scenes, configs)
+
+    prg.begin_stage("build", sum(1 for scene in scenes for _ in scene.iter_encodables()))
+    with tmg.span("json build"), mpf.stage("json build"):
+        output = {
+            "scenes": [xx.make_json(bin_arr) for xx in scenes],
+        }
+
+    for scene_json in output["scenes"]:
+        for anim_json in scene_json["animations"]:
+            if "max rotation decode error degrees" in anim_json:
+                error = anim_json["max rotation decode error degrees"]
+                layout = anim_json["rotation layout"]
+                print(f"[DAL] Rotations packed: '{anim_json['name']}' {layout} (max decode error: {error:.4f} deg)")
+
+    with tmg.span("binary copy"), mpf.stage("binary copy"):
+        bin_data = bin_arr.data
+
+    return output, bin_data
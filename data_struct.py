@@ -1,10 +1,14 @@
 import enum
+import math
 import array
+import bisect
 import struct
-from typing import List, Dict, Union, Tuple, Any, Set
+from typing import List, Dict, Union, Tuple, Any, Set, Optional, Callable
 
-from . import byteutils as byt
 from . import smalltype as smt
+from . import anim_compress as acp
+from . import timing as tmg
+from . import progress as prg
 
 
 class NameRegistry:
@@ -20,10 +24,45 @@ class NameRegistry:
         else:
             self.__registry[name] = obj
 
+    # Returns the object registered with the name, which may have been renamed since, or None
+    def find(self, name: str) -> Any:
+        return self.__registry.get(name)
+
+
+# Name -> objects with the name in the order they were added, kept up to date by the objects as they are renamed, so
+# that `find` returns the first one added like a linear scan of them would
+class NameIndex:
+    def __init__(self):
+        self.__buckets: Dict[str, List[Any]] = {}
+        self.__orders: Dict[int, int] = {}
+
+    def add(self, obj: Any, name: str):
+        self.__orders[id(obj)] = len(self.__orders)
+        self.__buckets.setdefault(str(name), []).append(obj)
+
+    def rename(self, obj: Any, old_name: str, new_name: str):
+        bucket = self.__buckets[old_name]
+        bucket.remove(obj)
+        if not bucket:
+            del self.__buckets[old_name]
+
+        bucket = self.__buckets.setdefault(new_name, [])
+        order = self.__orders[id(obj)]
+        index = len(bucket)
+        while index > 0 and self.__orders[id(bucket[index - 1])] > order:
+            index -= 1
+        bucket.insert(index, obj)
+
+    def find(self, name: str) -> Any:
+        bucket = self.__buckets.get(str(name))
+        return bucket[0] if bucket else None
+
 
 class BinaryArrayBuilder:
     def __init__(self):
         self.__data = bytearray()
+        # Kind, name, position and size of data added for each object, to attribute the output size to objects
+        self.__blocks: List[Tuple[str, str, int, int]] = []
 
     @property
     def data(self):
@@ -53,6 +92,46 @@ class BinaryArrayBuilder:
         end_index = len(self.__data)
         return start_index, end_index - start_index
 
+    # Copy of data added since `start_index`
+    def get_tail(self, start_index: int) -> bytes:
+        return bytes(self.__data[start_index:])
+
+    # Data added since `start_index` belongs to the object
+    def mark_block(self, kind: str, name: str, start_index: int):
+        if len(self.__data) > start_index:
+            self.__blocks.append((kind, name, start_index, len(self.__data) - start_index))
+
+    @property
+    def blocks(self):
+        return iter(self.__blocks)
+
+
+# Encodes the plain arrays of `VertexBuffer.extract`. Module level, like the other functions of encode tasks, so that
+# worker processes can unpickle it.
+def encode_vertex_arrays(arrays: Tuple[array.array, ...]) -> List[Tuple[bytes, str]]:
+    positions, uv_coordinates, normals, tangents, joint_counts, joint_indices, joint_weights = arrays
+
+    # For each vertex, int32 joint count followed by int32 index and float32 weight of each joint, heaviest first
+    joints = bytearray()
+    begin = 0
+    for count in joint_counts:
+        end = begin + count
+        pairs = sorted(zip(joint_weights[begin:end], joint_indices[begin:end]), reverse=True)
+        joints += struct.pack("<i" + "if" * count, count, *[x for weight, index in pairs for x in (index, weight)])
+        begin = end
+
+    return [
+        (positions.tobytes(), "vertices binary data"),
+        (uv_coordinates.tobytes(), "uv coordinates binary data"),
+        (normals.tobytes(), "normals binary data"),
+        (tangents.tobytes(), "tangents binary data"),
+        (bytes(joints), "joints binary data"),
+    ]
+
+
+def encode_animation_data(data: Tuple) -> Tuple[bytes, float]:
+    return Animation.from_extracted(data).encode()
+
 
 class IActor:
     def __init__(self, name_reg: NameRegistry):
@@ -179,26 +258,68 @@ class Vertex:
 class VertexBuffer:
     def __init__(self):
         self.__vertices: List[Vertex] = []
+        self.__encoded = None
+        self.__committed = None
 
     def make_json(self, output: Dict, bin_arr: BinaryArrayBuilder):
-        positions, uv_coordinates, normals, tangents = self.__make_arrays()
-        joints = self.__make_joints_binary_array()
-
-        binary_arrays = [
-            (positions.tobytes(), "vertices binary data"),
-            (uv_coordinates.tobytes(), "uv coordinates binary data"),
-            (normals.tobytes(), "normals binary data"),
-            (tangents.tobytes(), "tangents binary data"),
-            (joints, "joints binary data"),
-        ]
+        prg.check_cancelled()
+        if self.__committed is None:
+            if self.__encoded is not None:
+                binary_arrays = self.__encoded
+                self.__encoded = None
+            else:
+                binary_arrays = self.encode()
+            self.commit(binary_arrays, bin_arr)
 
         output["vertex count"] = len(self.__vertices)
-        for binary_data, field_name in binary_arrays:
-            pos, size = bin_arr.add_bin_array(binary_data)
+        for field_name, pos, size in self.__committed:
             output[field_name] = {
                 "position": pos,
                 "size": size,
             }
+        self.__committed = None
+        prg.advance()
+
+    def encode(self) -> List[Tuple[bytes, str]]:
+        return encode_vertex_arrays(self.extract())
+
+    # Function and argument for a worker pool to encode with. The argument is plain arrays, because pickling the
+    # vertices themselves for a worker process costs more than encoding them.
+    def make_encode_task(self) -> Tuple[Callable, Tuple]:
+        return encode_vertex_arrays, self.extract()
+
+    # Vertex attributes as flat arrays, and joints as a count per vertex followed by the indices and weights of all
+    def extract(self) -> Tuple[array.array, ...]:
+        positions, uv_coordinates, normals, tangents = self.__make_arrays()
+
+        joint_counts = array.array("i")
+        joint_indices = array.array("i")
+        # Double rather than float, so that the order of joints is decided with the original weights
+        joint_weights = array.array("d")
+        for v in self.__vertices:
+            joint_counts.append(v.joint_count)
+            for weight, index in v.joints:
+                joint_indices.append(index)
+                joint_weights.append(weight)
+
+        return positions, uv_coordinates, normals, tangents, joint_counts, joint_indices, joint_weights
+
+    # Result of `encode` computed in advance, possibly by another process, to be used by the next `make_json`
+    def set_encoded(self, encoded: List[Tuple[bytes, str]]):
+        self.__encoded = encoded
+
+    # Appends the result of `encode` to the binary in advance, to be referred by the next `make_json`
+    def commit(self, encoded: List[Tuple[bytes, str]], bin_arr: BinaryArrayBuilder):
+        self.__committed = []
+        for binary_data, field_name in encoded:
+            pos, size = bin_arr.add_bin_array(binary_data)
+            tmg.count("binary bytes", size)
+            prg.add("bytes", size)
+            self.__committed.append((field_name, pos, size))
+
+    @property
+    def vertex_count(self):
+        return len(self.__vertices)
 
     def new_vertex(self):
         vertex = Vertex()
@@ -230,30 +351,28 @@ class VertexBuffer:
 
         return positions, uv_coordinates, normals, tangents
 
-    def __make_joints_binary_array(self) -> bytearray:
-        output = bytearray()
-        for v in self.__vertices:
-            v.sort_joints()
-            output += byt.to_int32(v.joint_count)
-            for j_weight, j_index in v.joints:
-                output += byt.to_int32(j_index)
-                output += byt.to_float32(j_weight)
-        return output
-
 
 class Mesh:
-    def __init__(self):
+    # Meshes of a scene keep `name_index` of the scene up to date as they are renamed
+    def __init__(self, name_index: Optional[NameIndex] = None):
         self.__name = ""
         self.__skeleton_name = ""
         self.__vertices: Dict[str, VertexBuffer] = {}
 
+        self.__name_index = name_index
+        if name_index is not None:
+            name_index.add(self, self.__name)
+
     def make_json(self, output: List[Dict], bin_arr: BinaryArrayBuilder):
         for material_name, vertex_buffer in self.__vertices.items():
             output.append({
                 "name": self.get_mangled_name(material_name),
                 "skeleton name": self.skeleton_name,
             })
-            vertex_buffer.make_json(output[-1], bin_arr)
+            start_index = bin_arr.size
+            with tmg.span("mesh encode", self.name):
+                vertex_buffer.make_json(output[-1], bin_arr)
+            bin_arr.mark_block("mesh", self.name, start_index)
 
     def new_vertex(self, material_name: str):
         if material_name not in self.__vertices.keys():
@@ -271,13 +390,20 @@ class Mesh:
     def vertex_buffers(self):
         return self.__vertices.items()
 
+    @property
+    def vertex_count(self):
+        return sum(x.vertex_count for x in self.__vertices.values())
+
     @property
     def name(self):
         return self.__name
 
     @name.setter
     def name(self, value):
+        old_name = self.__name
         self.__name = str(value)
+        if self.__name_index is not None:
+            self.__name_index.rename(self, old_name, self.__name)
 
     @property
     def skeleton_name(self):
@@ -400,11 +526,13 @@ JOINT_TYPE_MAP: Dict[JointType, str] = {
 
 
 class SkelJoint:
-    def __init__(self, name: str):
+    # `on_hierarchy_changed` is called when the parent changes, for the skeleton to sort its joints again
+    def __init__(self, name: str, on_hierarchy_changed: Optional[Callable[[], None]] = None):
         self.__name = str(name)
         self.__parent_name = ""
         self.__type = JointType.basic
         self.__offset_mat = smt.Mat4x4()
+        self.__on_hierarchy_changed = on_hierarchy_changed
 
     def make_json(self):
         return {
@@ -425,6 +553,8 @@ class SkelJoint:
     @parent_name.setter
     def parent_name(self, value):
         self.__parent_name = str(value)
+        if self.__on_hierarchy_changed is not None:
+            self.__on_hierarchy_changed()
 
     @property
     def joint_type(self):
@@ -440,31 +570,44 @@ class SkelJoint:
         return self.__offset_mat
 
 
+# Joints are exported in topological order, parents before their children, along with the index of the parent of each
+# joint, or -1 for roots, so that the runtime needs not resolve parent names. Joints already in topological order keep
+# the order they were added in. Parents not in the skeleton are treated as absent.
+# Joint indices referred by vertices are those of the exported order, given by `make_name_index_map`.
 class Skeleton:
     def __init__(self, name: str):
         self.__name = str(name)
         self.__transform = smt.Transform()
         self.__joints: List[SkelJoint] = []
+        # Joint name -> index in `__joints`, which is in the order joints were added
+        self.__joint_indices: Dict[str, int] = {}
+
+        # Computed when first needed after the hierarchy changed
+        self.__sorted_joints: Optional[List[SkelJoint]] = None
+        self.__sorted_indices: Optional[Dict[str, int]] = None
 
     def make_json(self):
+        joints, name_index_map = self.__get_sorted()
         return {
             "name": self.name,
             "transform": self.transform.make_json(),
-            "joints": [xx.make_json() for xx in self.__joints],
+            "joints": [xx.make_json() for xx in joints],
+            "parent indices": [name_index_map.get(xx.parent_name, -1) for xx in joints],
         }
 
     def new_joint(self, name: str) -> SkelJoint:
-        if self.__does_joint_name_exist(name):
+        name = str(name)
+        if name in self.__joint_indices:
             raise RuntimeError(f'Trying to add a joint "{name}", which already exists in skeleton "{self.name}"')
 
-        self.__joints.append(SkelJoint(name))
+        self.__joint_indices[name] = len(self.__joints)
+        self.__joints.append(SkelJoint(name, self.__invalidate_sorted))
+        self.__invalidate_sorted()
         return self.__joints[-1]
 
-    def make_name_index_map(self):
-        output = dict()
-        for i, joint in enumerate(self.__joints):
-            output[joint.name] = i
-        return output
+    # Joint name -> index in the exported order. It is shared until the hierarchy changes, so it must not be modified.
+    def make_name_index_map(self) -> Dict[str, int]:
+        return self.__get_sorted()[1]
 
     @property
     def name(self):
@@ -474,12 +617,51 @@ class Skeleton:
     def transform(self):
         return self.__transform
 
-    def __does_joint_name_exist(self, name: str):
-        name = str(name)
-        for joint in self.__joints:
-            if joint.name == name:
-                return True
-        return False
+    def __invalidate_sorted(self):
+        self.__sorted_joints = None
+        self.__sorted_indices = None
+
+    def __get_sorted(self) -> Tuple[List[SkelJoint], Dict[str, int]]:
+        if self.__sorted_joints is None:
+            self.__sorted_joints = self.__sort_joints()
+            self.__sorted_indices = {x.name: i for i, x in enumerate(self.__sorted_joints)}
+        return self.__sorted_joints, self.__sorted_indices
+
+    # Each joint is placed right after the chain of its ancestors not placed yet
+    def __sort_joints(self) -> List[SkelJoint]:
+        output: List[SkelJoint] = []
+        placed = [False] * len(self.__joints)
+
+        for i in range(len(self.__joints)):
+            # The set finds cycles, and the list keeps the order of the chain
+            chain = []
+            in_chain = set()
+            index = i
+            while index is not None and not placed[index]:
+                if index in in_chain:
+                    names = ", ".join(self.__joints[x].name for x in chain)
+                    raise RuntimeError(f'Joints form a cycle in skeleton "{self.name}": {names}')
+                chain.append(index)
+                in_chain.add(index)
+                index = self.__joint_indices.get(self.__joints[index].parent_name)
+
+            for index in reversed(chain):
+                placed[index] = True
+                output.append(self.__joints[index])
+
+        return output
+
+
+class RotationLayout(enum.Enum):
+    triplets = "triplets"
+    smallest_three_48 = "smallest three 48"
+    smallest_three_32 = "smallest three 32"
+
+
+ROTATION_LAYOUT_BITS: Dict[RotationLayout, Tuple[int, int, int]] = {
+    RotationLayout.smallest_three_48: acp.SMALLEST_THREE_48_BITS,
+    RotationLayout.smallest_three_32: acp.SMALLEST_THREE_32_BITS,
+}
 
 
 class _TimePointDict:
@@ -507,6 +689,65 @@ class _TimePointDict:
             self.__data[time_point] = {}
         self.__data[time_point][channel] = value
 
+    # Every channel gets a value at every time point. Missing ones are linearly interpolated from the keys
+    # of the same channel, held at both ends, or set to the default if the channel has no key at all.
+    def make_samples(self, defaults: Tuple[float, ...]) -> List[acp.Sample]:
+        channel_keys: List[List[Tuple[float, float]]] = [[] for _ in defaults]
+        for time_point, channel, value in self.iter_triplets():
+            channel_keys[channel].append((time_point, value))
+        for keys in channel_keys:
+            keys.sort()
+        channel_times = [[t for t, v in keys] for keys in channel_keys]
+
+        output = []
+        for time_point in sorted(self.__data.keys()):
+            values = []
+            for ch, default in enumerate(defaults):
+                value = self.__data[time_point].get(ch)
+                if value is None:
+                    value = self.__interpolate_channel(channel_keys[ch], channel_times[ch], time_point, default)
+                values.append(value)
+            output.append((time_point, tuple(values)))
+        return output
+
+    # Time points, channels and values of the triplets, in the order of `iter_triplets`
+    def extract(self) -> Tuple[array.array, array.array, array.array]:
+        time_points = array.array("d")
+        channels = array.array("i")
+        values = array.array("d")
+        for time_point, channel, value in self.iter_triplets():
+            time_points.append(time_point)
+            channels.append(channel)
+            values.append(value)
+        return time_points, channels, values
+
+    # Adds the triplets of `extract` in their order, which keeps the order of `iter_triplets`
+    def add_extracted(self, extracted: Tuple[array.array, array.array, array.array]):
+        for time_point, channel, value in zip(*extracted):
+            if time_point not in self.__data:
+                self.__data[time_point] = {}
+            self.__data[time_point][channel] = value
+
+    def set_samples(self, samples: List[acp.Sample]):
+        self.__data = {}
+        for time_point, values in samples:
+            self.__data[time_point] = {ch: v for ch, v in enumerate(values)}
+
+    @staticmethod
+    def __interpolate_channel(keys: List[Tuple[float, float]], times: List[float], time_point: float, default: float):
+        if not keys:
+            return default
+
+        index = bisect.bisect_left(times, time_point)
+        if 0 == index:
+            return keys[0][1]
+        elif len(keys) == index:
+            return keys[-1][1]
+
+        t0, v0 = keys[index - 1]
+        t1, v1 = keys[index]
+        return v0 + (v1 - v0) * (time_point - t0) / (t1 - t0)
+
 
 class AnimJoint:
     def __init__(self):
@@ -528,15 +769,92 @@ class AnimJoint:
     def scales(self):
         return self.__scales
 
+    def reduce_keys(self, pos_tolerance: float, rot_tolerance: float, scale_tolerance: float) -> acp.ReductionStats:
+        stats = acp.ReductionStats()
+        stats.max_pos_error = self.__reduce_track(
+            self.__positions, stats, (0.0, 0.0, 0.0), acp.lerp_values, acp.distance_euclidean, pos_tolerance
+        )
+        stats.max_rot_error = self.__reduce_track(
+            self.__rotations, stats, (1.0, 0.0, 0.0, 0.0), acp.nlerp_quat, acp.angle_between_quats, rot_tolerance
+        )
+        stats.max_scale_error = self.__reduce_track(
+            self.__scales, stats, (1.0, 1.0, 1.0), acp.lerp_values, acp.distance_max_abs, scale_tolerance
+        )
+        return stats
+
+    @staticmethod
+    def __reduce_track(track: _TimePointDict, stats: acp.ReductionStats, defaults, interpolate, measure, tolerance):
+        before = track.get_triplet_count()
+        stats.keys_before += before
+
+        reduced, max_error = acp.reduce_samples(track.make_samples(defaults), interpolate, measure, tolerance)
+
+        # Filling in missing channels of a sparse track may cost more than the reduction saves
+        if len(reduced) * len(defaults) < before:
+            track.set_samples(reduced)
+        else:
+            max_error = 0.0
+
+        stats.keys_after += track.get_triplet_count()
+        return max_error
+
 
 class Animation:
     def __init__(self, name: str, ticks_per_sec: float):
         self.__name = str(name)
         self.__ticks_per_sec = float(ticks_per_sec)
         self.__joints: Dict[str, AnimJoint] = {}
+        self.__rotation_layout = RotationLayout.triplets
+        self.__block_duration = 0.0
+        self.__encoded = None
+        self.__committed = None
 
     def make_json(self, bin_arr: BinaryArrayBuilder):
-        begin = bin_arr.size
+        prg.check_cancelled()
+        if self.__committed is None:
+            if self.__encoded is not None:
+                encoded = self.__encoded
+                self.__encoded = None
+            else:
+                with tmg.span("animation encode", self.name):
+                    encoded = self.encode()
+
+            start_index = bin_arr.size
+            self.commit(encoded, bin_arr)
+            bin_arr.mark_block("action", self.name, start_index)
+
+        begin, size, max_decode_error = self.__committed
+        self.__committed = None
+        prg.advance()
+
+        output = {
+            "name": self.name,
+            "ticks per seconds": self.__ticks_per_sec,
+            "joints data loc": begin,
+            "joints data size": size,
+        }
+
+        # How keys are laid out in the joints data, flat triplets or seekable blocks
+        if self.block_duration > 0.0:
+            output["key layout"] = "blocked"
+            output["block duration"] = self.block_duration
+        else:
+            output["key layout"] = "flat"
+
+        # Exports with the default rotation layout keep the schema they had before rotations could be packed
+        if RotationLayout.triplets != self.rotation_layout:
+            output["rotation layout"] = self.rotation_layout.value
+            output["max rotation decode error degrees"] = math.degrees(max_decode_error)
+
+        return output
+
+    # Returns the joints data and the maximum rotation decode error in radians
+    def encode(self) -> Tuple[bytes, float]:
+        if self.block_duration > 0.0:
+            return self.__encode_blocked()
+
+        bin_arr = BinaryArrayBuilder()
+        max_decode_error = 0.0
 
         bin_arr.add_int32(len(self.__joints))
         for joint_name, joint in self.__joints.items():
@@ -548,11 +866,15 @@ class Animation:
                 bin_arr.add_int16(channel)
                 bin_arr.add_float32(value)
 
-            bin_arr.add_int32(joint.rotations.get_triplet_count())
-            for time_point, channel, value in joint.rotations.iter_triplets():
-                bin_arr.add_float32(time_point)
-                bin_arr.add_int16(channel)
-                bin_arr.add_float32(value)
+            if RotationLayout.triplets == self.rotation_layout:
+                bin_arr.add_int32(joint.rotations.get_triplet_count())
+                for time_point, channel, value in joint.rotations.iter_triplets():
+                    bin_arr.add_float32(time_point)
+                    bin_arr.add_int16(channel)
+                    bin_arr.add_float32(value)
+            else:
+                decode_error = self.__add_packed_rotations(joint.rotations, bin_arr)
+                max_decode_error = max(max_decode_error, decode_error)
 
             bin_arr.add_int32(joint.scales.get_triplet_count())
             for time_point, channel, value in joint.scales.iter_triplets():
@@ -560,14 +882,46 @@ class Animation:
                 bin_arr.add_int16(channel)
                 bin_arr.add_float32(value)
 
-        end = bin_arr.size
+        return bin_arr.data, max_decode_error
 
-        return {
-            "name": self.name,
-            "ticks per seconds": self.__ticks_per_sec,
-            "joints data loc": begin,
-            "joints data size": end - begin,
-        }
+    # Function and argument for a worker pool to encode with. The argument is plain arrays, because pickling the joints
+    # themselves for a worker process costs more than encoding them.
+    def make_encode_task(self) -> Tuple[Callable, Tuple]:
+        return encode_animation_data, self.extract()
+
+    def extract(self) -> Tuple:
+        joints = [
+            (joint_name, joint.positions.extract(), joint.rotations.extract(), joint.scales.extract())
+            for joint_name, joint in self.__joints.items()
+        ]
+        return self.name, self.__ticks_per_sec, self.rotation_layout.value, self.block_duration, joints
+
+    @classmethod
+    def from_extracted(cls, data: Tuple) -> "Animation":
+        name, ticks_per_sec, rotation_layout, block_duration, joints = data
+
+        output = cls(name, ticks_per_sec)
+        output.rotation_layout = RotationLayout(rotation_layout)
+        output.block_duration = block_duration
+        for joint_name, positions, rotations, scales in joints:
+            joint = AnimJoint()
+            joint.positions.add_extracted(positions)
+            joint.rotations.add_extracted(rotations)
+            joint.scales.add_extracted(scales)
+            output.__joints[joint_name] = joint
+        return output
+
+    # Result of `encode` computed in advance, possibly by another process, to be used by the next `make_json`
+    def set_encoded(self, encoded: Tuple[bytes, float]):
+        self.__encoded = encoded
+
+    # Appends the result of `encode` to the binary in advance, to be referred by the next `make_json`
+    def commit(self, encoded: Tuple[bytes, float], bin_arr: BinaryArrayBuilder):
+        joints_data, max_decode_error = encoded
+        begin, size = bin_arr.add_bin_array(joints_data)
+        tmg.count("binary bytes", size)
+        prg.add("bytes", size)
+        self.__committed = (begin, size, max_decode_error)
 
     def add(self, joint_name: str, var_name: str, time_point: float, channel: int, value: float):
         joint_name = str(joint_name)
@@ -585,10 +939,150 @@ class Animation:
         else:
             raise RuntimeError(f'[DAL] WARN::Unknown variable for a joint: "{var_name}"')
 
+    def get_key_count(self) -> int:
+        return sum(
+            x.positions.get_triplet_count() + x.rotations.get_triplet_count() + x.scales.get_triplet_count()
+            for x in self.__joints.values()
+        )
+
+    def reduce_keys(self, pos_tolerance: float, rot_tolerance: float, scale_tolerance: float) -> acp.ReductionStats:
+        stats = acp.ReductionStats()
+        for joint in self.__joints.values():
+            stats.merge(joint.reduce_keys(pos_tolerance, rot_tolerance, scale_tolerance))
+        return stats
+
     @property
     def name(self):
         return self.__name
 
+    @property
+    def rotation_layout(self):
+        return self.__rotation_layout
+
+    @rotation_layout.setter
+    def rotation_layout(self, value: RotationLayout):
+        assert isinstance(value, RotationLayout)
+        self.__rotation_layout = value
+
+    # In ticks. Blocked layout is used if it is greater than 0.
+    @property
+    def block_duration(self):
+        return self.__block_duration
+
+    @block_duration.setter
+    def block_duration(self, value: float):
+        self.__block_duration = float(value)
+
+    # Returns the maximum angle between the original and decoded rotations in radians
+    def __add_packed_rotations(self, rotations: _TimePointDict, bin_arr: BinaryArrayBuilder) -> float:
+        samples = rotations.make_samples((1.0, 0.0, 0.0, 0.0))
+        quats = acp.make_quats_continuous([q for t, q in samples])
+
+        max_error = 0.0
+        bin_arr.add_int32(len(samples))
+        for (time_point, _), q in zip(samples, quats):
+            bin_arr.add_float32(time_point)
+            max_error = max(max_error, self.__add_packed_rotation(q, bin_arr))
+
+        return max_error
+
+    # Returns the angle between the original and decoded rotation in radians
+    def __add_packed_rotation(self, q: Tuple[float, ...], bin_arr: BinaryArrayBuilder) -> float:
+        bits = ROTATION_LAYOUT_BITS[self.rotation_layout]
+        packed = acp.pack_smallest_three(q, bits)
+        bin_arr.add_bin_array(packed.to_bytes(acp.get_smallest_three_byte_size(bits), "little"))
+
+        decoded = acp.unpack_smallest_three(packed, bits)
+        return acp.angle_between_quats(q, decoded)
+
+    # Blocked layout lets the runtime start playback at any time point by reading only the blocks it needs.
+    # Every key is a complete sample, and every track is split into blocks of `block_duration` ticks.
+    #
+    #   int32 joint count
+    #   float32 start time
+    #   float32 block duration
+    #   For each joint
+    #       str joint name
+    #       For each track of positions, rotations and scales
+    #           int32 block count
+    #           For each block
+    #               float32 block start time
+    #               int32 offset of keys from the beginning of the joints data
+    #               int32 key count
+    #   Keys of every block in the same order as the index
+    #       float32 time point
+    #       Values: 3 float32 for a position or scale. For a rotation, 4 float32 of w, x, y, z with triplets
+    #       rotation layout, otherwise a packed quaternion.
+    #
+    # Block i covers [start time + i * block duration, start time + (i + 1) * block duration) and also holds the keys
+    # right before and after it, so it can be interpolated without the neighboring blocks.
+    def __encode_blocked(self) -> Tuple[bytes, float]:
+        tracks = []
+        for joint_name, joint in self.__joints.items():
+            rotations = joint.rotations.make_samples((1.0, 0.0, 0.0, 0.0))
+            quats = acp.make_quats_continuous([q for t, q in rotations])
+            tracks.append((
+                joint.positions.make_samples((0.0, 0.0, 0.0)),
+                [(t, q) for (t, _), q in zip(rotations, quats)],
+                joint.scales.make_samples((1.0, 1.0, 1.0)),
+            ))
+
+        first_time_points = [track[0][0] for joint_tracks in tracks for track in joint_tracks if track]
+        start_time = min(first_time_points) if first_time_points else 0.0
+        blocks = [[self.__split_into_blocks(x, start_time) for x in joint_tracks] for joint_tracks in tracks]
+
+        header_size = 4 + 4 + 4
+        for joint_name, joint_blocks in zip(self.__joints.keys(), blocks):
+            header_size += len(joint_name.encode("utf-8")) + 1
+            header_size += sum(4 + 12 * len(x) for x in joint_blocks)
+
+        header = BinaryArrayBuilder()
+        keys_data = BinaryArrayBuilder()
+        max_decode_error = 0.0
+
+        header.add_int32(len(self.__joints))
+        header.add_float32(start_time)
+        header.add_float32(self.block_duration)
+        for joint_name, joint_blocks in zip(self.__joints.keys(), blocks):
+            header.add_str(joint_name)
+
+            for track_index, track_blocks in enumerate(joint_blocks):
+                header.add_int32(len(track_blocks))
+                for block_start, keys in track_blocks:
+                    header.add_float32(block_start)
+                    header.add_int32(header_size + keys_data.size)
+                    header.add_int32(len(keys))
+
+                    for time_point, values in keys:
+                        keys_data.add_float32(time_point)
+                        if 1 == track_index and RotationLayout.triplets != self.rotation_layout:
+                            decode_error = self.__add_packed_rotation(values, keys_data)
+                            max_decode_error = max(max_decode_error, decode_error)
+                        else:
+                            for x in values:
+                                keys_data.add_float32(x)
+
+        assert header.size == header_size
+        return header.data + keys_data.data, max_decode_error
+
+    def __split_into_blocks(self, samples: List[acp.Sample], start_time: float) -> List[Tuple[float, List[acp.Sample]]]:
+        if not samples:
+            return []
+
+        time_points = [t for t, v in samples]
+        block_count = int((time_points[-1] - start_time) // self.block_duration) + 1
+
+        output = []
+        for i in range(block_count):
+            block_start = start_time + i * self.block_duration
+            block_end = block_start + self.block_duration
+
+            first = max(0, bisect.bisect_right(time_points, block_start) - 1)
+            last = min(len(samples) - 1, bisect.bisect_left(time_points, block_end))
+            output.append((block_start, samples[first:last + 1]))
+
+        return output
+
 
 class MeshActor(IActor):
     def __init__(self, name_reg: NameRegistry):
@@ -596,7 +1090,7 @@ class MeshActor(IActor):
 
         self.__mesh_name = ""
 
-    def make_json(self, meshes: List[Mesh]):
+    def make_json(self, meshes: NameIndex):
         output = {}
         IActor.insert_json(self, output)
         output["render pairs"] = self.__make_render_pairs(meshes)
@@ -610,15 +1104,12 @@ class MeshActor(IActor):
     def mesh_name(self, value):
         self.__mesh_name = str(value)
 
-    def __make_render_pairs(self, meshes: List[Mesh]) -> List[Dict]:
+    def __make_render_pairs(self, meshes: NameIndex) -> List[Dict]:
         if "" == self.mesh_name:
             return []
 
-        for x in meshes:
-            if x.name == self.mesh_name:
-                selected_mesh = x
-                break
-        else:
+        selected_mesh = meshes.find(self.mesh_name)
+        if selected_mesh is None:
             raise RuntimeError(f'A mesh actor "{self.name}" failed to find a mesh named "{self.mesh_name}"')
 
         output: List[Dict] = []
@@ -834,15 +1325,40 @@ class Scene:
         self.__env_maps: List[EnvironmentMap] = []
 
         self.__ignored = IgnoredObjectList()
+        self.__ignored_actions = IgnoredObjectList()
+        # Ignored actions are exported only if actions were filtered, so that other exports keep their schema
+        self.__actions_filtered = False
 
         self.__actor_name_reg = NameRegistry()
 
+        # Name indexes of the lists above. Materials and skeletons are unique by name, and their names do not change
+        # once they are added.
+        self.__mesh_index = NameIndex()
+        self.__material_map: Dict[str, Material] = {}
+        self.__skeleton_map: Dict[str, Skeleton] = {}
+
     @property
     def ignored_objects(self):
         return self.__ignored
 
+    @property
+    def ignored_actions(self):
+        return self.__ignored_actions
+
+    @property
+    def skeletons(self):
+        return iter(self.__skeletons)
+
+    @property
+    def actions_filtered(self):
+        return self.__actions_filtered
+
+    @actions_filtered.setter
+    def actions_filtered(self, value):
+        self.__actions_filtered = bool(value)
+
     def make_json(self, bin_arr: BinaryArrayBuilder) -> Dict:
-        return {
+        output = {
             "name": self.name,
             "root transform": [1, 0, 0, 0, 0, 0, -1, 0, 0, 1, 0, 0, 0, 0, 0, 1],
 
@@ -850,7 +1366,7 @@ class Scene:
             "materials": [xx.make_json() for xx in self.__materials],
             "skeletons": [xx.make_json() for xx in self.__skeletons],
             "animations": [xx.make_json(bin_arr) for xx in self.__animations],
-            "mesh actors": [xx.make_json(self.__meshes) for xx in self.__mesh_actors],
+            "mesh actors": [xx.make_json(self.__mesh_index) for xx in self.__mesh_actors],
             "directional lights": [xx.make_json() for xx in self.__dlights],
             "point lights": [xx.make_json() for xx in self.__plights],
             "spotlights": [xx.make_json() for xx in self.__slights],
@@ -860,6 +1376,28 @@ class Scene:
             "ignored objects": self.ignored_objects.make_json(),
         }
 
+        if self.actions_filtered:
+            output["ignored actions"] = self.ignored_actions.make_json()
+
+        return output
+
+    # Objects with `encode`, `make_encode_task`, `set_encoded` and `commit`, which are independent of each other and of
+    # the scene
+    def iter_encodables(self):
+        for kind, name, item in self.iter_encodable_blocks():
+            yield item
+
+    # Kind and name of the block of each encodable, in the order `make_json` appends them to the binary
+    def iter_encodable_blocks(self):
+        for mesh in self.__meshes:
+            for material_name, vertex_buffer in mesh.vertex_buffers:
+                yield "mesh", mesh.name, vertex_buffer
+        for animation in self.__animations:
+            yield "action", animation.name, animation
+        for water_plane in self.__water_planes:
+            for material_name, vertex_buffer in water_plane.mesh.vertex_buffers:
+                yield "mesh", water_plane.mesh.name, vertex_buffer
+
     def get_texture_names(self) -> Set[str]:
         output = set()
 
@@ -876,54 +1414,51 @@ class Scene:
 
         return output
 
-    def find_mesh_by_name(self, name: str):
-        for mesh in self.__meshes:
-            if str(name) == mesh.name:
-                return mesh
+    # Texture name -> new name to be referred by materials instead
+    def replace_texture_names(self, mapping: Dict[str, str]):
+        for material in self.__materials:
+            material.albedo_map = mapping.get(material.albedo_map, material.albedo_map)
+            material.roughness_map = mapping.get(material.roughness_map, material.roughness_map)
+            material.metallic_map = mapping.get(material.metallic_map, material.metallic_map)
+            material.normal_map = mapping.get(material.normal_map, material.normal_map)
 
-        raise KeyError(f"Mesh named '{name}' does not exist")
+    def find_mesh_by_name(self, name: str):
+        mesh = self.__mesh_index.find(name)
+        if mesh is None:
+            raise KeyError(f"Mesh named '{name}' does not exist")
+        return mesh
 
     def find_material_by_name(self, name: str):
-        for material in self.__materials:
-            if str(name) == material.name:
-                return material
-
-        raise KeyError(f"Material named '{name}' does not exist")
+        material = self.__material_map.get(str(name))
+        if material is None:
+            raise KeyError(f"Material named '{name}' does not exist")
+        return material
 
     def find_skeleton_by_name(self, name: str):
         if not name:
             raise ValueError(f"Invalid skeleton name: {name}")
 
-        for x in self.__skeletons:
-            if str(name) == x.name:
-                return x
-
-        raise KeyError(f"Skeleton named '{name}' does not exist")
+        skeleton = self.__skeleton_map.get(str(name))
+        if skeleton is None:
+            raise KeyError(f"Skeleton named '{name}' does not exist")
+        return skeleton
 
     def has_material(self, name: str):
-        try:
-            self.find_material_by_name(name)
-        except KeyError:
-            return False
-        else:
-            return True
+        return str(name) in self.__material_map
 
     def has_skeleton(self, name: str):
-        try:
-            self.find_skeleton_by_name(name)
-        except KeyError:
-            return False
-        else:
-            return True
+        if not name:
+            raise ValueError(f"Invalid skeleton name: {name}")
+
+        return str(name) in self.__skeleton_map
 
     def add_material(self, material: Material):
-        try:
-            found_mat = self.find_material_by_name(material.name)
-        except KeyError:
+        found_mat = self.__material_map.get(material.name)
+        if found_mat is None:
             self.__materials.append(material)
-        else:
-            if not found_mat.is_same(material):
-                raise RuntimeError()
+            self.__material_map[material.name] = material
+        elif not found_mat.is_same(material):
+            raise RuntimeError()
 
     def new_skeleton(self, name):
         if self.has_skeleton(name):
@@ -931,10 +1466,11 @@ class Scene:
 
         x = Skeleton(name)
         self.__skeletons.append(x)
+        self.__skeleton_map[x.name] = x
         return x
 
     def new_mesh(self):
-        mesh = Mesh()
+        mesh = Mesh(self.__mesh_index)
         self.__meshes.append(mesh)
         return mesh
 
@@ -988,8 +1524,8 @@ class Scene:
         return output
 
     def __find_mesh_actor_by_name(self, name: str):
-        for x in self.__mesh_actors:
-            if x.name == str(name):
-                return x
+        x = self.__actor_name_reg.find(str(name))
+        if isinstance(x, MeshActor) and x.name == str(name):
+            return x
 
         raise KeyError(f"Mesh actor named '{name}' does not exist")
@@ -0,0 +1,126 @@
+import zlib
+import queue
+import threading
+import multiprocessing
+import concurrent.futures
+from typing import Optional
+
+from . import data_struct as dst
+from . import timing as tmg
+from . import progress as prg
+
+
+# Overlaps parsing, encoding, appending to the binary and compressing it.
+# The parser submits meshes and actions as soon as they are complete. They are encoded in a process pool, then a
+# committer thread appends them to the binary in the order they were submitted, which is the order `make_json` would
+# append them in, and feeds them to a streaming compressor. So the binary and the compressed binary are identical to
+# those of the serial export.
+# At most `max_pending` submitted items are neither committed nor dropped, which bounds the memory held by encoded
+# results waiting for their turn. `submit` blocks while the bound is reached.
+# This module does not import bpy.
+
+
+class EncodePipeline:
+    def __init__(self, max_workers: int = 0, max_pending: int = 16, compress_level: Optional[int] = None):
+        self.__bin_arr = dst.BinaryArrayBuilder()
+        self.__executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers if max_workers > 0 else None,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.__queue = queue.Queue(maxsize=max(1, max_pending))
+        self.__submitted = set()
+
+        self.__compressor = zlib.compressobj(compress_level) if compress_level is not None else None
+        self.__compressed_chunks = []
+        self.__compressed: Optional[bytes] = None
+        self.__compressed_raw_size = 0
+
+        self.__error: Optional[BaseException] = None
+        self.__dropping = False
+        self.__closed = False
+        self.__committer = threading.Thread(target=self.__run_committer, name="dal encode pipeline", daemon=True)
+        self.__committer.start()
+
+    @property
+    def bin_arr(self) -> dst.BinaryArrayBuilder:
+        return self.__bin_arr
+
+    # Compressed binary after `join`, or None if the binary was not compressed. It covers only the data committed by
+    # the pipeline, so it is valid only if the binary did not grow since.
+    def get_compressed(self, raw_size: int) -> Optional[bytes]:
+        if self.__compressed is None or raw_size != self.__compressed_raw_size:
+            return None
+        return self.__compressed
+
+    # The item must not change after it is submitted
+    def submit(self, kind: str, name: str, item):
+        if self.__error is not None:
+            raise self.__error
+        if id(item) in self.__submitted:
+            return
+
+        self.__submitted.add(id(item))
+        future = self.__executor.submit(*item.make_encode_task())
+        self.__queue.put((kind, name, item, future))
+
+    def submit_mesh(self, mesh: dst.Mesh):
+        for material_name, vertex_buffer in mesh.vertex_buffers:
+            self.submit("mesh", mesh.name, vertex_buffer)
+
+    # Submits encodables of the scene not submitted yet, which must follow those submitted in the order of the binary
+    def submit_scene(self, scene: dst.Scene):
+        for kind, name, item in scene.iter_encodable_blocks():
+            self.submit(kind, name, item)
+
+    # Waits until every submitted item is committed
+    def join(self):
+        self.__close_queue()
+        while self.__committer.is_alive():
+            self.__committer.join(0.1)
+            prg.check_cancelled()
+        self.__executor.shutdown()
+
+        if self.__error is not None:
+            raise self.__error
+
+    # Drops items not committed yet and stops the workers
+    def cancel(self):
+        self.__dropping = True
+        self.__close_queue()
+        self.__committer.join()
+        self.__executor.shutdown()
+
+    def __close_queue(self):
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put(None)
+
+    # Keeps taking items after an error or a cancel, so that `submit` never blocks forever
+    def __run_committer(self):
+        while True:
+            entry = self.__queue.get()
+            if entry is None:
+                break
+
+            kind, name, item, future = entry
+            if self.__dropping or self.__error is not None:
+                future.cancel()
+                continue
+
+            try:
+                encoded = future.result()
+                with tmg.span("pipeline commit", name):
+                    start_index = self.__bin_arr.size
+                    item.commit(encoded, self.__bin_arr)
+                    self.__bin_arr.mark_block(kind, name, start_index)
+                    if self.__compressor is not None:
+                        tail = self.__bin_arr.get_tail(start_index)
+                        self.__compressed_chunks.append(self.__compressor.compress(tail))
+            except BaseException as e:
+                self.__error = e
+
+        if self.__compressor is not None and self.__error is None and not self.__dropping:
+            self.__compressed_chunks.append(self.__compressor.flush())
+            self.__compressed = b"".join(self.__compressed_chunks)
+            self.__compressed_raw_size = self.__bin_arr.size
+        self.__compressed_chunks = []
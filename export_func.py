@@ -2,92 +2,482 @@ import os
 import sys
 import zlib
 import json
-import shutil
+import time
 import base64
 import pstats
 import cProfile
+import signal
 import argparse
+import traceback
+from typing import List, Tuple, Dict, Optional
 
 import bpy
 
 try:
+    from . import data_struct as dst
     from . import data_exporter as dex
+    from . import texture_export as tex
+    from . import texture_process as tpr
+    from . import export_server as srv
+    from . import export_manifest as mnf
+    from . import export_options as eop
+    from . import timing as tmg
+    from . import attribution as atr
+    from . import memory_profile as mpf
+    from . import progress as prg
 except ImportError:
+    import io_scene_dalbaragi.data_struct as dst
     import io_scene_dalbaragi.data_exporter as dex
+    import io_scene_dalbaragi.texture_export as tex
+    import io_scene_dalbaragi.texture_process as tpr
+    import io_scene_dalbaragi.export_server as srv
+    import io_scene_dalbaragi.export_manifest as mnf
+    import io_scene_dalbaragi.export_options as eop
+    import io_scene_dalbaragi.timing as tmg
+    import io_scene_dalbaragi.attribution as atr
+    import io_scene_dalbaragi.memory_profile as mpf
+    import io_scene_dalbaragi.progress as prg
 
 
-def _copy_image(image: bpy.types.Image, dst_path: str) -> None:
-    # Not packed
-    if image.packed_file is None:
-        src_path = bpy.path.abspath(image.filepath)
-        if os.path.isfile(src_path):
-            shutil.copyfile(src_path, dst_path)
+# Appended to output paths while they are written
+PARTIAL_SUFFIX = ".partial"
+
+# Yielded by `iter_export_json` once the rest of the export does not touch bpy
+BPY_FREE = object()
+
+
+# Packed images are read here on the main thread, so that they can be written from their bytes without touching
+# Blender data later. Returns sources and error messages of images that cannot be found.
+def _collect_texture_sources(scenes: List[dst.Scene]) -> Tuple[List[tex.TextureSource], List[str]]:
+    image_names = set()
+    for scene in scenes:
+        a = scene.get_texture_names()
+        image_names = image_names.union(a)
+
+    sources = []
+    errors = []
+    for name in sorted(image_names):
+        try:
+            image: bpy.types.Image = bpy.data.images[name]
+        except KeyError:
+            errors.append("Image not found in blend data: {}".format(name))
+            continue
+
+        if image.packed_file is None:
+            sources.append(tex.TextureSource(name, src_path=bpy.path.abspath(image.filepath)))
         else:
-            raise FileNotFoundError("Image not found: {}".format(src_path))
-    # Packed
-    else:
-        packed = image.packed_files[0]
-        original_path = packed.filepath
-        packed.filepath = dst_path
-        packed.save()
-        packed.filepath = original_path
+            sources.append(tex.TextureSource(name, data=image.packed_file.data))
+
+    return sources, errors
+
 
+# Materials are made to refer to a single copy of textures with identical contents, so it must be done before
+# building JSON. Returns sources of the textures to be written.
+# In incremental mode, hashes of sources are cached in the manifest of the texture folder, so that only new or changed
+# files are read.
+def _deduplicate_textures(
+    scenes: List[dst.Scene],
+    sources: List[tex.TextureSource],
+    img_save_fol_path: str,
+    incremental: bool,
+) -> List[tex.TextureSource]:
+    st = time.time()
+    manifest = tex.TextureManifest(img_save_fol_path) if incremental else None
+    report = tex.find_duplicates(sources, manifest)
+
+    if manifest is not None:
+        try:
+            os.makedirs(img_save_fol_path, exist_ok=True)
+            manifest.save()
+        except OSError as e:
+            print(f"[DAL] Failed to save texture manifest: {e}")
+
+    for scene in scenes:
+        scene.replace_texture_names(report.canonical_names)
+
+    print(
+        f"[DAL] Duplicate textures: {len(report.canonical_names)}, "
+        f"bytes saved: {report.saved_bytes} ({time.time() - st:.3f})"
+    )
+    for duplicate, canonical in sorted(report.canonical_names.items()):
+        print(f"[DAL]     '{duplicate}' -> '{canonical}'")
+
+    return [x for x in sources if x.name not in report.canonical_names]
+
+
+# Materials are made to refer to the output names of textures to be processed, so it must be done before building
+# JSON. Returns sources to be copied as they are, and sources to be processed with their output names.
+def _plan_texture_processing(
+    scenes: List[dst.Scene],
+    sources: List[tex.TextureSource],
+    settings: tpr.ProcessSettings,
+) -> Tuple[List[tex.TextureSource], List[Tuple[tex.TextureSource, str]]]:
+    to_copy = []
+    to_process = []
+    output_names = {}
+
+    for source in sources:
+        width, height = bpy.data.images[source.name].size
+        if settings.needs_processing(source.name, width, height):
+            output_name = settings.get_output_name(source.name)
+            to_process.append((source, output_name))
+            output_names[source.name] = output_name
+        else:
+            to_copy.append(source)
 
-def export_json(
+    for scene in scenes:
+        scene.replace_texture_names(output_names)
+
+    return to_copy, to_process
+
+
+# Textures are written in the background, so call `join` on the returned copier to wait for them.
+# Pixels of textures to be processed are read here on the main thread unless cached results are up to date.
+def _start_copying_images(
+    sources: List[tex.TextureSource],
+    to_process: List[Tuple[tex.TextureSource, str]],
+    errors: List[str],
+    img_save_fol_path: str,
+    incremental: bool,
+    hard_link: bool,
+    process_settings: tpr.ProcessSettings,
+) -> tex.TextureCopier:
+    if not os.path.isdir(img_save_fol_path):
+        os.mkdir(img_save_fol_path)
+
+    copier = tex.TextureCopier(img_save_fol_path, incremental, hard_link, process_settings=process_settings)
+    try:
+        for x in errors:
+            copier.add_error(x)
+        for source in sources:
+            copier.submit(source)
+
+        for source, output_name in to_process:
+            try:
+                cache_key = process_settings.make_cache_key(copier.hash_source(source))
+            except OSError as e:
+                copier.add_error(str(e))
+                continue
+
+            if copier.is_processed_up_to_date(output_name, cache_key):
+                continue
+
+            image: bpy.types.Image = bpy.data.images[source.name]
+            width, height = image.size
+            pixels = tpr.make_pixel_buffer(width * height * image.channels)
+            image.pixels.foreach_get(pixels)
+
+            # Pixels of float images are linear, and those of byte images are as stored, which is sRGB unless the
+            # image holds non-color data
+            is_srgb = not image.colorspace_settings.is_data
+            data = tpr.to_rgba8(pixels, width, height, image.channels, image.is_float and is_srgb)
+            del pixels
+            copier.process_rgba8(data, width, height, is_srgb, output_name, cache_key)
+    except BaseException:
+        copier.cancel()
+        raise
+
+    return copier
+
+
+# Returns error messages of textures that failed to be copied. Arguments are those of `iter_export_json`.
+def export_json(*args, **kwargs) -> List[str]:
+    return prg.run_steps(iter_export_json(*args, **kwargs))
+
+
+# Generator of `export_json`, which yields after each step reading Blender data, then yields `BPY_FREE` once before
+# the steps that do not touch bpy, so that callers can read Blender data in time slices on the main thread and run the
+# rest on another thread. Returns error messages of textures that failed to be copied.
+# Timings of the stages are written into a "_timings.json" file next to the exported file, an attribution report
+# too if `option_attribution_report` is set, and memory of the stages into "_memory.json" if `option_memory_profile`
+# is set. See attribution and memory_profile.
+# Progress is reported to `progress` if given. If it is cancelled, `prg.ExportCancelled` is raised and the previous
+# outputs are left as they were.
+def iter_export_json(
     file_path: str,
     configs:  dex.ParseConfigs,
     option_do_profile,
     option_compress_binary,
     option_embed_binary,
     option_copy_images,
+    option_incremental_images=False,
+    option_hard_link_images=False,
+    option_deduplicate_images=False,
+    option_texture_max_size=0,
+    option_texture_format=tpr.TextureFormat.original,
+    option_settings_record: Optional[Dict] = None,
+    option_attribution_report=False,
+    option_memory_profile=False,
+    progress: Optional[prg.Progress] = None,
 ):
     if option_do_profile:
         pr = cProfile.Profile()
         pr.enable()
 
-    scenes, bin_array = dex.parse_scenes(configs)
-    json_data, bin_data = dex.build_json(scenes, bin_array, configs)
+    timings = tmg.Timings()
+    memory_profiler = mpf.MemoryProfiler() if option_memory_profile else None
+    with tmg.activate(timings), mpf.activate(memory_profiler), prg.activate(progress):
+        errors, bin_info = yield from __iter_export_stages(
+            file_path,
+            configs,
+            option_compress_binary,
+            option_embed_binary,
+            option_copy_images,
+            option_incremental_images,
+            option_hard_link_images,
+            option_deduplicate_images,
+            option_texture_max_size,
+            option_texture_format,
+            option_settings_record,
+            # The profiler only sees the thread it is enabled on
+            not option_do_profile,
+        )
+
+        if option_attribution_report:
+            with tmg.span("attribution report"):
+                __write_attribution_report(file_path, timings, *bin_info, option_compress_binary)
+
+    if option_do_profile:
+        pr.disable()
+        with open(os.path.splitext(file_path)[0] + "_profile.txt", "w", encoding="utf8") as file:
+            ps = pstats.Stats(pr, stream=file)
+            ps.sort_stats("tottime")
+            ps.print_stats()
+
+    if memory_profiler is not None:
+        memory_profiler.save(os.path.splitext(file_path)[0] + "_memory.json")
+        memory_profiler.print_summary()
+
+    timings.save(os.path.splitext(file_path)[0] + "_timings.json")
+    return errors
+
+
+# Texture files are copied while the binary is built, compressed and written. Spans are not kept open across the
+# `BPY_FREE` yield, since they nest per thread.
+def __iter_export_stages(
+    file_path: str,
+    configs:  dex.ParseConfigs,
+    option_compress_binary,
+    option_embed_binary,
+    option_copy_images,
+    option_incremental_images,
+    option_hard_link_images,
+    option_deduplicate_images,
+    option_texture_max_size,
+    option_texture_format,
+    option_settings_record: Optional[Dict],
+    allow_hand_off: bool,
+):
+    # Outputs are written as partial files and renamed only once all of them are written, so that a cancelled or
+    # failed export leaves the previous outputs as they were
+    output_paths = [file_path] if option_embed_binary else [os.path.splitext(file_path)[0] + ".bin", file_path]
+
+    # Every stage runs in one try, so that the pipeline and the copier are stopped wherever the export fails
+    pipeline = dex.make_encode_pipeline(configs, zlib.Z_BEST_COMPRESSION if option_compress_binary else None)
+    copier = None
+    try:
+        with tmg.span("parse"), mpf.stage("parse"):
+            scenes, bin_array = yield from dex.iter_parse_scenes(configs, pipeline)
+
+        if option_copy_images:
+            img_save_fol_path = os.path.splitext(file_path)[0] + "_textures"
+            with tmg.span("texture plan"), mpf.stage("texture plan"):
+                texture_sources, texture_errors = _collect_texture_sources(scenes)
+                if option_deduplicate_images:
+                    texture_sources = _deduplicate_textures(
+                        scenes, texture_sources, img_save_fol_path, option_incremental_images
+                    )
+
+                process_settings = tpr.ProcessSettings(option_texture_max_size, option_texture_format)
+                if process_settings.is_enabled:
+                    texture_sources, textures_to_process = _plan_texture_processing(
+                        scenes, texture_sources, process_settings
+                    )
+                else:
+                    textures_to_process = []
+
+            # Pixels of textures to be processed are read from Blender here
+            with tmg.span("texture start"):
+                copier = _start_copying_images(
+                    texture_sources,
+                    textures_to_process,
+                    texture_errors,
+                    img_save_fol_path,
+                    option_incremental_images,
+                    option_hard_link_images,
+                    process_settings,
+                )
+
+        if allow_hand_off:
+            yield BPY_FREE
+
+        with tmg.span("build"):
+            json_data, bin_data = dex.build_json(scenes, bin_array, configs, pipeline)
+        compressed = pipeline.get_compressed(len(bin_data)) if pipeline is not None else None
+
+        __write_outputs(
+            file_path,
+            json_data,
+            bin_data,
+            compressed,
+            option_compress_binary,
+            option_embed_binary,
+            option_settings_record,
+        )
+        prg.check_cancelled()
+        for path in output_paths:
+            os.replace(path + PARTIAL_SUFFIX, path)
+
+        if copier is not None:
+            with tmg.span("texture wait"):
+                errors = copier.join()
+            tmg.count("textures copied", copier.copied_count)
+            tmg.count("textures hard linked", copier.linked_count)
+            tmg.count("textures processed", copier.processed_count)
+            tmg.count("textures up to date", copier.skipped_count)
+            print(
+                f"[DAL] Textures copied: {copier.copied_count}, hard linked: {copier.linked_count}, "
+                f"processed: {copier.processed_count}, up to date: {copier.skipped_count}"
+            )
+            for x in errors:
+                print(f"[DAL] Failed to copy a texture: {x}")
+        else:
+            errors = []
+    except BaseException:
+        for path in output_paths:
+            try:
+                os.remove(path + PARTIAL_SUFFIX)
+            except FileNotFoundError:
+                pass
+        if copier is not None:
+            copier.cancel()
+        if pipeline is not None:
+            pipeline.cancel()
+        raise
+
+    return errors, (bin_array, bin_data)
+
+
+# `compressed` is the binary already compressed, if it was compressed while it was built
+def __write_outputs(
+    file_path: str,
+    json_data: Dict,
+    bin_data: bytes,
+    compressed: Optional[bytes],
+    option_compress_binary,
+    option_embed_binary,
+    option_settings_record: Optional[Dict],
+):
+    prg.begin_stage("write", 3)
+
+    if option_settings_record is not None:
+        json_data["export settings"] = option_settings_record
 
     json_data["binary data"] = {
         "raw size": len(bin_data),
     }
 
+    prg.check_cancelled()
     if option_compress_binary:
-        bin_data = zlib.compress(bin_data, zlib.Z_BEST_COMPRESSION)
+        if compressed is not None:
+            bin_data = compressed
+        else:
+            with tmg.span("compress"), mpf.stage("compress"):
+                bin_data = zlib.compress(bin_data, zlib.Z_BEST_COMPRESSION)
+        tmg.count("compressed bytes", len(bin_data))
         json_data["binary data"]["compressed size"] = len(bin_data)
+    prg.advance()
 
+    prg.check_cancelled()
     if option_embed_binary:
-        encoded = base64.b64encode(bin_data).decode('ascii')
+        with tmg.span("base64"), mpf.stage("base64"):
+            encoded = base64.b64encode(bin_data).decode('ascii')
         json_data["binary data"]["base64 size"] = len(encoded)
         json_data["binary data"]["base64"] = encoded
     else:
-        with open(os.path.splitext(file_path)[0] + ".bin", "wb") as file:
-            file.write(bin_data)
+        with tmg.span("write binary"), mpf.stage("write binary"):
+            with open(os.path.splitext(file_path)[0] + ".bin" + PARTIAL_SUFFIX, "wb") as file:
+                file.write(bin_data)
+    prg.advance()
 
-    with open(file_path, "w", encoding="utf8") as file:
-        json.dump(json_data, file, indent=4)
+    prg.check_cancelled()
+    with tmg.span("write json"), mpf.stage("write json"):
+        with open(file_path + PARTIAL_SUFFIX, "w", encoding="utf8") as file:
+            json.dump(json_data, file, indent=4)
+    prg.advance()
 
-    if option_copy_images:
-        img_save_fol_path = os.path.splitext(file_path)[0] + "_textures"
-        if not os.path.isdir(img_save_fol_path):
-            os.mkdir(img_save_fol_path)
 
-        image_names = set()
-        for scene in scenes:
-            a = scene.get_texture_names()
-            image_names = image_names.union(a)
+# The previous report is compared against before being replaced, and the largest changes are printed
+def __write_attribution_report(
+    file_path: str,
+    timings: tmg.Timings,
+    bin_array: dst.BinaryArrayBuilder,
+    bin_data: bytes,
+    measure_compression: bool,
+):
+    base_path = os.path.splitext(file_path)[0]
+    rows = atr.make_report(timings, bin_array.blocks, bin_data, measure_compression)
+    previous_rows = atr.load_report(base_path + atr.REPORT_SUFFIX + ".json")
+    atr.save_report(rows, base_path)
 
-        for name in image_names:
-            image: bpy.types.Image = bpy.data.images[name]
-            dst_path = os.path.join(img_save_fol_path, name)
-            _copy_image(image, dst_path)
+    if previous_rows is not None:
+        print("[DAL] Largest changes of attribution since the previous export:")
+        for line in atr.format_diff(atr.diff_reports(previous_rows, rows), 10).splitlines():
+            print(f"[DAL]     {line}")
 
-    if option_do_profile:
-        pr.disable()
-        with open(os.path.splitext(file_path)[0] + "_profile.txt", "w", encoding="utf8") as file:
-            ps = pstats.Stats(pr, stream=file)
-            ps.sort_stats("tottime")
-            ps.print_stats()
+
+def make_parse_configs(settings: Dict) -> dex.ParseConfigs:
+    return dex.ParseConfigs(
+        settings["exclude_hidden"] in ("meshes", "all"),
+        "all" == settings["exclude_hidden"],
+        settings["reduce_keyframes"],
+        settings["reduce_pos_tolerance"],
+        settings["reduce_rot_tolerance"],
+        settings["reduce_scale_tolerance"],
+        dst.RotationLayout[settings["rotation_layout"]],
+        settings["only_relevant_actions"],
+        dex.EncodeExecutor[settings["encode_executor"]],
+        settings["encode_workers"],
+        settings["anim_block_seconds"],
+    )
+
+
+# Settings as made by export_options. The preset and the settings are recorded in the output JSON.
+def export_with_settings(
+    file_path: str,
+    preset: str,
+    settings: Dict,
+    progress: Optional[prg.Progress] = None,
+) -> List[str]:
+    return prg.run_steps(iter_export_with_settings(file_path, preset, settings, progress))
+
+
+# Generator of `export_with_settings`, which yields like `iter_export_json`
+def iter_export_with_settings(
+    file_path: str,
+    preset: str,
+    settings: Dict,
+    progress: Optional[prg.Progress] = None,
+):
+    settings = eop.make_settings(overrides=settings)
+
+    return (yield from iter_export_json(
+        file_path,
+        make_parse_configs(settings),
+        settings["do_profile"],
+        settings["compress_binary"],
+        settings["embed_binary"],
+        settings["copy_images"],
+        settings["incremental_images"],
+        settings["hard_link_images"],
+        settings["deduplicate_images"],
+        settings["texture_max_size"],
+        tpr.TextureFormat[settings["texture_format"]],
+        eop.make_settings_record(preset, settings),
+        settings["attribution_report"],
+        settings["memory_profile"],
+        progress,
+    ))
 
 
 def __parse_args():
@@ -101,45 +491,197 @@ def __parse_args():
         help=""
     )
 
-    parser.add_argument('--texture', action=argparse.BooleanOptionalAction)
+    eop.add_arguments(parser)
 
-    if sys.argv.count("--"):
-        args = sys.argv[sys.argv.index("--") + 1:]
-    else:
-        args = []
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Export every file even if its source, the exporter and the options did not change"
+    )
+    parser.add_argument(
+        "--no-manifest",
+        dest="no_manifest",
+        action="store_true",
+        help="Neither check nor update the export manifest in the output folder"
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print progress of each export. Ctrl+C cancels the export either way."
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep running and serve export jobs over a local socket. See export_server."
+    )
+    parser.add_argument("--port", type=int, default=0, help="Port of the export server. 0 picks a free one.")
+    parser.add_argument(
+        "--port-file",
+        dest="port_file",
+        type=str,
+        default="",
+        help="File to write the port of the export server into once it is listening"
+    )
 
-    args, unknown = parser.parse_known_args(args)
+    args, unknown = parser.parse_known_args(__get_script_args())
     return args
 
 
+def __get_script_args() -> List[str]:
+    if sys.argv.count("--"):
+        return sys.argv[sys.argv.index("--") + 1:]
+    else:
+        return []
+
+
 def __gen_blend_paths():
     for x in sys.argv:
         if x.endswith(".blend"):
             yield x
 
 
-def __cmd_export():
+# Blender opens the first .blend file of its command line by itself, so it is not opened again unless `reload` is set.
+# A server must reload it, since the file may have been saved again since it was opened.
+def __open_blend_file(blend_path: str, reload: bool = False):
+    if not reload and bpy.data.filepath and os.path.samefile(bpy.data.filepath, blend_path):
+        return
+    bpy.ops.wm.open_mainfile(filepath=blend_path)
+
+
+def __make_json_path(blend_path: str, output_folder: str) -> str:
+    pure_file_name = os.path.split(os.path.splitext(blend_path)[0])[-1]
+    return os.path.join(output_folder, pure_file_name) + ".json"
+
+
+def __export_blend_file(
+    blend_path: str,
+    output_folder: str,
+    preset: str,
+    settings: Dict,
+    progress: Optional[prg.Progress] = None,
+    reload: bool = False,
+) -> Dict[str, float]:
+    json_path = __make_json_path(blend_path, output_folder)
+
+    st = time.time()
+    __open_blend_file(blend_path, reload)
+    opened = time.time()
+
+    export_with_settings(json_path, preset, settings, progress)
+
+    return {
+        "open": opened - st,
+        "export": time.time() - opened,
+    }
+
+
+# Returns the process exit code, which is not 0 if any file failed to be exported
+def __cmd_export() -> int:
     args = __parse_args()
-    configs = dex.ParseConfigs()
 
     try:
         os.mkdir(args.output_folder)
     except FileExistsError:
         pass
 
-    for blend_path in __gen_blend_paths():
-        pure_file_name = os.path.split(os.path.splitext(blend_path)[0])[-1]
-        json_path = os.path.join(args.output_folder, pure_file_name) + ".json"
+    preset, settings = eop.make_settings_from_options(eop.make_options_from_args(args))
+    manifest = None if args.no_manifest else mnf.ExportManifest(args.output_folder)
+    options = {"preset": preset, "settings": settings}
 
-        export_json(
-            json_path,
-            configs,
-            False,
-            True,
-            True,
-            bool(args.texture),
-        )
+    # The first Ctrl+C cancels the export in progress at its next check, and the second one interrupts as usual.
+    # Every file gets its own progress, so that its counters start from zero.
+    progress = prg.Progress()
+
+    def cancel(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        print("[DAL] Cancelling export...", flush=True)
+        progress.cancel()
+
+    previous_handler = signal.signal(signal.SIGINT, cancel)
+
+    failed_paths = []
+    rebuilt = []
+    up_to_date = []
+    cancelled_path = ""
+    try:
+        for blend_path in __gen_blend_paths():
+            # Cancelling between files carries over to the next one
+            previous_progress = progress
+            progress = prg.Progress(prg.print_progress if args.progress else None, 1.0)
+            if previous_progress.is_cancelled:
+                progress.cancel()
+
+            try:
+                progress.check_cancelled()
+
+                # Checking hashes the .blend file, which fails like an export if it is missing or unreadable
+                if manifest is not None:
+                    reason, source_hash = manifest.check(
+                        blend_path, [__make_json_path(blend_path, args.output_folder)], options
+                    )
+                    if args.force:
+                        reason = "forced"
+                    if reason is None:
+                        up_to_date.append(blend_path)
+                        continue
+                else:
+                    reason = "no manifest"
+
+                __export_blend_file(blend_path, args.output_folder, preset, settings, progress)
+            except prg.ExportCancelled:
+                cancelled_path = blend_path
+                break
+            except Exception:
+                traceback.print_exc()
+                failed_paths.append(blend_path)
+            else:
+                rebuilt.append((blend_path, reason))
+                if manifest is not None:
+                    manifest.update(blend_path, source_hash, options)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+
+        if manifest is not None:
+            manifest.save()
+
+    for x, reason in rebuilt:
+        print(f"[DAL] Rebuilt: {x} ({reason})")
+    for x in up_to_date:
+        print(f"[DAL] Up to date: {x}")
+    for x in failed_paths:
+        print(f"[DAL] Failed to export: {x}")
+    if cancelled_path:
+        print(f"[DAL] Cancelled: {cancelled_path}")
+        return 130
+
+    return 1 if failed_paths else 0
+
+
+def __handle_server_job(job: Dict) -> Dict:
+    output_folder = job.get("output folder", ".")
+    os.makedirs(output_folder, exist_ok=True)
+
+    preset, settings = eop.make_settings_from_options(job.get("options", {}))
+    timings = __export_blend_file(job["blend path"], output_folder, preset, settings, reload=True)
+    print(f"[DAL] Served export job: {job['blend path']} ({sum(timings.values()):.3f})", flush=True)
+    return {"timings": timings}
+
+
+def __cmd_serve() -> int:
+    args = __parse_args()
+
+    def write_port_file(port: int):
+        if args.port_file:
+            with open(args.port_file, "w", encoding="utf8") as file:
+                file.write(str(port))
+
+    srv.serve(__handle_server_job, port=args.port, on_listening=write_port_file)
+    return 0
 
 
 if "__main__" == __name__:
-    __cmd_export()
+    if __parse_args().serve:
+        sys.exit(__cmd_serve())
+    else:
+        sys.exit(__cmd_export())
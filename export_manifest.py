@@ -0,0 +1,89 @@
+import os
+import re
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+
+# Kept in the output folder to skip .blend files whose export inputs did not change since the last export.
+# Inputs are the source contents, the exporter version and the export options.
+# This module does not import bpy, so the batch driver can skip files without starting Blender.
+
+
+MANIFEST_FILE_NAME = "_export_manifest.json"
+
+__PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def hash_file(path: str) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Version in blender_manifest.toml is rarely bumped during development, so a hash of the exporter sources is appended
+def get_exporter_version() -> str:
+    try:
+        with open(os.path.join(__PACKAGE_DIR, "blender_manifest.toml"), "r", encoding="utf8") as file:
+            match = re.search(r'^version\s*=\s*"([^"]*)"', file.read(), re.MULTILINE)
+        version = match.group(1) if match else "unknown"
+    except OSError:
+        version = "unknown"
+
+    hasher = hashlib.blake2b(digest_size=8)
+    for file_name in sorted(os.listdir(__PACKAGE_DIR)):
+        if file_name.endswith(".py"):
+            with open(os.path.join(__PACKAGE_DIR, file_name), "rb") as file:
+                hasher.update(file_name.encode("utf8"))
+                hasher.update(file.read())
+
+    return f"{version}+{hasher.hexdigest()}"
+
+
+class ExportManifest:
+    def __init__(self, output_folder: str):
+        self.__path = os.path.join(output_folder, MANIFEST_FILE_NAME)
+        self.__exporter_version = get_exporter_version()
+
+        try:
+            with open(self.__path, "r", encoding="utf8") as file:
+                self.__entries: Dict[str, Dict] = json.load(file)["sources"]
+        except (OSError, ValueError, KeyError, TypeError):
+            self.__entries = {}
+
+    # Returns why the source must be exported, or None if it is up to date, and the source hash
+    def check(self, blend_path: str, output_paths: List[str], options: Dict) -> Tuple[Optional[str], str]:
+        source_hash = hash_file(blend_path)
+        entry = self.__entries.get(self.__make_key(blend_path))
+
+        if entry is None:
+            reason = "new source"
+        elif entry.get("source hash") != source_hash:
+            reason = "source changed"
+        elif entry.get("exporter version") != self.__exporter_version:
+            reason = "exporter version changed"
+        elif entry.get("options") != options:
+            reason = "options changed"
+        elif not all(os.path.isfile(x) for x in output_paths):
+            reason = "output missing"
+        else:
+            reason = None
+
+        return reason, source_hash
+
+    def update(self, blend_path: str, source_hash: str, options: Dict):
+        self.__entries[self.__make_key(blend_path)] = {
+            "source hash": source_hash,
+            "exporter version": self.__exporter_version,
+            "options": options,
+        }
+
+    def save(self):
+        with open(self.__path, "w", encoding="utf8") as file:
+            json.dump({"sources": self.__entries}, file, indent=4)
+
+    @staticmethod
+    def __make_key(blend_path: str):
+        return os.path.normcase(os.path.abspath(blend_path))
@@ -0,0 +1,178 @@
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+
+# Export settings shared by the operator and the command line, as a flat dict of JSON compatible values, so that they
+# can be recorded in the output and in the export manifest as they are.
+# Operator properties are named "option_" + key, or "option_enum_" + key for enums, whose items are "OPT_1", "OPT_2"...
+# in the order of `ENUM_CHOICES`.
+# This module does not import bpy, so the batch driver can resolve the settings without starting Blender.
+
+
+DEFAULT_SETTINGS = {
+    "copy_images": False,
+    "incremental_images": False,
+    "hard_link_images": False,
+    "deduplicate_images": False,
+    "texture_max_size": 0,
+    "texture_format": "original",
+    "compress_binary": True,
+    "embed_binary": False,
+    "exclude_hidden": "meshes",
+    "reduce_keyframes": False,
+    "reduce_pos_tolerance": 0.0001,
+    "reduce_rot_tolerance": 0.0001,
+    "reduce_scale_tolerance": 0.0001,
+    "rotation_layout": "triplets",
+    "anim_block_seconds": 0.0,
+    "only_relevant_actions": False,
+    "encode_executor": "serial",
+    "encode_workers": 0,
+    "do_profile": False,
+    "attribution_report": False,
+    "memory_profile": False,
+}
+
+ENUM_CHOICES: Dict[str, Tuple[str, ...]] = {
+    "texture_format": ("original", "png", "dtex"),
+    "exclude_hidden": ("none", "meshes", "all"),
+    "rotation_layout": ("triplets", "smallest_three_48", "smallest_three_32"),
+    "encode_executor": ("serial", "thread", "process", "pipeline"),
+}
+
+# Presets override only the settings listed, so that choices like whether to copy textures are kept
+PRESETS: Dict[str, Dict] = {
+    # Fastest turnaround while working on a scene
+    "iterate": {
+        "incremental_images": True,
+        "hard_link_images": True,
+        "deduplicate_images": False,
+        "texture_max_size": 0,
+        "texture_format": "original",
+        "compress_binary": False,
+        "embed_binary": False,
+        "exclude_hidden": "meshes",
+        "reduce_keyframes": False,
+        "rotation_layout": "triplets",
+        "only_relevant_actions": False,
+        # Encoding in threads holds the GIL, and processes take time to start
+        "encode_executor": "serial",
+        "do_profile": False,
+    },
+    # Smallest output for release builds
+    "ship": {
+        "incremental_images": False,
+        "hard_link_images": False,
+        "deduplicate_images": True,
+        "compress_binary": True,
+        "embed_binary": False,
+        "exclude_hidden": "meshes",
+        "reduce_keyframes": True,
+        "rotation_layout": "smallest_three_48",
+        "only_relevant_actions": True,
+        "encode_executor": "process",
+        "do_profile": False,
+    },
+}
+
+NO_PRESET = "none"
+
+# Command line exports without a preset, or with the "none" preset, keep the settings they had before presets existed
+CLI_DEFAULT_SETTINGS = {
+    "embed_binary": True,
+    "exclude_hidden": "none",
+}
+
+# Older names still accepted in server jobs
+__SETTING_ALIASES = {
+    "texture": "copy_images",
+}
+
+
+def validate_settings(settings: Dict):
+    for key, value in settings.items():
+        if key not in DEFAULT_SETTINGS:
+            raise ValueError(f"Unknown export setting: '{key}'")
+        if key in ENUM_CHOICES and value not in ENUM_CHOICES[key]:
+            raise ValueError(f"Invalid value of export setting '{key}': '{value}', expected one of {ENUM_CHOICES[key]}")
+
+
+# Overrides are applied on top of the preset, which is applied on top of `base` or the defaults
+def make_settings(preset: str = NO_PRESET, overrides: Optional[Dict] = None, base: Optional[Dict] = None) -> Dict:
+    if preset != NO_PRESET and preset not in PRESETS:
+        raise ValueError(f"Unknown export preset: '{preset}', expected one of {list(PRESETS.keys())}")
+
+    output = dict(DEFAULT_SETTINGS)
+    for layer in (base, PRESETS.get(preset), overrides):
+        if layer:
+            layer = {__SETTING_ALIASES.get(k, k): v for k, v in layer.items()}
+            validate_settings(layer)
+            output.update(layer)
+    return output
+
+
+# Whether the settings differ from what the preset sets
+def is_preset_modified(preset: str, settings: Dict) -> bool:
+    return any(settings.get(k) != v for k, v in PRESETS.get(preset, {}).items())
+
+
+# Recorded in the output JSON
+def make_settings_record(preset: str, settings: Dict) -> Dict:
+    return {
+        "preset": preset,
+        "preset modified": is_preset_modified(preset, settings),
+        "settings": dict(settings),
+    }
+
+
+def get_arg_name(key: str) -> str:
+    return "--" + key.replace("_", "-")
+
+
+# Every setting gets a flag, whose default is None so that only the given ones override the preset
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--preset",
+        type=str,
+        choices=[NO_PRESET, *PRESETS.keys()],
+        default=None,
+        help="Named export settings, which other flags override"
+    )
+
+    for key, default in DEFAULT_SETTINGS.items():
+        if key in ENUM_CHOICES:
+            parser.add_argument(get_arg_name(key), dest=key, type=str, choices=ENUM_CHOICES[key], default=None)
+        elif isinstance(default, bool):
+            parser.add_argument(get_arg_name(key), dest=key, action=argparse.BooleanOptionalAction, default=None)
+        else:
+            parser.add_argument(get_arg_name(key), dest=key, type=type(default), default=None)
+
+    # Kept from before every setting had a flag
+    parser.add_argument("--texture", dest="copy_images", action=argparse.BooleanOptionalAction, default=None)
+
+
+# Options of command line exports and server jobs are an optional "preset" and settings overriding it.
+# Returns the preset name and resolved settings.
+def make_settings_from_options(options: Dict) -> Tuple[str, Dict]:
+    overrides = dict(options)
+    preset = overrides.pop("preset", None)
+
+    if preset is None or NO_PRESET == preset:
+        return NO_PRESET, make_settings(NO_PRESET, overrides, CLI_DEFAULT_SETTINGS)
+    else:
+        return preset, make_settings(preset, overrides)
+
+
+# Only the flags given are included, for arguments parsed by a parser given to `add_arguments`
+def make_options_from_args(args: argparse.Namespace) -> Dict:
+    output = {k: getattr(args, k) for k in DEFAULT_SETTINGS.keys() if getattr(args, k) is not None}
+    if args.preset is not None:
+        output["preset"] = args.preset
+    return output
+
+
+def parse_settings_args(args: List[str]) -> Tuple[str, Dict]:
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    add_arguments(parser)
+    parsed, unknown = parser.parse_known_args(args)
+    return make_settings_from_options(make_options_from_args(parsed))
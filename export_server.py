@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import traceback
+from typing import Callable, Dict, Optional
+
+try:
+    from . import export_options as eop
+except ImportError:
+    import export_options as eop
+
+
+# A long running exporter serves export jobs over a local TCP socket, so that Blender starts up only once for many
+# files. Each message is a JSON object on a single line, and every request gets exactly one reply.
+#
+# Request:  {"blend path": str, "output folder": str, "options": {"preset": str, setting: value, ...}}
+#           {"command": "shutdown"}
+# Reply:    {"status": "ok" or "error", "error": str, "timings": {name: seconds}, ...}
+# Options are resolved by export_options like command line flags.
+#
+# This module does not import bpy, so the server loop can be driven by a stand-in handler, and the client can be used
+# from any Python.
+
+
+DEFAULT_HOST = "127.0.0.1"
+
+
+class _LineSocket:
+    def __init__(self, sock: socket.socket):
+        self.__sock = sock
+        self.__file = sock.makefile("rwb")
+
+    def read_message(self) -> Optional[Dict]:
+        line = self.__file.readline()
+        if not line:
+            return None
+        return json.loads(line.decode("utf8"))
+
+    def write_message(self, message: Dict):
+        self.__file.write(json.dumps(message).encode("utf8") + b"\n")
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+        self.__sock.close()
+
+
+def _handle_job(handler: Callable[[Dict], Dict], job: Dict) -> Dict:
+    st = time.time()
+    try:
+        output = handler(job)
+    except Exception as e:
+        traceback.print_exc()
+        output = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    else:
+        output.setdefault("status", "ok")
+
+    output.setdefault("timings", {})
+    output["timings"]["total"] = time.time() - st
+    return output
+
+
+# Jobs are handled one at a time on the calling thread, since Blender data can only be touched from its main thread.
+# Returns when a shutdown command is received.
+def serve(
+    handler: Callable[[Dict], Dict],
+    host: str = DEFAULT_HOST,
+    port: int = 0,
+    on_listening: Optional[Callable[[int], None]] = None,
+):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen()
+
+        bound_port = server.getsockname()[1]
+        print(f"[DAL] Export server listening on {host}:{bound_port}", flush=True)
+        if on_listening is not None:
+            on_listening(bound_port)
+
+        while True:
+            conn, address = server.accept()
+            client = _LineSocket(conn)
+            try:
+                while True:
+                    try:
+                        message = client.read_message()
+                    except ValueError as e:
+                        client.write_message({"status": "error", "error": f"Invalid message: {e}"})
+                        continue
+
+                    if message is None:
+                        break
+                    if "shutdown" == message.get("command"):
+                        client.write_message({"status": "ok"})
+                        return
+
+                    client.write_message(_handle_job(handler, message))
+            except OSError as e:
+                print(f"[DAL] Export server lost a client {address}: {e}", flush=True)
+            finally:
+                client.close()
+
+
+class ExportClient:
+    def __init__(self, port: int, host: str = DEFAULT_HOST, timeout: Optional[float] = None):
+        self.__client = _LineSocket(socket.create_connection((host, port), timeout=timeout))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # Paths are made absolute, since the server resolves relative paths against its own working directory
+    def export(self, blend_path: str, output_folder: str, options: Optional[Dict] = None) -> Dict:
+        self.__client.write_message({
+            "blend path": os.path.abspath(blend_path),
+            "output folder": os.path.abspath(output_folder),
+            "options": dict(options or {}),
+        })
+        return self.__read_reply()
+
+    def shutdown(self) -> Dict:
+        self.__client.write_message({"command": "shutdown"})
+        return self.__read_reply()
+
+    def close(self):
+        self.__client.close()
+
+    def __read_reply(self) -> Dict:
+        reply = self.__client.read_message()
+        if reply is None:
+            raise ConnectionError("Export server closed the connection")
+        return reply
+
+
+def __parse_args():
+    parser = argparse.ArgumentParser(description="Send export jobs to a running export server.")
+
+    parser.add_argument("blend_paths", nargs="*", help="Paths of .blend files to export")
+    parser.add_argument("--port", type=int, required=True, help="")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="")
+    parser.add_argument("--output-folder", dest="output_folder", type=str, default=".", help="")
+    eop.add_arguments(parser)
+    parser.add_argument("--shutdown", action="store_true", help="Stop the server after the jobs")
+
+    return parser.parse_args()
+
+
+def __cmd_client() -> int:
+    args = __parse_args()
+    failed = False
+
+    with ExportClient(args.port, args.host) as client:
+        for blend_path in args.blend_paths:
+            reply = client.export(blend_path, args.output_folder, eop.make_options_from_args(args))
+            print(json.dumps({"blend path": blend_path, **reply}), flush=True)
+            failed = failed or ("ok" != reply.get("status"))
+
+        if args.shutdown:
+            client.shutdown()
+
+    return 1 if failed else 0
+
+
+if "__main__" == __name__:
+    sys.exit(__cmd_client())
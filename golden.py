@@ -0,0 +1,435 @@
+import os
+import sys
+import copy
+import json
+import math
+import zlib
+import array
+import base64
+import shlex
+import struct
+import argparse
+import importlib
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    from . import batch_export as bat
+    from . import data_struct as dst
+    from . import anim_compress as acp
+except ImportError:
+    # Run as a script. data_struct imports its siblings relatively, so it is imported as a module of the package.
+    __package_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(__package_dir))
+    bat = importlib.import_module(os.path.basename(__package_dir) + ".batch_export")
+    dst = importlib.import_module(os.path.basename(__package_dir) + ".data_struct")
+    acp = importlib.import_module(os.path.basename(__package_dir) + ".anim_compress")
+
+
+# Checks that an optimized export path produces the same output as the reference path. Each .blend file of a corpus is
+# exported twice by background Blender, once with the reference export arguments and once with the candidate ones,
+# and the outputs are compared. JSON is compared structurally, and the binary block by block, so that the first
+# difference is reported by its JSON path or by the name of its block.
+#
+#   python golden.py --blender path/to/blender a.blend b.blend --candidate-args="--encode-executor process"
+#   python golden.py --compare-only --output-folder golden_output a.blend b.blend
+#
+# Float arrays of vertex blocks may differ within `--tolerance`. Other vertex blocks must match byte for byte.
+# Joints data of animations is decoded into keys, so that exports with different key and rotation layouts can be
+# compared. Positions and scales may differ within `--tolerance`, and rotations by up to `--rotation-tolerance`
+# degrees, for packed rotation layouts, which quantize them.
+
+
+# Top level keys expected to differ between export settings
+IGNORED_KEYS = ("export settings", "binary data")
+
+# Vertex block fields holding only float32 values
+FLOAT_BLOCK_FIELDS = (
+    "vertices binary data",
+    "uv coordinates binary data",
+    "normals binary data",
+    "tangents binary data",
+)
+
+# Animation keys describing where and how the joints data is laid out, which is compared decoded instead
+ANIMATION_LAYOUT_KEYS = (
+    "joints data loc",
+    "joints data size",
+    "key layout",
+    "block duration",
+    "rotation layout",
+    "max rotation decode error degrees",
+)
+
+TRACK_NAMES = ("positions", "rotations", "scales")
+TRACK_DEFAULTS = ((0.0, 0.0, 0.0), (1.0, 0.0, 0.0, 0.0), (1.0, 1.0, 1.0))
+
+
+class Difference:
+    def __init__(self, location: str, message: str):
+        self.location = str(location)
+        self.message = str(message)
+
+    def __str__(self):
+        return f"{self.location}: {self.message}"
+
+
+# Returns the JSON and the uncompressed binary of an exported file
+def load_export(json_path: str) -> Tuple[Dict, bytes]:
+    with open(json_path, "r", encoding="utf8") as file:
+        json_data = json.load(file)
+
+    bin_info = json_data.get("binary data", {})
+    if "base64" in bin_info:
+        bin_data = base64.b64decode(bin_info["base64"])
+    else:
+        with open(os.path.splitext(json_path)[0] + ".bin", "rb") as file:
+            bin_data = file.read()
+
+    if "compressed size" in bin_info:
+        bin_data = zlib.decompress(bin_data)
+
+    return json_data, bin_data
+
+
+def _iter_mesh_blocks(name: str, mesh: Dict) -> Iterator[Tuple[str, str, int, int]]:
+    for field_name, value in mesh.items():
+        if isinstance(value, dict) and "position" in value and "size" in value:
+            yield name, field_name, value["position"], value["size"]
+
+
+# Name, field name, position and size of every binary block referred by the JSON, in the order of the JSON
+def iter_blocks(json_data: Dict) -> Iterator[Tuple[str, str, int, int]]:
+    for scene in json_data.get("scenes", []):
+        scene_name = scene.get("name", "")
+
+        for mesh in scene.get("meshes", []):
+            yield from _iter_mesh_blocks(f"scene '{scene_name}' mesh '{mesh['name']}'", mesh)
+
+        for anim in scene.get("animations", []):
+            name = f"scene '{scene_name}' animation '{anim['name']}'"
+            yield name, "joints data", anim["joints data loc"], anim["joints data size"]
+
+        for water in scene.get("water planes", []):
+            for mesh in water.get("mesh", []):
+                yield from _iter_mesh_blocks(f"scene '{scene_name}' water plane '{water['name']}'", mesh)
+
+
+def _iter_animations(json_data: Dict) -> Iterator[Tuple[str, Dict]]:
+    for scene in json_data.get("scenes", []):
+        for anim in scene.get("animations", []):
+            yield f"scene '{scene.get('name', '')}' animation '{anim['name']}'", anim
+
+
+class _Reader:
+    def __init__(self, data: bytes, offset: int = 0):
+        self.__data = data
+        self.offset = int(offset)
+
+    def read(self, fmt: str):
+        values = struct.unpack_from(fmt, self.__data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values[0] if 1 == len(values) else values
+
+    def read_bytes(self, size: int) -> bytes:
+        if self.offset + size > len(self.__data):
+            raise ValueError("joints data ended early")
+        output = self.__data[self.offset:self.offset + size]
+        self.offset += size
+        return output
+
+    def read_str(self) -> str:
+        end = self.__data.index(b"\0", self.offset)
+        output = self.__data[self.offset:end].decode("utf-8")
+        self.offset = end + 1
+        return output
+
+
+def _read_triplet_samples(reader: _Reader, defaults: Tuple[float, ...]):
+    keys = dst.AnimJoint().positions
+    for _ in range(reader.read("<i")):
+        time_point, channel, value = reader.read("<fhf")
+        keys.add(time_point, channel, value)
+    return keys.make_samples(defaults)
+
+
+def _read_rotation(reader: _Reader, bits: Optional[Tuple[int, int, int]]) -> Tuple[float, ...]:
+    if bits is None:
+        return reader.read("<ffff")
+    packed = int.from_bytes(reader.read_bytes(acp.get_smallest_three_byte_size(bits)), "little")
+    return acp.unpack_smallest_three(packed, bits)
+
+
+# Joint name -> samples of positions, rotations and scales, where every key has a value for every channel
+def decode_joints_data(anim_json: Dict, data: bytes) -> Dict[str, Tuple]:
+    rotation_layout = dst.RotationLayout(anim_json.get("rotation layout", dst.RotationLayout.triplets.value))
+    bits = dst.ROTATION_LAYOUT_BITS.get(rotation_layout)
+    reader = _Reader(data)
+    output = {}
+
+    if "blocked" != anim_json.get("key layout"):
+        for _ in range(reader.read("<i")):
+            joint_name = reader.read_str()
+            positions = _read_triplet_samples(reader, TRACK_DEFAULTS[0])
+            if bits is None:
+                rotations = _read_triplet_samples(reader, TRACK_DEFAULTS[1])
+            else:
+                rotations = [(reader.read("<f"), _read_rotation(reader, bits)) for _ in range(reader.read("<i"))]
+            scales = _read_triplet_samples(reader, TRACK_DEFAULTS[2])
+            output[joint_name] = (positions, rotations, scales)
+        return output
+
+    joint_count = reader.read("<i")
+    reader.read("<ff")
+    index = []
+    for _ in range(joint_count):
+        joint_name = reader.read_str()
+        index.append((joint_name, [[reader.read("<fii") for _ in range(reader.read("<i"))] for _ in range(3)]))
+
+    # Blocks hold the keys right before and after them too, so keys are collected by time point
+    for joint_name, tracks in index:
+        joint_samples = []
+        for track_index, blocks in enumerate(tracks):
+            samples = {}
+            for block_start, offset, key_count in blocks:
+                keys = _Reader(data, offset)
+                for _ in range(key_count):
+                    time_point = keys.read("<f")
+                    if 1 == track_index:
+                        samples[time_point] = _read_rotation(keys, bits)
+                    else:
+                        samples[time_point] = keys.read("<fff")
+            joint_samples.append(sorted(samples.items()))
+        output[joint_name] = tuple(joint_samples)
+    return output
+
+
+def compare_animations(
+    name: str,
+    reference: Dict[str, Tuple],
+    candidate: Dict[str, Tuple],
+    tolerance: float,
+    rotation_tolerance: float,
+) -> Optional[Difference]:
+    if list(reference.keys()) != list(candidate.keys()):
+        return Difference(name, f"joints {list(reference.keys())} != {list(candidate.keys())}")
+
+    for joint_name, reference_tracks in reference.items():
+        for track_name, x, y in zip(TRACK_NAMES, reference_tracks, candidate[joint_name]):
+            location = f"{name} joint '{joint_name}' {track_name}"
+            if len(x) != len(y):
+                return Difference(location, f"key count {len(x)} != {len(y)}")
+
+            for i, ((time0, values0), (time1, values1)) in enumerate(zip(x, y)):
+                if time0 != time1:
+                    return Difference(location, f"key {i} time {time0} != {time1}")
+                if tuple(values0) == tuple(values1):
+                    continue
+
+                if "rotations" == track_name:
+                    angle = math.degrees(acp.angle_between_quats(values0, values1))
+                    if angle > rotation_tolerance:
+                        return Difference(
+                            location, f"key {i} differs by {angle} degrees, more than {rotation_tolerance}"
+                        )
+                else:
+                    error = max(abs(a - b) for a, b in zip(values0, values1))
+                    if error > tolerance:
+                        return Difference(location, f"key {i} differs by {error}, more than {tolerance}")
+
+    return None
+
+
+# Without binary locations, which differ once any block size differs, and layouts of animations, whose joints data is
+# compared decoded
+def _make_comparable_json(json_data: Dict) -> Dict:
+    output = copy.deepcopy(json_data)
+    for scene in output.get("scenes", []):
+        meshes = scene.get("meshes", []) + [x for water in scene.get("water planes", []) for x in water.get("mesh", [])]
+        for mesh in meshes:
+            for value in mesh.values():
+                if isinstance(value, dict) and "position" in value and "size" in value:
+                    del value["position"]
+        for anim in scene.get("animations", []):
+            for key in ANIMATION_LAYOUT_KEYS:
+                anim.pop(key, None)
+    return output
+
+
+def compare_json(reference, candidate, location: str = "") -> Optional[Difference]:
+    if isinstance(reference, dict) and isinstance(candidate, dict):
+        for key in reference.keys():
+            if not location and key in IGNORED_KEYS:
+                continue
+            if key not in candidate:
+                return Difference(f"{location}/{key}", "missing in the candidate")
+            difference = compare_json(reference[key], candidate[key], f"{location}/{key}")
+            if difference is not None:
+                return difference
+        for key in candidate.keys():
+            if key not in reference and not (not location and key in IGNORED_KEYS):
+                return Difference(f"{location}/{key}", "missing in the reference")
+        return None
+
+    if isinstance(reference, list) and isinstance(candidate, list):
+        for i, (x, y) in enumerate(zip(reference, candidate)):
+            difference = compare_json(x, y, f"{location}[{i}]")
+            if difference is not None:
+                return difference
+        if len(reference) != len(candidate):
+            return Difference(location, f"length {len(reference)} != {len(candidate)}")
+        return None
+
+    if reference != candidate:
+        return Difference(location, f"{reference!r} != {candidate!r}")
+    return None
+
+
+def compare_block(
+    name: str,
+    field_name: str,
+    reference: bytes,
+    candidate: bytes,
+    tolerance: float,
+) -> Optional[Difference]:
+    location = f"{name} {field_name}"
+    if len(reference) != len(candidate):
+        return Difference(location, f"size {len(reference)} != {len(candidate)}")
+
+    if tolerance > 0.0 and field_name in FLOAT_BLOCK_FIELDS and 0 == len(reference) % 4:
+        reference_floats = array.array("f", reference)
+        candidate_floats = array.array("f", candidate)
+        for i, (x, y) in enumerate(zip(reference_floats, candidate_floats)):
+            if abs(x - y) > tolerance:
+                return Difference(location, f"float {i} differs by {abs(x - y)}, more than {tolerance}")
+        return None
+
+    if reference != candidate:
+        offset = next(i for i, (x, y) in enumerate(zip(reference, candidate)) if x != y)
+        return Difference(location, f"first differing byte at offset {offset}")
+    return None
+
+
+# Returns the first difference, or None if the exports are equivalent
+def compare_exports(
+    reference_path: str,
+    candidate_path: str,
+    tolerance: float = 0.0,
+    rotation_tolerance: float = 0.0,
+) -> Optional[Difference]:
+    reference_json, reference_bin = load_export(reference_path)
+    candidate_json, candidate_bin = load_export(candidate_path)
+
+    # Blocks are compared first, so that a different block is reported by its name rather than by its position
+    reference_blocks = list(iter_blocks(reference_json))
+    candidate_blocks = list(iter_blocks(candidate_json))
+    for (name, field_name, pos0, size0), (_, _, pos1, size1) in zip(reference_blocks, candidate_blocks):
+        if "joints data" == field_name:
+            continue
+        difference = compare_block(
+            name, field_name, reference_bin[pos0:pos0 + size0], candidate_bin[pos1:pos1 + size1], tolerance
+        )
+        if difference is not None:
+            return difference
+
+    for (name, anim0), (_, anim1) in zip(_iter_animations(reference_json), _iter_animations(candidate_json)):
+        try:
+            reference_keys = decode_joints_data(anim0, __get_joints_data(anim0, reference_bin))
+            candidate_keys = decode_joints_data(anim1, __get_joints_data(anim1, candidate_bin))
+        except (ValueError, IndexError, struct.error, UnicodeDecodeError) as e:
+            return Difference(name, f"failed to decode joints data: {e}")
+
+        difference = compare_animations(name, reference_keys, candidate_keys, tolerance, rotation_tolerance)
+        if difference is not None:
+            return difference
+
+    return compare_json(_make_comparable_json(reference_json), _make_comparable_json(candidate_json))
+
+
+def __get_joints_data(anim_json: Dict, bin_data: bytes) -> bytes:
+    begin = anim_json["joints data loc"]
+    return bin_data[begin:begin + anim_json["joints data size"]]
+
+
+def __get_pure_file_name(blend_path: str) -> str:
+    return os.path.split(os.path.splitext(blend_path)[0])[-1]
+
+
+def __parse_args():
+    parser = argparse.ArgumentParser(description="Compare exports of a reference and a candidate export path.")
+
+    parser.add_argument("blend_paths", nargs="+", help="Paths of .blend files of the corpus")
+    parser.add_argument("--blender", dest="blender_path", type=str, default="blender", help="Path of Blender executable")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Number of Blender processes")
+    parser.add_argument("--output-folder", dest="output_folder", type=str, default="golden_output", help="")
+    parser.add_argument(
+        "--reference-args",
+        dest="reference_args",
+        type=str,
+        default="--preset none",
+        help="Export arguments of the reference path"
+    )
+    parser.add_argument(
+        "--candidate-args",
+        dest="candidate_args",
+        type=str,
+        default="--preset none",
+        help="Export arguments of the path to be checked"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.0, help="Allowed difference of vertex floats and animation keys"
+    )
+    parser.add_argument(
+        "--rotation-tolerance",
+        dest="rotation_tolerance",
+        type=float,
+        default=0.0,
+        help="Allowed angle between rotation keys in degrees, for packed rotation layouts"
+    )
+    parser.add_argument(
+        "--compare-only",
+        dest="compare_only",
+        action="store_true",
+        help="Compare exports already in the output folder without running Blender"
+    )
+
+    return parser.parse_args()
+
+
+def __cmd_golden() -> int:
+    args = __parse_args()
+    reference_folder = os.path.join(args.output_folder, "reference")
+    candidate_folder = os.path.join(args.output_folder, "candidate")
+
+    if not args.compare_only:
+        for folder, export_args in ((reference_folder, args.reference_args), (candidate_folder, args.candidate_args)):
+            results, wall_time = bat.run_batch(
+                args.blender_path, args.blend_paths, folder, args.jobs, shlex.split(export_args), use_manifest=False
+            )
+            if not all(x.succeeded for x in results):
+                print(f"[DAL] Failed to export the corpus into {folder}")
+                return 1
+
+    failed = False
+    for blend_path in args.blend_paths:
+        file_name = __get_pure_file_name(blend_path) + ".json"
+        try:
+            difference = compare_exports(
+                os.path.join(reference_folder, file_name),
+                os.path.join(candidate_folder, file_name),
+                args.tolerance,
+                args.rotation_tolerance,
+            )
+        except (OSError, ValueError, zlib.error) as e:
+            difference = Difference(file_name, f"failed to load: {e}")
+
+        if difference is None:
+            print(f"[DAL] SAME: {blend_path}")
+        else:
+            print(f"[DAL] DIFF: {blend_path}: {difference}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if "__main__" == __name__:
+    sys.exit(__cmd_golden())
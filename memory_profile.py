@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import tracemalloc
+import contextlib
+from typing import Dict, List, Optional
+
+
+# Peak Python allocations and process RSS of each export stage, with the top allocation sites of each, written as
+# "_memory.json" next to the exported file. Instrumented code calls the module level `stage`, which does nothing
+# unless a `MemoryProfiler` is active, like `timing.span`.
+# tracemalloc slows Python down severalfold, so this is meant to be turned on only to find out what blows up memory.
+# This module does not import bpy.
+
+
+TOP_SITE_COUNT = 10
+
+
+# Returns the resident set size of this process in bytes, or None if it is not known on the platform
+def get_rss() -> Optional[int]:
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm", "r") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+    elif "win32" == sys.platform:
+        return _get_rss_windows()
+    else:
+        try:
+            import resource
+        except ImportError:
+            return None
+        # Peak rather than current, in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _get_rss_windows() -> Optional[int]:
+    import ctypes
+    import ctypes.wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", ctypes.wintypes.DWORD),
+            ("PageFaultCount", ctypes.wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
+
+
+class StageResult:
+    def __init__(self, name: str):
+        self.name = str(name)
+        self.traced_before = 0
+        self.traced_after = 0
+        self.traced_peak = 0
+        self.rss_before: Optional[int] = None
+        self.rss_after: Optional[int] = None
+        # Sites of allocations made in the stage and still alive at its end
+        self.top_sites: List[Dict] = []
+
+    def make_json(self) -> Dict:
+        return {
+            "name": self.name,
+            "traced before": self.traced_before,
+            "traced after": self.traced_after,
+            "traced peak": self.traced_peak,
+            "peak growth": self.traced_peak - self.traced_before,
+            "rss before": self.rss_before,
+            "rss after": self.rss_after,
+            "top sites": self.top_sites,
+        }
+
+
+class MemoryProfiler:
+    def __init__(self, frame_count: int = 1):
+        self.__frame_count = int(frame_count)
+        self.__stages: List[StageResult] = []
+        self.__depth = 0
+        self.__started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.__frame_count)
+            self.__started_tracing = True
+
+    def stop(self):
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+    # Nested stages are not profiled separately, since resetting the peak would hide that of the outer stage
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if self.__depth > 0 or not tracemalloc.is_tracing():
+            yield
+            return
+
+        result = StageResult(name)
+        result.rss_before = get_rss()
+        # Before Python 3.9, peaks are of the whole trace up to the stage
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot()
+        result.traced_before = tracemalloc.get_traced_memory()[0]
+
+        self.__depth += 1
+        try:
+            yield
+        finally:
+            self.__depth -= 1
+            result.traced_after, result.traced_peak = tracemalloc.get_traced_memory()
+            result.rss_after = get_rss()
+            result.top_sites = self.__find_top_sites(snapshot_before, tracemalloc.take_snapshot())
+            self.__stages.append(result)
+
+    def make_json(self) -> Dict:
+        return {
+            "stages": [x.make_json() for x in self.__stages],
+            "peak stage": max(self.__stages, key=lambda x: x.traced_peak).name if self.__stages else "",
+        }
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf8") as file:
+            json.dump(self.make_json(), file, indent=4)
+
+    def print_summary(self):
+        print("[DAL] Memory by stage (MB): traced peak, peak growth, RSS after")
+        for x in self.__stages:
+            rss = f"{x.rss_after / 1e6:.1f}" if x.rss_after is not None else "?"
+            print(
+                f"[DAL]     {x.name:<16} {x.traced_peak / 1e6:>10.1f} {(x.traced_peak - x.traced_before) / 1e6:>10.1f} "
+                f"{rss:>10}"
+            )
+            if x.top_sites:
+                site = x.top_sites[0]
+                print(f"[DAL]         top site: {site['location']} ({site['size'] / 1e6:.1f} MB)")
+
+    @staticmethod
+    def __find_top_sites(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> List[Dict]:
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        stats.sort(key=lambda x: x.size_diff, reverse=True)
+
+        output = []
+        for stat in stats[:TOP_SITE_COUNT]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            output.append({
+                "location": f"{frame.filename}:{frame.lineno}",
+                "size": stat.size_diff,
+                "count": stat.count_diff,
+            })
+        return output
+
+
+_active: Optional[MemoryProfiler] = None
+
+
+# Does nothing if `profiler` is None, so that callers need not branch on whether profiling is enabled
+@contextlib.contextmanager
+def activate(profiler: Optional[MemoryProfiler]):
+    if profiler is None:
+        yield None
+        return
+
+    global _active
+    previous = _active
+    _active = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = previous
+
+
+def stage(name: str):
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
@@ -0,0 +1,156 @@
+import time
+import threading
+import contextlib
+from typing import Callable, Dict, Optional
+
+
+# Progress and cancellation of an export. Like `timing`, instrumented code calls the module level functions, which
+# report to the active `Progress` if any and do nothing otherwise.
+# The export runs through weighted stages, and the fraction done is estimated from the items done in the current
+# stage, such as objects while parsing and meshes and actions while building. Counters like bytes are only reported.
+# Cancellation is requested with `Progress.cancel`, from any thread or from the callback, and takes effect at the next
+# `check_cancelled`, which is called between objects, mesh chunks and encoded items.
+# This module does not import bpy.
+
+
+# Stage name -> share of the whole export, in the order of the stages. Stages may be skipped, like encoding in serial
+# exports, so the fraction of a stage starts after the shares of all stages before it.
+STAGE_WEIGHTS = {
+    "parse": 0.55,
+    "encode": 0.15,
+    "build": 0.15,
+    "write": 0.15,
+}
+
+_STAGE_STARTS = {name: sum(list(STAGE_WEIGHTS.values())[:i]) for i, name in enumerate(STAGE_WEIGHTS.keys())}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ProgressState:
+    def __init__(self, stage: str, done: int, total: int, fraction: float, counters: Dict[str, int]):
+        self.stage = str(stage)
+        self.done = int(done)
+        self.total = int(total)
+        # Of the whole export, from 0 to 1
+        self.fraction = float(fraction)
+        self.counters = dict(counters)
+
+    def __str__(self):
+        output = f"{self.fraction * 100.0:5.1f}% {self.stage} {self.done}/{self.total}"
+        if self.counters:
+            output += " (" + ", ".join(f"{k}: {v}" for k, v in self.counters.items()) + ")"
+        return output
+
+
+class Progress:
+    # `callback` is called with a `ProgressState` at most once every `min_interval` seconds, and whenever a stage begins
+    def __init__(self, callback: Optional[Callable[[ProgressState], None]] = None, min_interval: float = 0.1):
+        self.__callback = callback
+        self.__min_interval = float(min_interval)
+        self.__cancelled = threading.Event()
+        self.__lock = threading.Lock()
+
+        self.__stage = ""
+        self.__done = 0
+        self.__total = 0
+        self.__counters: Dict[str, int] = {}
+        self.__last_report = 0.0
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.__cancelled.is_set()
+
+    def check_cancelled(self):
+        if self.__cancelled.is_set():
+            raise ExportCancelled(f"Export cancelled while in stage '{self.__stage}'")
+
+    def begin_stage(self, name: str, total: int):
+        with self.__lock:
+            self.__stage = str(name)
+            self.__done = 0
+            self.__total = int(total)
+        self.__report(True)
+
+    def advance(self, amount: int = 1):
+        with self.__lock:
+            self.__done += amount
+        self.__report(False)
+
+    def add(self, name: str, amount: int = 1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + amount
+
+    def make_state(self) -> ProgressState:
+        with self.__lock:
+            stage_fraction = min(1.0, self.__done / self.__total) if self.__total > 0 else 0.0
+            fraction = _STAGE_STARTS.get(self.__stage, 0.0) + STAGE_WEIGHTS.get(self.__stage, 0.0) * stage_fraction
+            return ProgressState(self.__stage, self.__done, self.__total, min(1.0, fraction), self.__counters)
+
+    def __report(self, force: bool):
+        if self.__callback is None:
+            return
+
+        now = time.perf_counter()
+        if not force and now - self.__last_report < self.__min_interval:
+            return
+        self.__last_report = now
+        self.__callback(self.make_state())
+
+
+# Runs every step of a generator that yields between steps on the calling thread, and returns what it returns
+def run_steps(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+
+# Callback for command line exports
+def print_progress(state: ProgressState):
+    print(f"[DAL] Progress: {state}")
+
+
+_active: Optional[Progress] = None
+
+
+# Does nothing if `progress` is None, so that callers need not branch on whether progress is reported
+@contextlib.contextmanager
+def activate(progress: Optional[Progress]):
+    if progress is None:
+        yield None
+        return
+
+    global _active
+    previous = _active
+    _active = progress
+    try:
+        yield progress
+    finally:
+        _active = previous
+
+
+def begin_stage(name: str, total: int):
+    if _active is not None:
+        _active.begin_stage(name, total)
+
+
+def advance(amount: int = 1):
+    if _active is not None:
+        _active.advance(amount)
+
+
+def add(name: str, amount: int = 1):
+    if _active is not None:
+        _active.add(name, amount)
+
+
+def check_cancelled():
+    if _active is not None:
+        _active.check_cancelled()
@@ -0,0 +1,470 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import multiprocessing
+import concurrent.futures
+from typing import List, Dict, Optional, Tuple
+
+from . import texture_process as tpr
+from . import timing as tmg
+
+
+MANIFEST_FILE_NAME = "_manifest.json"
+
+__HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(__HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# An existing destination may be a hard link to the source, so it is unlinked rather than overwritten
+def remove_existing_file(path: str):
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def copy_and_hash_file(src_path: str, dst_path: str) -> str:
+    remove_existing_file(dst_path)
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(src_path, "rb") as src_file, open(dst_path, "wb") as dst_file:
+        for chunk in iter(lambda: src_file.read(__HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            dst_file.write(chunk)
+    shutil.copystat(src_path, dst_path)
+    return hasher.hexdigest()
+
+
+# A texture to be written into the texture folder under `name`, either from a file or from bytes of a packed image
+class TextureSource:
+    def __init__(self, name: str, src_path: str = "", data: Optional[bytes] = None):
+        self.__name = str(name)
+        self.__src_path = str(src_path)
+        self.__data = None if data is None else bytes(data)
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def src_path(self):
+        return self.__src_path
+
+    @property
+    def data(self):
+        return self.__data
+
+    @property
+    def size(self) -> int:
+        if self.__data is not None:
+            return len(self.__data)
+        else:
+            return os.path.getsize(self.__src_path)
+
+    def compute_hash(self) -> str:
+        if self.__data is not None:
+            return hash_bytes(self.__data)
+        else:
+            return hash_file(self.__src_path)
+
+
+class DuplicateReport:
+    def __init__(self):
+        # Name of a duplicate texture -> name of the texture with the same content that is actually written
+        self.canonical_names: Dict[str, str] = {}
+        self.saved_bytes = 0
+
+
+# Content hash of the source. Hashes of files are looked up in `manifest` by path, size and mtime, if it is given, and
+# recorded there when they have to be computed, so that unchanged files are not read again by later exports.
+def hash_source(source: TextureSource, manifest: Optional["TextureManifest"] = None) -> str:
+    if source.data is not None or manifest is None:
+        return source.compute_hash()
+
+    src_stat = os.stat(source.src_path)
+    content_hash = manifest.get_source_hash(source.src_path, src_stat.st_size, src_stat.st_mtime)
+    if content_hash is None:
+        content_hash = hash_file(source.src_path)
+        manifest.set_source_hash(source.src_path, src_stat.st_size, src_stat.st_mtime, content_hash)
+    return content_hash
+
+
+# Textures with identical contents are grouped, and the alphabetically first name of each group becomes canonical.
+# Only textures with the same size as another one can be duplicates, so the others are never hashed. Hashes are
+# looked up in `manifest` if given, see `hash_source`.
+# Unreadable sources are left out, so that they are reported when they fail to be copied.
+def find_duplicates(
+    sources: List[TextureSource],
+    manifest: Optional["TextureManifest"] = None,
+    max_workers: int = 8,
+) -> DuplicateReport:
+    def try_get_size(source: TextureSource):
+        try:
+            return source.size
+        except OSError:
+            return None
+
+    def try_hash(source: TextureSource):
+        try:
+            return hash_source(source, manifest)
+        except OSError:
+            return None
+
+    sizes = [try_get_size(x) for x in sources]
+    size_counts: Dict[int, int] = {}
+    for size in sizes:
+        if size is not None:
+            size_counts[size] = size_counts.get(size, 0) + 1
+    candidates = [(x, size) for x, size in zip(sources, sizes) if size is not None and size_counts[size] > 1]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hashes = list(executor.map(try_hash, [x for x, size in candidates]))
+
+    groups: Dict[str, List[str]] = {}
+    group_sizes: Dict[str, int] = {}
+    for (source, size), content_hash in zip(candidates, hashes):
+        if content_hash is not None:
+            groups.setdefault(content_hash, []).append(source.name)
+            group_sizes[content_hash] = size
+
+    output = DuplicateReport()
+    for content_hash, names in groups.items():
+        names.sort()
+        for name in names[1:]:
+            output.canonical_names[name] = names[0]
+            output.saved_bytes += group_sizes[content_hash]
+    return output
+
+
+# File name in the texture folder -> source path, size, mtime and content hash of what was copied there.
+# Source path of a packed image is empty. Processed textures also have the cache key they were made with.
+# Later exports compare sources against it to decide whether a texture is up to date without reading it.
+# It also keeps source path -> size, mtime and content hash of every source file hashed so far, including those not
+# copied, like duplicates, so that hashes of unchanged sources are not computed again.
+class TextureManifest:
+    def __init__(self, folder_path: str):
+        self.__path = os.path.join(folder_path, MANIFEST_FILE_NAME)
+        self.__entries: Dict[str, Dict] = {}
+        self.__source_hashes: Dict[str, Dict] = {}
+        self.__lock = threading.Lock()
+
+        try:
+            with open(self.__path, "r", encoding="utf8") as file:
+                data = json.load(file)
+            self.__entries = data["textures"]
+            self.__source_hashes = data.get("source hashes", {})
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.__entries = {}
+            self.__source_hashes = {}
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self.__lock:
+            return self.__entries.get(name)
+
+    def set(
+        self,
+        name: str,
+        src_path: str,
+        size: int,
+        mtime: float,
+        content_hash: Optional[str],
+        cache_key: Optional[str] = None,
+    ):
+        with self.__lock:
+            self.__entries[name] = {
+                "source": src_path,
+                "size": size,
+                "mtime": mtime,
+                "hash": content_hash,
+            }
+            if cache_key is not None:
+                self.__entries[name]["cache key"] = cache_key
+
+    # Returns None unless the hash was recorded with the same size and mtime
+    def get_source_hash(self, src_path: str, size: int, mtime: float) -> Optional[str]:
+        with self.__lock:
+            entry = self.__source_hashes.get(src_path)
+        if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+            return None
+        return entry["hash"]
+
+    def set_source_hash(self, src_path: str, size: int, mtime: float, content_hash: str):
+        with self.__lock:
+            self.__source_hashes[src_path] = {
+                "size": size,
+                "mtime": mtime,
+                "hash": content_hash,
+            }
+
+    def save(self):
+        with self.__lock:
+            with open(self.__path, "w", encoding="utf8") as file:
+                json.dump({"textures": self.__entries, "source hashes": self.__source_hashes}, file, indent=4)
+
+
+# Copies texture files in a bounded thread pool and collects errors instead of raising them.
+# In incremental mode, textures already up to date in the destination folder are skipped.
+# Textures to be downscaled or converted are processed from their RGBA8 pixels in a process pool, and the results are
+# cached in the destination folder by the source hash and the settings.
+class TextureCopier:
+    def __init__(
+        self,
+        folder_path: str,
+        incremental: bool = False,
+        hard_link: bool = False,
+        max_workers: int = 8,
+        process_settings: Optional[tpr.ProcessSettings] = None,
+        max_processes: int = 0,
+    ):
+        self.__folder_path = str(folder_path)
+        self.__incremental = bool(incremental)
+        self.__hard_link = bool(hard_link)
+        self.__process_settings = process_settings
+        self.__max_processes = int(max_processes) if max_processes > 0 else (os.cpu_count() or 1)
+
+        if incremental or (process_settings is not None and process_settings.is_enabled):
+            self.__manifest = TextureManifest(folder_path)
+        else:
+            self.__manifest = None
+
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.__process_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self.__futures: List[concurrent.futures.Future] = []
+        self.__process_futures: List[Tuple[concurrent.futures.Future, str, str]] = []
+        self.__errors: List[str] = []
+        self.__is_shut_down = False
+
+        self.__lock = threading.Lock()
+        self.__copied_count = 0
+        self.__linked_count = 0
+        self.__processed_count = 0
+        self.__skipped_count = 0
+
+    def copy_file(self, src_path: str, name: str):
+        self.__futures.append(self.__executor.submit(self.__timed, self.__copy_file, src_path, name))
+
+    # The data is written in the background, so it must not be a view of Blender memory
+    def write_data(self, data: bytes, name: str):
+        self.__futures.append(self.__executor.submit(self.__timed, self.__write_data, bytes(data), name))
+
+    def submit(self, source: TextureSource):
+        if source.data is not None:
+            self.write_data(source.data, source.name)
+        else:
+            self.copy_file(source.src_path, source.name)
+
+    def add_error(self, message: str):
+        self.__errors.append(str(message))
+
+    # See `hash_source`. Hashes are cached in the manifest if the copier keeps one.
+    def hash_source(self, source: TextureSource) -> str:
+        return hash_source(source, self.__manifest)
+
+    def is_processed_up_to_date(self, output_name: str, cache_key: str) -> bool:
+        entry = self.__manifest.get(output_name)
+        if entry is None or entry.get("cache key") != cache_key:
+            return False
+        if not os.path.isfile(os.path.join(self.__folder_path, output_name)):
+            return False
+
+        with self.__lock:
+            self.__skipped_count += 1
+        return True
+
+    # RGBA8 from `tpr.to_rgba8`. See `tpr.process_texture`.
+    def process_rgba8(self, data: bytes, width: int, height: int, is_srgb: bool, output_name: str, cache_key: str):
+        if self.__process_executor is None:
+            self.__process_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.__max_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        future = self.__process_executor.submit(
+            tpr.process_texture, data, width, height, is_srgb, self.__process_settings
+        )
+        self.__process_futures.append((future, output_name, cache_key))
+
+    # Waits for every submitted copy and returns error messages of all failed ones. The executors are shut down even
+    # if waiting is interrupted.
+    def join(self) -> List[str]:
+        try:
+            for future, output_name, cache_key in self.__process_futures:
+                try:
+                    data = future.result()
+                    with tmg.span("texture write", output_name):
+                        self.__write_processed(data, output_name, cache_key)
+                except Exception as e:
+                    self.__errors.append(f"Failed to process texture '{output_name}': {e}")
+
+            for future in self.__futures:
+                try:
+                    future.result()
+                except OSError as e:
+                    self.__errors.append(str(e))
+        except BaseException:
+            self.cancel()
+            raise
+
+        self.__shut_down()
+        return self.__errors
+
+    # Drops copies not started yet and waits for running ones, so that no texture is left half written. Finished
+    # copies stay and are kept in the manifest. Does nothing after `join` or another `cancel`.
+    def cancel(self):
+        for future in self.__futures:
+            future.cancel()
+        for future, _, _ in self.__process_futures:
+            future.cancel()
+
+        self.__shut_down()
+
+    @property
+    def copied_count(self):
+        return self.__copied_count
+
+    @property
+    def linked_count(self):
+        return self.__linked_count
+
+    @property
+    def processed_count(self):
+        return self.__processed_count
+
+    @property
+    def skipped_count(self):
+        return self.__skipped_count
+
+    def __shut_down(self):
+        if self.__is_shut_down:
+            return
+        self.__is_shut_down = True
+
+        self.__executor.shutdown()
+        if self.__process_executor is not None:
+            self.__process_executor.shutdown()
+        self.__futures.clear()
+        self.__process_futures.clear()
+
+        if self.__manifest is not None:
+            try:
+                self.__manifest.save()
+            except OSError as e:
+                self.__errors.append(f"Failed to save texture manifest: {e}")
+
+    def __write_processed(self, data: bytes, output_name: str, cache_key: str):
+        dst_path = os.path.join(self.__folder_path, output_name)
+        remove_existing_file(dst_path)
+        with open(dst_path, "wb") as file:
+            file.write(data)
+
+        with self.__lock:
+            self.__processed_count += 1
+        self.__manifest.set(output_name, "", len(data), 0.0, None, cache_key)
+        tmg.count("texture bytes", len(data))
+
+    def __copy_file(self, src_path: str, name: str):
+        if not os.path.isfile(src_path):
+            raise FileNotFoundError("Image not found: {}".format(src_path))
+
+        dst_path = os.path.join(self.__folder_path, name)
+        src_stat = os.stat(src_path)
+
+        if self.__incremental and self.__is_up_to_date(src_path, src_stat, name, dst_path):
+            with self.__lock:
+                self.__skipped_count += 1
+            return
+
+        if self.__hard_link and self.__try_hard_link(src_path, src_stat, dst_path):
+            content_hash = None
+            with self.__lock:
+                self.__linked_count += 1
+        else:
+            content_hash = copy_and_hash_file(src_path, dst_path)
+            with self.__lock:
+                self.__copied_count += 1
+        tmg.count("texture bytes", src_stat.st_size)
+
+        if self.__manifest is not None:
+            self.__manifest.set(name, src_path, src_stat.st_size, src_stat.st_mtime, content_hash)
+            if content_hash is not None:
+                self.__manifest.set_source_hash(src_path, src_stat.st_size, src_stat.st_mtime, content_hash)
+
+    def __write_data(self, data: bytes, name: str):
+        dst_path = os.path.join(self.__folder_path, name)
+        content_hash = hash_bytes(data) if self.__incremental else None
+
+        if self.__incremental:
+            entry = self.__manifest.get(name)
+            if entry is not None and entry["hash"] == content_hash and self.__get_file_size(dst_path) == len(data):
+                with self.__lock:
+                    self.__skipped_count += 1
+                return
+
+        remove_existing_file(dst_path)
+        with open(dst_path, "wb") as file:
+            file.write(data)
+        with self.__lock:
+            self.__copied_count += 1
+        tmg.count("texture bytes", len(data))
+
+        if self.__manifest is not None:
+            self.__manifest.set(name, "", len(data), 0.0, content_hash)
+
+    # Runs on the worker threads, whose spans are children of the root span
+    @staticmethod
+    def __timed(function, src, name: str):
+        with tmg.span("texture write", name):
+            function(src, name)
+
+    @staticmethod
+    def __get_file_size(path: str) -> Optional[int]:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    # Size and mtime are checked first, and the content hash is compared only if they differ
+    def __is_up_to_date(self, src_path: str, src_stat: os.stat_result, name: str, dst_path: str) -> bool:
+        entry = self.__manifest.get(name)
+        if entry is None:
+            return False
+
+        if self.__get_file_size(dst_path) != src_stat.st_size or entry["size"] != src_stat.st_size:
+            return False
+
+        if entry["source"] == src_path and entry["mtime"] == src_stat.st_mtime:
+            return True
+
+        if entry["hash"] is None:
+            return False
+        content_hash = self.__manifest.get_source_hash(src_path, src_stat.st_size, src_stat.st_mtime)
+        if content_hash is None:
+            content_hash = hash_file(src_path)
+            self.__manifest.set_source_hash(src_path, src_stat.st_size, src_stat.st_mtime, content_hash)
+        if entry["hash"] != content_hash:
+            return False
+
+        self.__manifest.set(name, src_path, src_stat.st_size, src_stat.st_mtime, entry["hash"])
+        return True
+
+    def __try_hard_link(self, src_path: str, src_stat: os.stat_result, dst_path: str) -> bool:
+        if src_stat.st_dev != os.stat(self.__folder_path).st_dev:
+            return False
+
+        try:
+            remove_existing_file(dst_path)
+            os.link(src_path, dst_path)
+        except OSError:
+            return False
+        else:
+            return True
@@ -0,0 +1,251 @@
+import enum
+import zlib
+import array
+import struct
+from typing import List, Tuple
+
+
+class TextureFormat(enum.Enum):
+    # Textures that need no downscaling are copied as they are, and downscaled ones are written as PNG
+    original = "ORIGINAL"
+    png = "PNG"
+    # Raw RGBA8 mip chain container. See `encode_dtex`
+    dtex = "DTEX"
+
+
+class ProcessSettings:
+    def __init__(self, max_dimension: int = 0, texture_format: TextureFormat = TextureFormat.original):
+        assert isinstance(texture_format, TextureFormat)
+        self.__max_dimension = int(max_dimension)
+        self.__format = texture_format
+
+    # 0 means no limit
+    @property
+    def max_dimension(self):
+        return self.__max_dimension
+
+    @property
+    def format(self):
+        return self.__format
+
+    @property
+    def is_enabled(self):
+        return self.max_dimension > 0 or TextureFormat.original != self.format
+
+    def needs_processing(self, name: str, width: int, height: int) -> bool:
+        if TextureFormat.dtex == self.format:
+            return True
+        if self.max_dimension > 0 and max(width, height) > self.max_dimension:
+            return True
+        if TextureFormat.png == self.format and not name.lower().endswith(".png"):
+            return True
+        return False
+
+    def get_output_name(self, name: str) -> str:
+        if TextureFormat.dtex == self.format:
+            return name + ".dtex"
+        elif name.lower().endswith(".png"):
+            return name
+        else:
+            return name + ".png"
+
+    # Processed textures are cached by the source contents and every setting affecting the result
+    def make_cache_key(self, source_hash: str) -> str:
+        return f"{source_hash}:{self.max_dimension}:{self.format.value}:2"
+
+
+# Blender bundles numpy, which the conversions below use to work on whole images at once. Without it, as in a plain
+# interpreter, they fall back to pure Python, which is orders of magnitude slower.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def srgb_to_linear(value: float) -> float:
+    if value <= 0.04045:
+        return value / 12.92
+    return ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value: float) -> float:
+    if value <= 0.0031308:
+        return max(0.0, value) * 12.92
+    return 1.055 * value ** (1.0 / 2.4) - 0.055
+
+
+# Byte of an sRGB encoded value -> linear value
+_SRGB_TO_LINEAR = [srgb_to_linear(x / 255.0) for x in range(256)]
+
+
+def _quantize(value: float) -> int:
+    return min(255, max(0, int(value * 255.0 + 0.5)))
+
+
+def _linear_to_srgb_array(values):
+    values = numpy.maximum(values, 0.0)
+    return numpy.where(values <= 0.0031308, values * 12.92, 1.055 * numpy.power(values, 1.0 / 2.4) - 0.055)
+
+
+def _quantize_array(values) -> bytes:
+    return (numpy.clip(values, 0.0, 1.0) * 255.0 + 0.5).astype(numpy.uint8).tobytes()
+
+
+# Float buffer of `size` values for `bpy.types.Image.pixels.foreach_get`
+def make_pixel_buffer(size: int):
+    if numpy is not None:
+        return numpy.empty(size, dtype=numpy.float32)
+    return array.array("f", bytes(4 * size))
+
+
+# Pixels are floats in Blender's order, which starts from the bottom row. Output rows start from the top.
+# Values are clamped to [0, 1], so HDR values over 1 are clipped rather than tone mapped. If `encode_srgb` is set, color
+# channels are linear values, like those of float images, and are encoded to sRGB.
+def to_rgba8(pixels, width: int, height: int, channels: int, encode_srgb: bool = False) -> bytes:
+    if numpy is not None:
+        src = numpy.asarray(pixels, dtype=numpy.float32).reshape(height, width, channels)[::-1]
+        output = numpy.empty((height, width, 4), dtype=numpy.float32)
+        output[..., :3] = src[..., :3] if channels >= 3 else src[..., :1]
+        if channels >= 4:
+            output[..., 3] = src[..., 3]
+        elif 2 == channels:
+            output[..., 3] = src[..., 1]
+        else:
+            output[..., 3] = 1.0
+        if encode_srgb:
+            output[..., :3] = _linear_to_srgb_array(output[..., :3])
+        return _quantize_array(output)
+
+    # Each channel is quantized on its own with strided slices, then interleaved and flipped with slices too
+    planes = []
+    for c in range(channels):
+        is_color = c < 3 if channels >= 3 else 0 == c
+        if encode_srgb and is_color:
+            planes.append(bytes(_quantize(linear_to_srgb(x)) for x in pixels[c::channels]))
+        else:
+            planes.append(bytes(_quantize(x) for x in pixels[c::channels]))
+
+    interleaved = bytearray(width * height * 4)
+    for c in range(3):
+        interleaved[c::4] = planes[c] if channels >= 3 else planes[0]
+    if channels >= 4:
+        interleaved[3::4] = planes[3]
+    elif 2 == channels:
+        interleaved[3::4] = planes[1]
+    else:
+        interleaved[3::4] = b"\xff" * (width * height)
+
+    stride = width * 4
+    return b"".join(interleaved[y * stride:(y + 1) * stride] for y in reversed(range(height)))
+
+
+# Box filter of 2x2 pixels. If `is_srgb` is set, color channels are sRGB encoded and are averaged in linear space, so
+# that downscaled textures do not get darker. Otherwise, like for normal maps, they are averaged as they are. Alpha is
+# always averaged as it is.
+def halve_rgba8(data: bytes, width: int, height: int, is_srgb: bool = True) -> Tuple[bytes, int, int]:
+    new_width = max(1, width // 2)
+    new_height = max(1, height // 2)
+
+    if numpy is not None:
+        src = numpy.frombuffer(data, dtype=numpy.uint8).reshape(height, width, 4)
+        rows = numpy.arange(new_height) * 2
+        cols = numpy.arange(new_width) * 2
+        rows0, rows1 = numpy.minimum(rows, height - 1), numpy.minimum(rows + 1, height - 1)
+        cols0, cols1 = numpy.minimum(cols, width - 1), numpy.minimum(cols + 1, width - 1)
+        quad = [src[rows0][:, cols0], src[rows0][:, cols1], src[rows1][:, cols0], src[rows1][:, cols1]]
+
+        sums = sum(x.astype(numpy.uint32) for x in quad)
+        output = ((sums + 2) >> 2).astype(numpy.uint8)
+        if is_srgb:
+            to_linear = numpy.array(_SRGB_TO_LINEAR, dtype=numpy.float32)
+            linear = sum(to_linear[x[..., :3]] for x in quad) * 0.25
+            output[..., :3] = numpy.frombuffer(_quantize_array(_linear_to_srgb_array(linear)), dtype=numpy.uint8) \
+                .reshape(new_height, new_width, 3)
+        return output.tobytes(), new_width, new_height
+
+    output = bytearray(new_width * new_height * 4)
+    for y in range(new_height):
+        row0 = min(2 * y, height - 1) * width * 4
+        row1 = min(2 * y + 1, height - 1) * width * 4
+        for x in range(new_width):
+            col0 = min(2 * x, width - 1) * 4
+            col1 = min(2 * x + 1, width - 1) * 4
+            dst = (y * new_width + x) * 4
+            for c in range(4):
+                a, b = data[row0 + col0 + c], data[row0 + col1 + c]
+                d, e = data[row1 + col0 + c], data[row1 + col1 + c]
+                if is_srgb and c < 3:
+                    linear = (_SRGB_TO_LINEAR[a] + _SRGB_TO_LINEAR[b] + _SRGB_TO_LINEAR[d] + _SRGB_TO_LINEAR[e]) * 0.25
+                    output[dst + c] = _quantize(linear_to_srgb(linear))
+                else:
+                    output[dst + c] = (a + b + d + e + 2) >> 2
+
+    return bytes(output), new_width, new_height
+
+
+def encode_png(data: bytes, width: int, height: int) -> bytes:
+    def make_chunk(chunk_type: bytes, chunk_data: bytes):
+        crc = zlib.crc32(chunk_type + chunk_data) & 0xFFFFFFFF
+        return struct.pack(">I", len(chunk_data)) + chunk_type + chunk_data + struct.pack(">I", crc)
+
+    stride = width * 4
+    raw = bytearray()
+    for y in range(height):
+        raw += b"\x00"
+        raw += data[y * stride:(y + 1) * stride]
+
+    return (
+        b"\x89PNG\r\n\x1a\n" +
+        make_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)) +
+        make_chunk(b"IDAT", zlib.compress(bytes(raw), 9)) +
+        make_chunk(b"IEND", b"")
+    )
+
+
+# All integers are little endian uint32.
+#
+#   4 bytes "DTEX"
+#   version = 1
+#   channel count = 4
+#   mip count
+#   For each mip level from the largest one
+#       width
+#       height
+#       offset of pixels from the beginning of the file
+#       size of pixels
+#   Pixels of every mip level in RGBA8, rows starting from the top
+def encode_dtex(mips: List[Tuple[bytes, int, int]]) -> bytes:
+    header_size = 16 + 16 * len(mips)
+
+    header = bytearray(b"DTEX")
+    header += struct.pack("<III", 1, 4, len(mips))
+
+    offset = header_size
+    for data, width, height in mips:
+        header += struct.pack("<IIII", width, height, offset, len(data))
+        offset += len(data)
+
+    return bytes(header) + b"".join(data for data, width, height in mips)
+
+
+# Runs in worker processes. `data` is RGBA8 from `to_rgba8`, which is a quarter of the size of the float pixels to be
+# sent to the worker. See `halve_rgba8` for `is_srgb`.
+def process_texture(
+    data: bytes,
+    width: int,
+    height: int,
+    is_srgb: bool,
+    settings: ProcessSettings,
+) -> bytes:
+    if settings.max_dimension > 0:
+        while max(width, height) > settings.max_dimension:
+            data, width, height = halve_rgba8(data, width, height, is_srgb)
+
+    if TextureFormat.dtex == settings.format:
+        mips = [(data, width, height)]
+        while width > 1 or height > 1:
+            data, width, height = halve_rgba8(data, width, height, is_srgb)
+            mips.append((data, width, height))
+        return encode_dtex(mips)
+    else:
+        return encode_png(data, width, height)
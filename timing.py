@@ -0,0 +1,166 @@
+import json
+import time
+import contextlib
+import threading
+from typing import Dict, List, Optional
+
+
+# Nestable timed spans and counters of an export, written as `_timings.json` next to the exported file.
+# Instrumented code calls the module level `span` and `count`, which record into the active `Timings` if any and do
+# nothing otherwise, so the parsing and encoding functions need no extra arguments.
+# Spans nest per thread. Spans started on a thread without an open span are children of the root.
+# This module does not import bpy.
+
+
+class _Span:
+    __slots__ = ("name", "label", "seconds", "counters", "children")
+
+    def __init__(self, name: str, label: str):
+        self.name = name
+        self.label = label
+        self.seconds = 0.0
+        self.counters: Dict[str, float] = {}
+        self.children: List[_Span] = []
+
+    def make_json(self) -> Dict:
+        output = {"name": self.name}
+        if self.label:
+            output["label"] = self.label
+        output["seconds"] = self.seconds
+        if self.counters:
+            output["counters"] = self.counters
+        if self.children:
+            output["children"] = [x.make_json() for x in self.children]
+        return output
+
+
+class _SpanContext:
+    __slots__ = ("__timings", "__span", "__start")
+
+    def __init__(self, timings: "Timings", span: _Span):
+        self.__timings = timings
+        self.__span = span
+        self.__start = 0.0
+
+    def __enter__(self):
+        self.__timings._push(self.__span)
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.__span.seconds = time.perf_counter() - self.__start
+        self.__timings._pop()
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class Timings:
+    def __init__(self, name: str = "export"):
+        self.__root = _Span(name, "")
+        self.__totals: Dict[str, float] = {}
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__start = time.perf_counter()
+
+    def span(self, name: str, label: str = "") -> _SpanContext:
+        return _SpanContext(self, _Span(name, str(label)))
+
+    # Added to the innermost open span of the calling thread and to the totals
+    def count(self, name: str, amount: float = 1):
+        span = self.__get_stack()[-1]
+        with self.__lock:
+            span.counters[name] = span.counters.get(name, 0) + amount
+            self.__totals[name] = self.__totals.get(name, 0) + amount
+
+    def make_json(self) -> Dict:
+        with self.__lock:
+            self.__root.seconds = time.perf_counter() - self.__start
+            return {
+                "total seconds": self.__root.seconds,
+                "counters": dict(self.__totals),
+                "stages": self.__make_stage_summary(),
+                "spans": self.__root.make_json(),
+            }
+
+    # Label -> sum of seconds and counters of the spans with the name
+    def summarize_by_label(self, name: str) -> Dict[str, Dict]:
+        output = {}
+        with self.__lock:
+            pending = list(self.__root.children)
+            while pending:
+                span = pending.pop()
+                pending.extend(span.children)
+                if span.name != name:
+                    continue
+
+                summary = output.setdefault(span.label, {"seconds": 0.0, "counters": {}})
+                summary["seconds"] += span.seconds
+                for key, value in span.counters.items():
+                    summary["counters"][key] = summary["counters"].get(key, 0) + value
+        return output
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf8") as file:
+            json.dump(self.make_json(), file, indent=4)
+
+    def _push(self, span: _Span):
+        stack = self.__get_stack()
+        with self.__lock:
+            stack[-1].children.append(span)
+        stack.append(span)
+
+    def _pop(self):
+        self.__get_stack().pop()
+
+    def __get_stack(self) -> List[_Span]:
+        try:
+            return self.__local.stack
+        except AttributeError:
+            self.__local.stack = [self.__root]
+            return self.__local.stack
+
+    # Span name -> number of spans and sum of their seconds, for comparing exports without walking the tree
+    def __make_stage_summary(self) -> Dict[str, Dict]:
+        output = {}
+        pending = list(self.__root.children)
+        while pending:
+            span = pending.pop()
+            stage = output.setdefault(span.name, {"count": 0, "seconds": 0.0})
+            stage["count"] += 1
+            stage["seconds"] += span.seconds
+            pending.extend(span.children)
+        return dict(sorted(output.items()))
+
+
+_active: Optional[Timings] = None
+
+
+@contextlib.contextmanager
+def activate(timings: Timings):
+    global _active
+    previous = _active
+    _active = timings
+    try:
+        yield timings
+    finally:
+        _active = previous
+
+
+def span(name: str, label: str = ""):
+    if _active is None:
+        return _NULL_CONTEXT
+    return _active.span(name, label)
+
+
+def count(name: str, amount: float = 1):
+    if _active is not None:
+        _active.count(name, amount)